@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+
+## อุปกรณ์ตัวอย่าง: (asset_name, install_location, device_id)
+DEVICES = [
+    ("Before Scrub", "Room", "bench-before-01"),
+    ("After Scrub", "Room", "bench-after-01"),
+    ("Interlock 4C", "Inlet", "bench-interlock-01"),
+]
+
+## ชื่อ field ใน Content ของอุปกรณ์ Inlet (นอกจาก sensor พื้นฐาน): (ชื่อ, ค่าต่ำสุด, ค่าสูงสุด, เป็นจำนวนเต็ม)
+INLET_FIELDS = [
+    ("Diff pressure", 0, 12, False),
+    ("Fan speed", 0, 100, True),
+    ("Temp before filter", 18, 35, False),
+    ("Clean air damper open alarm", 0, 1, True),
+    ("CO2 level enable scrub mode", 400, 1200, True),
+    ("CO2 level scrub mode", 400, 1200, True),
+    ("Exhaust air damper open alarm", 0, 1, True),
+    ("Fan alarm", 0, 1, True),
+    ("Fire alarm", 0, 1, True),
+    ("High temperature alarm", 0, 1, True),
+    ("HLR connect status", 0, 1, True),
+    ("HLR operation mode", 0, 5, True),
+    ("Interlock status", 0, 1, True),
+    ("KM1 no feedback alarm", 0, 1, True),
+    ("Service door alarm", 0, 1, True),
+    ("Switch CO2 state", 0, 1, True),
+    ("Switch interlock state", 0, 1, True),
+]
+
+BASE_FIELDS = [
+    ("CO2", 380, 1500, False),
+    ("Temperature", 18, 34, False),
+    ("Humidity", 30, 80, False),
+    ("VOC", 0, 10, True),
+    ("RSSI", -95, -40, True),
+    ("Voltage", 3.0, 3.6, False),
+    ("Version number", 1, 3, True),
+]
+
+
+def _field(rng, name, lo, hi, integer, n):
+    if integer:
+        values = rng.integers(lo, hi + 1, size=n).astype(str)
+    else:
+        values = np.round(rng.uniform(lo, hi, size=n), 1).astype(str)
+    return np.char.add(name + ":", values).astype(object)
+
+
+def make_export(n, asset_name, install_location, device_id, project="bench",
+                start="2025-01-01", seed=0, fullwidth_ratio=0.02):
+    # หนึ่งไฟล์ export ของอุปกรณ์เดียว ทุก 1 นาที ในรูปแบบเดียวกับไฟล์จริง (คอลัมน์ Content)
+    rng = np.random.default_rng(seed)
+    report_time = pd.date_range(start, periods=n, freq="1min")
+    fields = BASE_FIELDS + (INLET_FIELDS if install_location == "Inlet" else [])
+
+    content = report_time.strftime("%H:%M").to_numpy(dtype=object)
+    for name, lo, hi, integer in fields:
+        content = content + ";" + _field(rng, name, lo, hi, integer, n)
+    # บางแถวใช้ตัวคั่นแบบ full-width เหมือนไฟล์จริงจากบางอุปกรณ์
+    odd = rng.random(n) < fullwidth_ratio
+    if odd.any():
+        content[odd] = pd.Series(content[odd]).str.replace(";", "，").str.replace(":", "：", n=1).to_numpy()
+
+    return pd.DataFrame({
+        "Data type": "Sensor",
+        "Asset number": f"{device_id}-A",
+        "Asset name": asset_name,
+        "System": "HLR",
+        "Install location": install_location,
+        "Device type": "IAQ",
+        "Device id": device_id,
+        "Project": project,
+        "Report time": report_time.strftime("%Y-%m-%d %H:%M:%S"),
+        "Content": content,
+    })
+
+
+def iter_exports(total_rows, chunk_rows=20000, devices=DEVICES, project="bench", seed=0):
+    # แบ่ง total_rows ให้แต่ละอุปกรณ์เท่าๆ กัน แล้ว yield ทีละ chunk: (device, df)
+    per_device = total_rows // len(devices)
+    for d, (asset_name, install_location, device_id) in enumerate(devices):
+        start = pd.Timestamp("2025-01-01")
+        for offset in range(0, per_device, chunk_rows):
+            n = min(chunk_rows, per_device - offset)
+            yield (asset_name, install_location, device_id), make_export(
+                n, asset_name, install_location, device_id, project=project,
+                start=start + pd.Timedelta(minutes=offset), seed=seed * 1000 + d * 100 + offset // chunk_rows,
+            )
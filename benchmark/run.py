@@ -0,0 +1,325 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+## python -m benchmark.run --rows 10000 100000 --out bench_results.json [--compare old.json] [--file-format xlsx]
+DEFAULT_ROWS = [10000, 100000]
+FILE_FORMATS = ("csv", "xlsx")
+QUERY_REPEAT = 30
+
+
+## แถวข้อมูลสูงสุดของ xlsx (1,048,576 แถวรวม header)
+EXCEL_MAX_ROWS = 1048575
+
+
+def reset_peak_rss():
+    # Linux: เขียน "5" ลง clear_refs = รีเซ็ต VmHWM (peak RSS) ให้เริ่มนับใหม่จาก RSS ปัจจุบัน
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        return False
+    return True
+
+
+def peak_rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return None
+
+
+class StageMemory:
+    # peak memory ต่อ stage: Linux ใช้ VmHWM ที่รีเซ็ตได้ (RSS จริง, ไม่มี overhead)
+    # ที่อื่น (ไม่มี clear_refs) ใช้ tracemalloc = นับเฉพาะหน่วยความจำที่ Python/numpy จอง
+    def __init__(self):
+        self.peaks = {}
+        self.source = "rss" if reset_peak_rss() else "tracemalloc"
+        if self.source == "tracemalloc":
+            tracemalloc.start()
+
+    def reset(self):
+        if self.source == "rss":
+            reset_peak_rss()
+        else:
+            tracemalloc.reset_peak()
+
+    def record(self, name):
+        # peak ตั้งแต่ reset ครั้งก่อนถึงตอนนี้ = ของ stage ที่เพิ่งจบ แล้วเริ่มนับ stage ถัดไป
+        peak = peak_rss_mb() if self.source == "rss" else tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        self.peaks[name] = max(self.peaks.get(name, 0.0), peak)
+        self.reset()
+
+    def close(self):
+        if self.source == "tracemalloc":
+            tracemalloc.stop()
+
+
+class StageSeconds(dict):
+    # dict เวลาต่อ stage ที่ส่งให้ add_stage_time: ทุกครั้งที่ stage จบ (ถูกเขียนเวลา) บันทึก peak memory ของ stage นั้น
+    def __init__(self, memory):
+        super().__init__()
+        self.memory = memory
+
+    def __setitem__(self, name, seconds):
+        super().__setitem__(name, seconds)
+        self.memory.record(name)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def percentiles(samples):
+    ms = np.array(samples) * 1000
+    return {
+        "n": len(ms),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p90_ms": float(np.percentile(ms, 90)),
+        "p99_ms": float(np.percentile(ms, 99)),
+    }
+
+
+class StageTimer:
+    def __init__(self):
+        self.seconds = {}
+        self.rows = {}
+
+    @contextlib.contextmanager
+    def time(self, name, rows):
+        t0 = time.perf_counter()
+        yield
+        self.seconds[name] = self.seconds.get(name, 0.0) + (time.perf_counter() - t0)
+        self.rows[name] = self.rows.get(name, 0) + rows
+
+    def report(self):
+        return {
+            name: {
+                "seconds": secs,
+                "rows": self.rows[name],
+                "rows_per_s": self.rows[name] / secs if secs else None,
+            }
+            for name, secs in self.seconds.items()
+        }
+
+
+def write_export(total_rows, chunk_rows, path):
+    # ไฟล์ export สังเคราะห์ของทุกอุปกรณ์ (csv/xlsx) ให้ ingest อ่านแบบเดียวกับไฟล์ upload
+    # เขียนทีละ chunk (csv ต่อท้าย / xlsx แบบ write-only) ไม่ต้องรวมทั้งไฟล์ไว้ในหน่วยความจำ
+    from benchmark.generator import iter_exports
+
+    if path.endswith(".xlsx"):
+        from openpyxl import Workbook
+
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet("Sheet1")
+        for i, (_, df) in enumerate(iter_exports(total_rows, chunk_rows)):
+            if i == 0:
+                ws.append(list(df.columns))
+            for row in df.itertuples(index=False, name=None):
+                ws.append(row)
+        wb.save(path)
+    else:
+        for i, (_, df) in enumerate(iter_exports(total_rows, chunk_rows)):
+            df.to_csv(path, index=False, mode="w" if i == 0 else "a", header=i == 0)
+
+
+def bench_ingest(export_path, chunk_rows, db_path, memory):
+    # จับเวลาแต่ละ stage ของ pipeline บนไฟล์สังเคราะห์ทีละ chunk
+    # read = iter_file_chunks, parse = cleaning_data, merge = merged_function + map คอลัมน์, reshape = extract_columns
+    from controller.db import connection
+    from controller.ingest import add_stage_time, iter_file_chunks, prepare_insert_frame, write_frame
+
+    timer = StageTimer()
+    stages = StageSeconds(memory)
+    source_rows = 0
+    with connection(db_path) as conn, open(export_path, "rb") as f:
+        reader = iter_file_chunks(f, export_path, chunk_rows)
+        memory.reset()
+        while True:
+            t0 = time.perf_counter()
+            df_full = next(reader, None)
+            add_stage_time(stages, "read", t0)
+            if df_full is None:
+                break
+            source_rows += len(df_full)
+
+            df_insert, _ = prepare_insert_frame(df_full, stages)
+
+            with timer.time("insert", len(df_insert)):
+                write_frame(conn, df_insert)
+                conn.commit()
+            memory.record("insert")
+
+    report = {
+        name: {"seconds": secs, "rows": source_rows, "rows_per_s": source_rows / secs if secs else None}
+        for name, secs in stages.items()
+    }
+    report.update(timer.report())
+    for name, stage in report.items():
+        stage["peak_mb"] = memory.peaks.get(name)
+    return {"source_rows": source_rows, "stages": report}
+
+
+def bench_queries(app, repeat=QUERY_REPEAT, seed=0):
+    # latency ของแต่ละ GET route ผ่าน Flask test client (ไม่รวม network)
+    from benchmark.generator import DEVICES
+    from controller.db import GET_RANGE_COLUMNS
+
+    client = app.test_client()
+    rng = np.random.default_rng(seed)
+    rows = client.get("/backend_c/get?project=bench&start=0&end=9999999999999&limit=1").get_json()["rows"]
+    if not rows:
+        return {}
+    t_min = rows[0][GET_RANGE_COLUMNS.index("timestamp")]
+    t_max = t_min + 7 * 24 * 3600 * 1000
+
+    def window():
+        span = int(rng.integers(3600, 24 * 3600)) * 1000
+        start = int(rng.integers(t_min, max(t_min + 1, t_max - span)))
+        return start, start + span
+
+    routes = {
+        "get_json": lambda s, e: f"/backend_c/get?project=bench&start={s}&end={e}",
+        "get_columnar": lambda s, e: f"/backend_c/get?project=bench&start={s}&end={e}&format=columnar",
+        "get_ndjson": lambda s, e: f"/backend_c/get?project=bench&start={s}&end={e}&format=ndjson",
+        "get_page": lambda s, e: f"/backend_c/get?project=bench&start={s}&end={e}&limit=1000",
+        "get_param": lambda s, e: "/backend_c/get/param",
+        "get_downsample": lambda s, e: (
+            f"/backend_c/get/downsample?project=bench&start={s}&end={e}"
+            f"&sensor_type=co2&asset_name={DEVICES[0][0]}&points=500"
+        ),
+        "get_compare_co2": lambda s, e: (
+            f"/backend_c/get/compare/co2?project=bench&start={s}&end={e}"
+            f"&before_asset={DEVICES[0][0]}&after_asset={DEVICES[1][0]}&interlock_asset={DEVICES[2][0]}"
+        ),
+    }
+    results = {}
+    for name, url in routes.items():
+        samples = []
+        for _ in range(repeat):
+            s, e = window()
+            t0 = time.perf_counter()
+            resp = client.get(url(s, e))
+            resp.get_data()
+            samples.append(time.perf_counter() - t0)
+            if resp.status_code != 200:
+                raise RuntimeError(f"{name}: HTTP {resp.status_code} {resp.get_data(as_text=True)[:200]}")
+        results[name] = percentiles(samples)
+    return results
+
+
+def compare(current, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    base_runs = {r["rows"]: r for r in baseline["runs"]}
+    for run in current["runs"]:
+        base = base_runs.get(run["rows"])
+        if base is None:
+            continue
+        print(f"rows={run['rows']} vs {baseline.get('commit')}")
+        for name, stage in run["stages"].items():
+            old = base["stages"].get(name)
+            if old and old["seconds"]:
+                print(f"    {name:<16} {stage['seconds']:8.3f}s  x{stage['seconds'] / old['seconds']:.2f}")
+        for name, q in run["queries"].items():
+            old = base["queries"].get(name)
+            if old and old["p50_ms"]:
+                print(f"    {name:<16} p50 {q['p50_ms']:8.2f}ms  x{q['p50_ms'] / old['p50_ms']:.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ingestion and query benchmarks")
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS,
+                        help="source rows per run (แบ่งให้ 3 อุปกรณ์)")
+    parser.add_argument("--chunk-rows", type=int, default=20000)
+    parser.add_argument("--file-format", choices=FILE_FORMATS, default="csv",
+                        help="รูปแบบไฟล์ export ที่ใช้วัดขั้น read")
+    parser.add_argument("--repeat", type=int, default=QUERY_REPEAT)
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--compare", help="ผลเดิม (JSON) ที่จะเทียบ")
+    args = parser.parse_args(argv)
+    if args.file_format == "xlsx" and max(args.rows) > EXCEL_MAX_ROWS:
+        parser.error(f"xlsx holds at most {EXCEL_MAX_ROWS} rows; use --file-format csv")
+
+    runs = []
+    for total_rows in args.rows:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "bench.db")
+            # DB_PATH / ขนาด cache ถูกอ่านตอน import -> ต้องตั้งก่อน import main/controller
+            # ปิด response cache: query ซ้ำช่วงเดิมต้องวัดการอ่าน DB จริง ไม่ใช่ cache hit
+            os.environ["SENSOR_DB_PATH"] = db_path
+            os.environ["RESPONSE_CACHE_BYTES"] = "0"
+            for name in [m for m in sys.modules if m == "main" or m.startswith("controller")]:
+                del sys.modules[name]
+            with contextlib.redirect_stdout(io.StringIO()):
+                import main as app_main
+
+            export_path = os.path.join(tmp, f"bench.{args.file_format}")
+            memory = StageMemory()
+            print(f"rows={total_rows}: generate")
+            t0 = time.perf_counter()
+            write_export(total_rows, args.chunk_rows, export_path)
+            generate_seconds = time.perf_counter() - t0
+            memory.record("generate")
+            print(f"rows={total_rows}: ingest")
+            ingest_result = bench_ingest(export_path, args.chunk_rows, db_path, memory)
+            print(f"rows={total_rows}: queries")
+            queries = bench_queries(app_main.app, args.repeat)
+            memory.record("queries")
+            memory.close()
+            runs.append({
+                "rows": total_rows,
+                "file_format": args.file_format,
+                "file_bytes": os.path.getsize(export_path),
+                "generate_seconds": generate_seconds,
+                "db_bytes": os.path.getsize(db_path),
+                **ingest_result,
+                "queries": queries,
+                "memory_source": memory.source,
+                "generate_peak_mb": memory.peaks["generate"],
+                "queries_peak_mb": memory.peaks["queries"],
+            })
+            from controller.db import get_pool
+            get_pool(db_path).close()
+
+    result = {
+        "commit": git_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": __import__("pandas").__version__,
+        "runs": runs,
+    }
+    with open(args.out, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"saved {args.out}")
+    for run in runs:
+        print(f"rows={run['rows']}")
+        for name, stage in run["stages"].items():
+            print(f"    {name:<16} {stage['seconds']:8.3f}s  {stage['rows_per_s'] or 0:12.0f} rows/s"
+                  f"  peak {stage.get('peak_mb') or 0:7.1f} MB")
+        for name, q in run["queries"].items():
+            print(f"    {name:<16} p50 {q['p50_ms']:8.2f}ms  p90 {q['p90_ms']:8.2f}ms  p99 {q['p99_ms']:8.2f}ms")
+    if args.compare:
+        compare(result, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import io
+import logging
+import time
+import zipfile
+from concurrent.futures import as_completed
+from controller import catalog, ledger, metrics
+from controller.db import DB_PATH, connection
+from controller.ingest import add_stage_time, prepare_insert_frame, read_sheets, write_frame
+from controller.jobs import get_executor
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_EXTENSIONS = (".xlsx", ".xls", ".csv")
+
+
+def expand_uploads(file_storages):
+    # แตกไฟล์ที่ upload มาเป็นหน่วยงาน (ชื่อ, bytes); zip จะถูกแตกเป็นไฟล์ข้างใน
+    units = []
+    skipped = []
+    for f in file_storages:
+        name = f.filename or ""
+        lower = name.lower()
+        if lower.endswith(".zip"):
+            with zipfile.ZipFile(f.stream) as zf:
+                for info in zf.infolist():
+                    inner = info.filename
+                    if info.is_dir() or inner.startswith("__MACOSX/"):
+                        continue
+                    if inner.lower().endswith(SUPPORTED_EXTENSIONS):
+                        units.append((f"{name}/{inner}", zf.read(info)))
+                    else:
+                        skipped.append(f"{name}/{inner}")
+        elif lower.endswith(SUPPORTED_EXTENSIONS):
+            units.append((name, f.read()))
+        else:
+            skipped.append(name)
+    return units, skipped
+
+
+def prepare_file(name, data):
+    # รันใน worker process: อ่านทุก sheet แล้ว parse/clean/reshape (CPU-bound)
+    # คืนผลต่อ sheet; การ insert ทำที่ process หลักเพียงตัวเดียว
+    sheets = []
+    stages = {}
+    t0 = time.perf_counter()
+    frames = read_sheets(io.BytesIO(data), name)
+    add_stage_time(stages, "read", t0)
+    for sheet, df_full in frames.items():
+        sheet_stages = {}
+        try:
+            df_insert, counts = prepare_insert_frame(df_full, sheet_stages)
+            sheets.append({"sheet": sheet, "source_rows": len(df_full), **counts,
+                           "stages": sheet_stages, "df_insert": df_insert, "error": None})
+        except Exception as e:
+            sheets.append({"sheet": sheet, "source_rows": len(df_full), "stages": sheet_stages,
+                           "df_insert": None, "error": f"{type(e).__name__}: {e}"})
+    return {"file": name, "stages": stages, "sheets": sheets}
+
+
+def dedup_units(conn, units, force=False):
+    # ไฟล์ที่เคย ingest แล้ว (ตาม upload_ledger) หรือซ้ำกันเองใน batch ไม่ต้องส่งเข้า worker
+    # คืน (units ที่ต้องทำ [(name, data, sha256)], รายการไฟล์ซ้ำ)
+    pending = []
+    duplicates = []
+    seen = {}
+    for name, data in units:
+        sha256 = ledger.bytes_sha256(data)
+        previous = None if force else ledger.lookup(conn, sha256)
+        if previous is None and sha256 in seen:
+            previous = {"sha256": sha256, "filename": seen[sha256]}
+        if previous is not None:
+            duplicates.append({"file": name, "duplicate_of": previous})
+            continue
+        seen[sha256] = name
+        pending.append((name, data, sha256))
+    return pending, duplicates
+
+
+def ingest_batch(file_storages, db_path=DB_PATH, force=False):
+    units, skipped = expand_uploads(file_storages)
+    with connection(db_path) as conn:
+        units, duplicates = dedup_units(conn, units, force)
+    executor = get_executor(db_path)
+    names = [name for name, _, _ in units]
+    ledger_keys = [(sha256, len(data)) for _, data, sha256 in units]
+    futures = {executor.submit(prepare_file, name, data): i for i, (name, data, _) in enumerate(units)}
+    del units
+
+    results = [None] * len(futures)
+    totals = {"files": len(futures), "sheets": 0, "source_rows": 0, "written_rows": 0, "duplicate_rows": 0}
+    # single writer: ผลจากทุก worker มา insert ที่ connection เดียว ตามลำดับที่เสร็จ
+    with connection(db_path) as conn:
+        for future in as_completed(futures):
+            idx = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.exception("batch upload %s failed", names[idx])
+                metrics.observe_ingest({"error": str(e)}, source="batch")
+                results[idx] = {"file": names[idx], "error": f"{type(e).__name__}: {e}", "sheets": []}
+                continue
+            for stage, seconds in result["stages"].items():
+                metrics.STAGE_SECONDS.observe(seconds, stage=stage)
+            for sheet in result["sheets"]:
+                df_insert = sheet.pop("df_insert")
+                if df_insert is None:
+                    metrics.observe_ingest(sheet, source="batch")
+                    continue
+                t0 = time.perf_counter()
+                written = write_frame(conn, df_insert)
+                conn.commit()
+                add_stage_time(sheet["stages"], "insert", t0)
+                if written:
+                    catalog.invalidate()
+                sheet["written_rows"] = written
+                sheet["duplicate_rows"] = len(df_insert) - written
+                totals["sheets"] += 1
+                totals["source_rows"] += sheet["source_rows"]
+                totals["written_rows"] += written
+                totals["duplicate_rows"] += sheet["duplicate_rows"]
+                metrics.observe_ingest(sheet, source="batch")
+            if not any(sheet["error"] for sheet in result["sheets"]):
+                sha256, size = ledger_keys[idx]
+                with conn:
+                    ledger.record(conn, sha256, names[idx], size, {
+                        "source_rows": sum(sheet["source_rows"] for sheet in result["sheets"]),
+                        "written_rows": sum(sheet.get("written_rows", 0) for sheet in result["sheets"]),
+                    })
+            result["error"] = None
+            results[idx] = result
+    return {**totals, "skipped_files": skipped, "duplicate_files": duplicates, "results": results}
@@ -0,0 +1,174 @@
+import gzip
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from functools import wraps
+from flask import Response, make_response, request
+from werkzeug.http import quote_etag
+from controller import metrics
+from controller.db import connection, data_version
+
+## ขนาดรวมสูงสุดของ cache (bytes ของ body + ฉบับบีบอัด) ; 0 = ปิด cache
+CACHE_MAX_BYTES = int(os.environ.get("RESPONSE_CACHE_BYTES", str(64 * 1024 * 1024)))
+## response ที่ใหญ่กว่านี้ไม่เก็บ (ไม่ให้ response เดียวไล่ของอื่นออกหมด)
+CACHE_MAX_ENTRY_BYTES = CACHE_MAX_BYTES // 4
+## body เล็กกว่านี้ไม่บีบอัด
+COMPRESS_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+## query param ที่ไม่มีผลกับเนื้อหา response
+IGNORED_PARAMS = ("timing",)
+
+## header ของ response เดิมที่ต้องส่งต่อ (เช่น cursor ของ arrow/parquet)
+KEPT_HEADERS = ("X-Next-Cursor",)
+
+
+def has_brotli():
+    try:
+        import brotli  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class Entry:
+    def __init__(self, version, body, mimetype, headers):
+        self.version = version
+        self.body = body
+        self.mimetype = mimetype
+        self.headers = headers
+        # weak ETag: ใช้ค่าเดียวกันทุก Content-Encoding
+        self.tag = f"{version}-{hashlib.sha1(body).hexdigest()[:16]}"
+        self.encoded = {}
+
+    @property
+    def size(self):
+        return len(self.body) + sum(len(b) for b in self.encoded.values())
+
+    def encode(self, encoding):
+        # บีบอัดครั้งแรกที่มีคนขอ encoding นั้น แล้วเก็บไว้ใช้ซ้ำ
+        data = self.encoded.get(encoding)
+        if data is None:
+            if encoding == "br":
+                import brotli
+                data = brotli.compress(self.body, quality=BROTLI_QUALITY)
+            else:
+                data = gzip.compress(self.body, compresslevel=GZIP_LEVEL, mtime=0)
+            self.encoded[encoding] = data
+        return data
+
+
+class ResponseCache:
+    # LRU ที่จำกัดด้วยจำนวน bytes; key = (path, params) และทุก entry ผูกกับ data_version
+    # ingest bump data_version -> entry เดิมใช้ไม่ได้ทันที (ถูกแทนที่หรือถูกไล่ออกตาม LRU)
+    def __init__(self, max_bytes=CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.version != version:
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old.size
+            if entry.size > min(self.max_bytes, CACHE_MAX_ENTRY_BYTES):
+                return
+            self._entries[key] = entry
+            self.bytes += entry.size
+            self._evict()
+
+    def grow(self, key, entry, before):
+        # entry ได้ฉบับบีบอัดเพิ่ม -> ปรับขนาดรวม
+        with self._lock:
+            if self._entries.get(key) is entry:
+                self.bytes += entry.size - before
+                self._evict()
+
+    def _evict(self):
+        while self.bytes > self.max_bytes and self._entries:
+            _, old = self._entries.popitem(last=False)
+            self.bytes -= old.size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+
+_cache = ResponseCache()
+
+
+def get_cache():
+    return _cache
+
+
+def cache_key():
+    params = sorted((k, v) for k, v in request.args.items(multi=True) if k not in IGNORED_PARAMS)
+    return request.path, tuple(params)
+
+
+def pick_encoding(entry):
+    if len(entry.body) < COMPRESS_MIN_BYTES:
+        return None
+    accepted = request.accept_encodings
+    if accepted["br"] and has_brotli():
+        return "br"
+    if accepted["gzip"]:
+        return "gzip"
+    return None
+
+
+def respond(key, entry, status):
+    headers = {
+        "ETag": quote_etag(entry.tag, weak=True),
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding",
+        "X-Cache": status,
+        **entry.headers,
+    }
+    if request.if_none_match.contains_weak(entry.tag):
+        metrics.CACHE_REQUESTS.inc(result="not_modified")
+        return Response(status=304, headers=headers)
+    metrics.CACHE_REQUESTS.inc(result=status.lower())
+    encoding = pick_encoding(entry)
+    if encoding is None:
+        return Response(entry.body, mimetype=entry.mimetype, headers=headers)
+    before = entry.size
+    body = entry.encode(encoding)
+    _cache.grow(key, entry, before)
+    headers["Content-Encoding"] = encoding
+    return Response(body, mimetype=entry.mimetype, headers=headers)
+
+
+def cached(view):
+    # ใช้กับ read endpoint: response 200 ที่ไม่ใช่ stream ถูกเก็บไว้จน data_version เปลี่ยน
+    # รองรับ If-None-Match (304) และส่ง gzip/br ตาม Accept-Encoding
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if _cache.max_bytes <= 0:
+            return view(*args, **kwargs)
+        with connection() as conn:
+            version = data_version(conn)
+        key = cache_key()
+        entry = _cache.get(key, version)
+        if entry is not None:
+            return respond(key, entry, "HIT")
+        resp = make_response(view(*args, **kwargs))
+        if resp.status_code != 200 or resp.is_streamed:
+            return resp
+        headers = {name: resp.headers[name] for name in KEPT_HEADERS if name in resp.headers}
+        entry = Entry(version, resp.get_data(), resp.mimetype, headers)
+        _cache.put(key, entry)
+        return respond(key, entry, "MISS")
+    return wrapper
@@ -0,0 +1,101 @@
+import json
+import os
+import threading
+import numpy as np
+import pandas as pd
+
+## registry ของค่า calibrate ต่อ asset/sensor และตาราง operation code
+## แก้ไฟล์นี้เพื่อเพิ่มอุปกรณ์ได้โดยไม่ต้องแก้โค้ด (โหลดใหม่อัตโนมัติเมื่อไฟล์เปลี่ยน)
+CALIBRATION_PATH = os.environ.get(
+    "CALIBRATION_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "calibration.json")
+)
+
+_lock = threading.Lock()
+_cache = {"mtime": None, "registry": None}
+
+
+class Registry:
+    def __init__(self, config):
+        # linear: [(asset_name, frozenset(sensor_types), intercept, slope)]
+        # ถ้าหลาย entry ตรงกับ (asset, sensor) เดียวกัน entry แรกในไฟล์ชนะ (ทั้ง calibrate และ calibrate_column)
+        self.linear = [
+            (e["asset_name"], frozenset(e["sensor_types"]), float(e["intercept"]), float(e["slope"]))
+            for e in config.get("linear", [])
+        ]
+        self.default_operation = config.get("default_operation", "none")
+        self.operations = {}
+        for asset_name, op in config.get("operations", {}).items():
+            self.operations[asset_name] = {
+                "default": op.get("default", self.default_operation),
+                "sensor_type": op.get("sensor_type"),
+                "codes": {int(k): v for k, v in op.get("codes", {}).items()},
+                "unknown": op.get("unknown", "operation_code {value}"),
+            }
+
+    def operation_codes(self, asset_name):
+        op = self.operations.get(asset_name)
+        return op["codes"] if op else {}
+
+    def operation_mode(self, asset_name, value):
+        # ชื่อ operation ของค่า mode ของ asset (เช่น Interlock 4C: 2 -> scrubbing_mode)
+        op = self.operations.get(asset_name)
+        if op is None or not op["codes"]:
+            return self.default_operation
+        return self.operation(asset_name, op["sensor_type"], value)
+
+    def calibrate(self, asset_name, sensor_type, value):
+        for asset, sensors, intercept, slope in self.linear:
+            if asset == asset_name and sensor_type in sensors:
+                return intercept + (slope * value)
+        return value
+
+    def operation(self, asset_name, sensor_type, value):
+        op = self.operations.get(asset_name)
+        if op is None:
+            return self.default_operation
+        if op["codes"] and sensor_type == op["sensor_type"]:
+            mode = op["codes"].get(int(value))
+            return mode if mode is not None else op["unknown"].format(value=value)
+        return op["default"]
+
+    def calibrate_column(self, asset_name: pd.Series, sensor_type: pd.Series, value: pd.Series) -> pd.Series:
+        out = value.to_numpy(dtype=np.float64, copy=True)
+        raw = value.to_numpy(dtype=np.float64)
+        done = np.zeros(len(out), dtype=bool)
+        for asset, sensors, intercept, slope in self.linear:
+            # แถวที่ entry ก่อนหน้า calibrate ไปแล้วไม่ถูกทับ (entry แรกชนะ เหมือน calibrate)
+            mask = ((asset_name == asset) & sensor_type.isin(sensors)).to_numpy() & ~done
+            out = np.where(mask, intercept + (slope * raw), out)
+            done |= mask
+        return pd.Series(out, index=value.index)
+
+    def operation_column(self, asset_name: pd.Series, sensor_type: pd.Series, value: pd.Series) -> pd.Series:
+        defaults = {asset: op["default"] for asset, op in self.operations.items()}
+        operation = asset_name.map(defaults).fillna(self.default_operation).astype(object)
+        for asset, op in self.operations.items():
+            if not op["codes"]:
+                continue
+            is_mode = (asset_name == asset) & (sensor_type == op["sensor_type"])
+            if not is_mode.any():
+                continue
+            mode_value = value[is_mode]
+            mode = np.trunc(mode_value).map(op["codes"])
+            unknown = mode.isna()
+            mode[unknown] = [op["unknown"].format(value=v) for v in mode_value[unknown]]
+            operation[is_mode] = mode
+        return operation
+
+
+def load_registry(path=CALIBRATION_PATH):
+    with open(path, encoding="utf-8") as f:
+        return Registry(json.load(f))
+
+
+def get_registry(path=CALIBRATION_PATH):
+    # cache ใน memory; เช็ค mtime ทุกครั้งแล้วโหลดใหม่ถ้าไฟล์ถูกแก้
+    mtime = os.stat(path).st_mtime_ns
+    with _lock:
+        if _cache["mtime"] != (path, mtime):
+            _cache["registry"] = load_registry(path)
+            _cache["mtime"] = (path, mtime)
+        return _cache["registry"]
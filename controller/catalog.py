@@ -0,0 +1,38 @@
+import threading
+from controller.db import CATALOG_COLUMNS, SQL_GET_CATALOG, data_version
+
+## cache ของ payload /backend_c/get/param ใน process นี้ (โหลดใหม่เมื่อ data_version เปลี่ยน)
+_lock = threading.Lock()
+_cache = {"version": None, "all": None, "projects": None}
+
+
+def _distinct(values):
+    return sorted(set(values), key=lambda v: (v is None, str(v)))
+
+
+def build_payload(rows):
+    columns = list(zip(*rows)) if rows else [()] * len(CATALOG_COLUMNS)
+    return {name: _distinct(values) for name, values in zip(CATALOG_COLUMNS, columns)}
+
+
+def invalidate():
+    with _lock:
+        _cache["version"] = None
+
+
+def get_catalog(conn, project=None):
+    # อ่าน data_version (PK lookup) ทุกครั้ง ถ้าไม่เปลี่ยนก็ตอบจาก cache เลย
+    version = data_version(conn)
+    with _lock:
+        if _cache["version"] != version:
+            rows = conn.execute(SQL_GET_CATALOG).fetchall()
+            project_idx = CATALOG_COLUMNS.index("project")
+            by_project = {}
+            for row in rows:
+                by_project.setdefault(row[project_idx], []).append(row)
+            _cache["all"] = build_payload(rows)
+            _cache["projects"] = {p: build_payload(r) for p, r in by_project.items()}
+            _cache["version"] = version
+        if project is None:
+            return _cache["all"]
+        return _cache["projects"].get(project) or build_payload([])
@@ -0,0 +1,147 @@
+import numpy as np
+from controller.calibration import get_registry
+from controller.db import select_range
+from controller.timeseries import FETCH_BATCH, load_series
+
+## asset ของชุด HLR: อากาศก่อน/หลังผ่าน scrubber และตัวควบคุมที่รายงาน hlr_operation_mode
+BEFORE_ASSET = "Before Scrub"
+AFTER_ASSET = "After Scrub"
+INTERLOCK_ASSET = "Interlock 4C"
+## hlr_operation_mode เป็นคอลัมน์ status (wide) ที่อยู่ในทุกแถวของ Interlock -> อ่านจากแถว co2 ให้ได้หนึ่งค่าต่อ timestamp
+MODE_SENSOR = "co2"
+
+## ห่างกันไม่เกินเท่านี้ถือว่าเป็นจุดเดียวกัน (ms) ; อุปกรณ์ส่งข้อมูลทุก 1 นาที
+DEFAULT_TOLERANCE_MS = 60 * 1000
+
+COMPARE_COLUMNS = ["timestamp", "before", "after", "delta", "removal_pct", "hlr_operation_mode", "operation"]
+SEGMENT_FIELDS = ["count", "before_avg", "after_avg", "delta_avg", "delta_min", "delta_max", "removal_pct"]
+
+
+def load_modes(conn, project, start, end, asset_name=INTERLOCK_ASSET):
+    cur = select_range(conn, project, start, end, ("timestamp", "hlr_operation_mode"),
+                       sensor_type=MODE_SENSOR, asset_name=asset_name)
+    parts = []
+    while True:
+        batch = cur.fetchmany(FETCH_BATCH)
+        if not batch:
+            break
+        parts.append(np.array(batch, dtype=np.float64))
+    if not parts:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    arr = np.concatenate(parts)
+    return arr[:, 0].astype(np.int64), arr[:, 1]
+
+
+def asof_nearest(ts, other_ts, tolerance):
+    # as-of join แบบ vectorized: index ของจุดใน other_ts (เรียงแล้ว) ที่ใกล้แต่ละ ts ที่สุด
+    # ห่างเท่ากัน -> เลือกจุดก่อนหน้า ; ไม่มีจุดใน tolerance -> -1
+    if len(other_ts) == 0:
+        return np.full(len(ts), -1, dtype=np.int64)
+    right = np.searchsorted(other_ts, ts, side="left")
+    left = np.clip(right - 1, 0, len(other_ts) - 1)
+    right = np.clip(right, 0, len(other_ts) - 1)
+    pick = np.where(np.abs(other_ts[left] - ts) <= np.abs(other_ts[right] - ts), left, right)
+    return np.where(np.abs(other_ts[pick] - ts) <= tolerance, pick, -1)
+
+
+def _pick(values, idx):
+    return np.where(idx >= 0, values[np.maximum(idx, 0)] if len(values) else np.nan, np.nan)
+
+
+def _aggregate(starts, ends, before, after, delta):
+    count = ends - starts
+    before_sum = np.add.reduceat(before, starts)
+    delta_sum = np.add.reduceat(delta, starts)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        removal = np.where(before_sum != 0, delta_sum / before_sum * 100, np.nan)
+    return {
+        "count": count,
+        "before_avg": before_sum / count,
+        "after_avg": np.add.reduceat(after, starts) / count,
+        "delta_avg": delta_sum / count,
+        "delta_min": np.minimum.reduceat(delta, starts),
+        "delta_max": np.maximum.reduceat(delta, starts),
+        "removal_pct": removal,
+    }
+
+
+def compare_co2(conn, project, start, end, tolerance=DEFAULT_TOLERANCE_MS,
+                before_asset=BEFORE_ASSET, after_asset=AFTER_ASSET, interlock_asset=INTERLOCK_ASSET):
+    # แกนเวลาคือจุดของ Before Scrub ; จับคู่ After Scrub และ mode ของ Interlock ที่ใกล้สุดภายใน tolerance
+    # delta = before - after (co2 ที่ถูกดึงออก), removal_pct = delta / before * 100
+    ts, before = load_series(conn, project, start, end, MODE_SENSOR, before_asset)
+    after_ts, after_values = load_series(conn, project, start, end, MODE_SENSOR, after_asset)
+    mode_ts, mode_values = load_modes(conn, project, start, end, interlock_asset)
+    source_rows = {"before": len(ts), "after": len(after_ts), "interlock": len(mode_ts)}
+
+    after = _pick(after_values, asof_nearest(ts, after_ts, tolerance))
+    matched = ~np.isnan(after)
+    ts, before, after = ts[matched], before[matched], after[matched]
+    mode = _pick(mode_values, asof_nearest(ts, mode_ts, tolerance))
+    delta = before - after
+    with np.errstate(divide="ignore", invalid="ignore"):
+        removal = np.where(before != 0, delta / before * 100, np.nan)
+
+    # ชื่อ operation ต่อค่า mode ที่ไม่ซ้ำ (scrubbing_mode, regen_mode, ...) ตาม registry
+    registry = get_registry()
+    codes, inverse = np.unique(np.nan_to_num(mode, nan=-1), return_inverse=True)
+    names = np.array(
+        [None if c < 0 else registry.operation_mode(interlock_asset, c) for c in codes], dtype=object
+    )
+    operation = names[inverse.reshape(-1)] if len(mode) else np.empty(0, dtype=object)
+
+    # segment = ช่วงติดกันที่ mode เดียวกัน ; operations = รวมทุก segment ของ operation เดียวกัน
+    segments = []
+    operations = {}
+    if len(ts):
+        key = inverse.reshape(-1)
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(key)) + 1))
+        ends = np.concatenate((starts[1:], [len(ts)]))
+        agg = _columns(_aggregate(starts, ends, before, after, delta))
+        segments = [
+            {
+                "operation": op,
+                "hlr_operation_mode": m,
+                "start": first,
+                "end": last,
+                **dict(zip(SEGMENT_FIELDS, fields)),
+            }
+            for op, m, first, last, *fields in zip(
+                operation[starts].tolist(), _column(mode[starts]), ts[starts].tolist(), ts[ends - 1].tolist(),
+                *(agg[f] for f in SEGMENT_FIELDS),
+            )
+        ]
+
+        segment_count = np.bincount(key[starts], minlength=len(codes))
+        order = np.argsort(key, kind="stable")
+        group_starts = np.concatenate(([0], np.flatnonzero(np.diff(key[order])) + 1))
+        group_ends = np.concatenate((group_starts[1:], [len(ts)]))
+        agg = _columns(_aggregate(group_starts, group_ends, before[order], after[order], delta[order]))
+        for i, k in enumerate(key[order][group_starts].tolist()):
+            name = names[k] if names[k] is not None else "unknown"
+            operations[name] = {"segments": int(segment_count[k]), **{f: agg[f][i] for f in SEGMENT_FIELDS}}
+
+    rows = [
+        list(row) for row in zip(
+            ts.tolist(), before.tolist(), after.tolist(), delta.tolist(),
+            _column(removal), _column(mode), operation.tolist(),
+        )
+    ]
+    return {
+        "source_rows": source_rows,
+        "matched_rows": len(rows),
+        "tolerance_ms": tolerance,
+        "columns": COMPARE_COLUMNS,
+        "rows": rows,
+        "segments": segments,
+        "operations": operations,
+    }
+
+
+def _column(values):
+    # NaN ส่งเป็น JSON ไม่ได้ -> None
+    return np.where(np.isnan(values), None, values).tolist()
+
+
+def _columns(agg):
+    return {f: agg[f].tolist() if f == "count" else _column(agg[f]) for f in SEGMENT_FIELDS}
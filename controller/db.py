@@ -0,0 +1,1010 @@
+import logging
+import math
+import os
+import queue
+import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = os.environ.get("SENSOR_DB_PATH", "sensor_data_projectD.db")
+
+## ค่า tuning ของ connection (ใช้กับทุก connection ใน pool)
+POOL_SIZE = 8
+## ใน WAL reader ไม่ต้องรอ lock; ค่านี้มีผลกับ writer ที่รอกัน (upload job หลาย process)
+BUSY_TIMEOUT_MS = 30000
+CACHE_SIZE_KB = 64 * 1024
+MMAP_SIZE = 256 * 1024 * 1024
+
+SENSOR_DATA_DDL = """
+CREATE TABLE IF NOT EXISTS sensor_data (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    data_type TEXT,
+    asset_number TEXT,
+    asset_name TEXT,
+    system TEXT,
+    install_location TEXT,
+    device_type TEXT,
+    device_id TEXT,
+    project TEXT,
+    report_time TEXT,
+    timestamp INTEGER,
+    sensor_type TEXT,
+    operation TEXT,
+    value_raw REAL,
+    value REAL,
+    clean_air_damper_open_alarm REAL,
+    co2_level_enable_scrub_mode REAL,
+    co2_level_scrub_mode REAL,
+    exhaust_air_damper_open_alarm REAL,
+    fan_alarm REAL,
+    fan_speed REAL,
+    fire_alarm REAL,
+    high_temperature_alarm REAL,
+    hlr_connect_status REAL,
+    hlr_operation_mode REAL,
+    interlock_status REAL,
+    km1_no_feedback_alarm REAL,
+    service_door_alarm REAL,
+    switch_co2_state REAL,
+    switch_interlock_state REAL,
+    temp_before_filter REAL
+)
+"""
+
+## layout ข้างบนคือ sensor_data เดิม (migration 1-8 และไฟล์ archive ของ retention)
+## ตั้งแต่ migration 9 partition เก็บเฉพาะ key ของ dimension + ค่า: metadata ของอุปกรณ์อยู่ใน devices
+## ชื่อ project / sensor / operation อยู่ใน projects / sensor_types / operations
+## (report_time ไม่เก็บ เพราะได้จาก timestamp)
+SENSOR_FACT_DDL = """
+CREATE TABLE IF NOT EXISTS sensor_data (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    device_fk INTEGER NOT NULL,
+    project_code INTEGER,
+    timestamp INTEGER,
+    sensor_code INTEGER NOT NULL,
+    operation_code INTEGER,
+    value_raw REAL,
+    value REAL,
+    clean_air_damper_open_alarm REAL,
+    co2_level_enable_scrub_mode REAL,
+    co2_level_scrub_mode REAL,
+    exhaust_air_damper_open_alarm REAL,
+    fan_alarm REAL,
+    fan_speed REAL,
+    fire_alarm REAL,
+    high_temperature_alarm REAL,
+    hlr_connect_status REAL,
+    hlr_operation_mode REAL,
+    interlock_status REAL,
+    km1_no_feedback_alarm REAL,
+    service_door_alarm REAL,
+    switch_co2_state REAL,
+    switch_interlock_state REAL,
+    temp_before_filter REAL
+)
+"""
+
+## natural key ของหนึ่งค่า sensor: ใช้ทำ unique index + ON CONFLICT ตอน insert
+## device_fk แทน device_id (key ของ devices) -> ตรงกับ LEGACY_NATURAL_KEY
+NATURAL_KEY = ("device_fk", "sensor_code", "timestamp")
+## natural key ของ layout เดิม (migration 3)
+LEGACY_NATURAL_KEY = ("device_id", "timestamp", "sensor_type")
+
+## metadata ของอุปกรณ์ที่ส่งออก/อยู่ใน catalog (project เก็บต่อแถวใน partition ผ่าน LABEL_TABLES)
+DEVICE_COLUMNS = (
+    "data_type",
+    "asset_number",
+    "asset_name",
+    "system",
+    "install_location",
+    "device_type",
+    "device_id",
+    "project",
+)
+
+## ตาราง lookup ของค่า TEXT ที่ซ้ำทุกแถว -> คอลัมน์ code ใน partition
+## project อยู่ต่อแถว (ไม่ใช่ attribute ของ devices) -> index (project_code, timestamp) ใช้ filter project ได้
+LABEL_TABLES = {
+    "project": ("projects", "project_code"),
+    "sensor_type": ("sensor_types", "sensor_code"),
+    "operation": ("operations", "operation_code"),
+}
+
+## devices: หนึ่งแถวต่อ device_id ; คอลัมน์อื่นเป็น attribute ที่แก้ได้ (upload ล่าสุดชนะ)
+## แก้ชื่อ asset ฯลฯ แล้ว upload ซ้ำ -> ยังเป็น device_fk เดิม แถวไม่ซ้ำ
+DEVICE_KEY = "device_id"
+DEVICE_ATTRIBUTES = tuple(c for c in DEVICE_COLUMNS if c not in LABEL_TABLES)
+
+## ข้อมูลจริงอยู่ในตารางรายเดือน sensor_data_YYYYMM (เดือนตาม UTC ของ timestamp)
+## sensor_data เหลือเป็นตารางว่างไว้เป็นต้นแบบ schema/index (และใช้ตรวจ query plan)
+PARTITION_TABLE = "sensor_data"
+
+## rollup ต่อ (project, asset_name, sensor_type): ชื่อ resolution -> ความกว้าง bucket (ms)
+## เรียงจากละเอียดไปหยาบ; bucket เริ่มที่ทวีคูณของความกว้างนับจาก epoch (UTC)
+ROLLUP_RESOLUTIONS = (("1m", 60 * 1000), ("1h", 3600 * 1000), ("1d", 86400 * 1000))
+
+## retention: เก็บย้อนหลังกี่เดือน (0 = เก็บทั้งหมด); ถ้ากำหนด archive dir จะย้ายไปไฟล์แยกแทนการลบ
+RETENTION_MONTHS = int(os.environ.get("RETENTION_MONTHS", "0"))
+RETENTION_ARCHIVE_DIR = os.environ.get("RETENTION_ARCHIVE_DIR") or None
+
+
+def compact_duplicates(conn, table=PARTITION_TABLE, natural_key=NATURAL_KEY):
+    # ลบแถวซ้ำตาม natural key เหลือแถวแรกที่ insert (id น้อยสุด)
+    key = ", ".join(natural_key)
+    cur = conn.execute(f"""
+        DELETE FROM {table}
+        WHERE id NOT IN (SELECT MIN(id) FROM {table} GROUP BY {key})
+    """)
+    return cur.rowcount
+
+
+def _unique_natural_key(conn):
+    compact_duplicates(conn, natural_key=LEGACY_NATURAL_KEY)
+    conn.execute(
+        f"CREATE UNIQUE INDEX IF NOT EXISTS uq_sensor_data_natural_key ON sensor_data ({', '.join(LEGACY_NATURAL_KEY)})"
+    )
+
+
+## metadata สำหรับ dropdown filter ของ /backend_c/get/param
+CATALOG_COLUMNS = (*DEVICE_COLUMNS, "sensor_type")
+
+
+def _sensor_catalog(conn):
+    # TEXT affinity ให้ค่าที่เก็บตรงกับคอลัมน์ใน sensor_data (เช่น device_id ตัวเลข -> '123')
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS sensor_catalog ({', '.join(c + ' TEXT' for c in CATALOG_COLUMNS)})"
+    )
+    # ifnull: ให้ค่า NULL นับเป็นค่าเดียวกัน ไม่งั้น INSERT OR IGNORE จะเพิ่มแถวซ้ำทุก upload
+    conn.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_sensor_catalog ON sensor_catalog ("
+        + ", ".join(f"IFNULL({c}, '')" for c in CATALOG_COLUMNS)
+        + ")"
+    )
+    conn.execute(f"""
+        INSERT OR IGNORE INTO sensor_catalog ({', '.join(CATALOG_COLUMNS)})
+        SELECT DISTINCT {', '.join(CATALOG_COLUMNS)} FROM sensor_data
+    """)
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)")
+    conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('data_version', 0)")
+
+
+def rollup_table(resolution):
+    return f"rollup_{resolution}"
+
+
+def _rollup_tables(conn):
+    # WITHOUT ROWID + PK (project, sensor_type, asset_name, bucket) = เก็บเรียงตามที่ query อ่าน
+    for resolution, _ in ROLLUP_RESOLUTIONS:
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {rollup_table(resolution)} (
+                project TEXT NOT NULL,
+                sensor_type TEXT NOT NULL,
+                asset_name TEXT NOT NULL,
+                bucket INTEGER NOT NULL,
+                count INTEGER,
+                sum REAL,
+                min REAL,
+                max REAL,
+                last REAL,
+                last_ts INTEGER,
+                PRIMARY KEY (project, sensor_type, asset_name, bucket)
+            ) WITHOUT ROWID
+        """)
+    # backfill ย้ายไปทำใน migration 9 หลังแปลง partition เป็น layout ใหม่
+    # (rebuild_rollups อ่านผ่าน select_range ซึ่ง join กับ devices)
+
+
+def _rollup_bucket_index(conn):
+    # query ที่ไม่ระบุ asset (ค่าเริ่มต้นของ dashboard) ค้นด้วย (project, sensor_type, bucket)
+    # -> ช่วง bucket อยู่ใน index ไม่ต้องอ่านทุก bucket ย้อนหลังของทุก asset
+    for resolution, _ in ROLLUP_RESOLUTIONS:
+        table = rollup_table(resolution)
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_project_sensor_bucket ON {table} (project, sensor_type, bucket)")
+
+
+def month_key(ts_ms):
+    # 2025-10-xx -> 202510
+    d = datetime.fromtimestamp(ts_ms / 1000, tz=timezone.utc)
+    return d.year * 100 + d.month
+
+
+def month_bounds(key):
+    # [start_ms, end_ms) ของเดือน
+    year, month = divmod(key, 100)
+    start = datetime(year, month, 1, tzinfo=timezone.utc)
+    end = datetime(year + month // 12, month % 12 + 1, 1, tzinfo=timezone.utc)
+    return int(start.timestamp() * 1000), int(end.timestamp() * 1000)
+
+
+def partition_name(key):
+    return f"{PARTITION_TABLE}_{key}"
+
+
+def _create_legacy_partition(conn, name, schema="main"):
+    # layout เดิม (metadata TEXT ทุกแถว): migration 6 และไฟล์ archive (อ่านได้โดยไม่ต้องมี devices)
+    conn.execute(SENSOR_DATA_DDL.replace(f"{PARTITION_TABLE} (", f"{schema}.{name} (", 1))
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_{name}_project_ts ON {name} (project, timestamp)")
+    conn.execute(
+        f"CREATE INDEX IF NOT EXISTS {schema}.idx_{name}_project_sensor_ts ON {name} (project, sensor_type, timestamp)"
+    )
+    conn.execute(
+        f"CREATE UNIQUE INDEX IF NOT EXISTS {schema}.uq_{name}_natural_key ON {name} ({', '.join(LEGACY_NATURAL_KEY)})"
+    )
+
+
+def _create_partition_table(conn, name):
+    # (project_code, timestamp): range ทั้ง project / (project_code, sensor_code, timestamp): series เดียว
+    # natural key (device_fk, sensor_code, timestamp): series ของอุปกรณ์เดียว (asset ที่มีอุปกรณ์เดียว)
+    # ทุก index เรียงตาม (timestamp, id) ภายใน key อยู่แล้ว (rowid ต่อท้าย)
+    conn.execute(SENSOR_FACT_DDL.replace(f"{PARTITION_TABLE} (", f"{name} (", 1))
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{name}_project_ts ON {name} (project_code, timestamp)")
+    conn.execute(
+        f"CREATE INDEX IF NOT EXISTS idx_{name}_project_sensor_ts ON {name} (project_code, sensor_code, timestamp)"
+    )
+    conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {natural_key_index(name)} ON {name} ({', '.join(NATURAL_KEY)})")
+
+
+def natural_key_index(name):
+    return f"uq_{name}_natural_key"
+
+
+def ensure_partition(conn, key, create=_create_partition_table):
+    # สร้างตาราง + index ของเดือนนั้นถ้ายังไม่มี แล้วลงทะเบียนใน sensor_partitions
+    name = partition_name(key)
+    start_ms, end_ms = month_bounds(key)
+    create(conn, name)
+    conn.execute(
+        "INSERT OR IGNORE INTO sensor_partitions (month, name, start_ms, end_ms) VALUES (?, ?, ?, ?)",
+        (key, name, start_ms, end_ms),
+    )
+    return name
+
+
+def list_partitions(conn, start=None, end=None):
+    # partition ที่ช่วงเวลาทับกับ [start, end] เรียงตามเวลา -> [(month, name), ...]
+    where, params = [], []
+    if end is not None:
+        where.append("start_ms <= ?")
+        params.append(end)
+    if start is not None:
+        where.append("end_ms > ?")
+        params.append(start)
+    sql = "SELECT month, name FROM sensor_partitions"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    return conn.execute(sql + " ORDER BY month", params).fetchall()
+
+
+def count_rows(conn):
+    names = [name for _, name in list_partitions(conn)] if _has_table(conn, "sensor_partitions") else []
+    if _has_table(conn, PARTITION_TABLE):
+        names.append(PARTITION_TABLE)
+    return sum(conn.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0] for name in names)
+
+
+def _has_table(conn, name):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone() is not None
+
+
+def _partition_sensor_data(conn):
+    # ย้ายแถวเดิมใน sensor_data ไปตารางรายเดือน (คง id เดิมไว้ -> cursor เดิมยังใช้ได้)
+    # แล้วสร้าง sensor_data ใหม่เป็นตารางว่าง แทนการ DELETE ทั้งตาราง
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sensor_partitions (
+            month INTEGER PRIMARY KEY,
+            name TEXT UNIQUE,
+            start_ms INTEGER,
+            end_ms INTEGER
+        )
+    """)
+    months = [r[0] for r in conn.execute(
+        "SELECT DISTINCT CAST(strftime('%Y%m', timestamp / 1000, 'unixepoch') AS INTEGER) "
+        "FROM sensor_data WHERE timestamp IS NOT NULL"
+    )]
+    for key in months:
+        name = ensure_partition(conn, key, create=_create_legacy_partition)
+        start_ms, end_ms = month_bounds(key)
+        conn.execute(
+            f"INSERT INTO {name} SELECT * FROM sensor_data WHERE timestamp >= ? AND timestamp < ?",
+            (start_ms, end_ms),
+        )
+    conn.execute("DROP TABLE sensor_data")
+    _create_legacy_partition(conn, PARTITION_TABLE)
+
+
+def device_key_sql(alias=None):
+    # ifnull แบบเดียวกับ sensor_catalog: device_id NULL นับเป็นอุปกรณ์เดียวกัน (ใช้ทั้ง unique และตอน join/ค้น id)
+    return f"IFNULL({alias + '.' if alias else ''}{DEVICE_KEY}, '')"
+
+
+## upsert ของ devices: อุปกรณ์เดิม -> อัปเดต attribute เป็นค่าล่าสุดที่ไม่ใช่ NULL (ค่าที่ไม่ได้ส่งมาคงค่าเดิม)
+UPSERT_DEVICE_SQL = (
+    f"INSERT INTO devices ({', '.join(DEVICE_ATTRIBUTES)}) {{select}} "
+    f"ON CONFLICT ({device_key_sql()}) DO UPDATE SET "
+    + ", ".join(f"{c} = IFNULL(excluded.{c}, {c})" for c in DEVICE_ATTRIBUTES if c != DEVICE_KEY)
+)
+
+
+## ค้นอุปกรณ์/label ทีละชุด ({marks} = placeholder ของ IN)
+SQL_FIND_DEVICES = (
+    f"SELECT {device_key_sql()}, id, {', '.join(DEVICE_ATTRIBUTES)} FROM devices "
+    f"WHERE {device_key_sql()} IN ({{marks}})"
+)
+SQL_FIND_LABELS = "SELECT name, id FROM {table} WHERE name IN ({marks})"
+
+
+def _create_dimension_tables(conn):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS devices (
+            id INTEGER PRIMARY KEY,
+            {", ".join(c + " TEXT" for c in DEVICE_ATTRIBUTES)}
+        )
+    """)
+    conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS uq_devices ON devices ({device_key_sql()})")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_devices_asset_name ON devices (asset_name)")
+    for table, _ in LABEL_TABLES.values():
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)")
+
+
+def _rebuild_partition(conn, name, source_sql):
+    # สร้าง partition ใหม่จาก SELECT (source_sql อ่านจาก {name}_old) แล้วลบตารางเดิม
+    # INSERT OR IGNORE ตามลำดับ id: แถวที่ natural key ชนกันเหลือแถวแรก (เหมือน compact_duplicates)
+    conn.execute(f"ALTER TABLE {name} RENAME TO {name}_old")
+    for (index,) in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+        (f"{name}_old",),
+    ).fetchall():
+        conn.execute(f"DROP INDEX {index}")
+    _create_partition_table(conn, name)
+    values = [r[1] for r in conn.execute(f"PRAGMA table_info({name})")]
+    conn.execute(f"INSERT OR IGNORE INTO {name} ({', '.join(values)}) {source_sql(values)}")
+    conn.execute(f"DROP TABLE {name}_old")
+
+
+def _normalize_partitions(conn):
+    # แปลงทุก partition จาก layout เดิมเป็น fact + dimension ทีละตาราง (คง id เดิม -> cursor เดิมยังใช้ได้)
+    _create_dimension_tables(conn)
+    for _, name in list_partitions(conn):
+        # attribute ของอุปกรณ์ = แถวล่าสุดของ device_id นั้น (partition ถัดไปเขียนทับ)
+        conn.execute(UPSERT_DEVICE_SQL.format(select=f"""
+            SELECT {", ".join(DEVICE_ATTRIBUTES)} FROM {name}
+            WHERE id IN (SELECT MAX(id) FROM {name} GROUP BY {device_key_sql()}) ORDER BY id
+        """))
+        for column, (table, _) in LABEL_TABLES.items():
+            conn.execute(
+                f"INSERT OR IGNORE INTO {table} (name) SELECT DISTINCT {column} FROM {name} WHERE {column} IS NOT NULL"
+            )
+        # sensor_code เป็น NOT NULL: แถวเดิมที่ไม่มี sensor_type ย้ายไม่ได้ -> นับแล้วรายงาน ไม่หายเงียบ
+        skipped = conn.execute(f"SELECT COUNT(*) FROM {name} WHERE sensor_type IS NULL").fetchone()[0]
+        if skipped:
+            logger.warning("migration 9: %s has %d rows without sensor_type, not migrated", name, skipped)
+        selected = {"device_fk": "d.id", "project_code": "p.id", "sensor_code": "s.id", "operation_code": "o.id"}
+        _rebuild_partition(conn, name, lambda values: f"""
+            SELECT {", ".join(selected.get(c, "l." + c) for c in values)}
+            FROM {name}_old AS l
+            JOIN devices AS d ON {device_key_sql("d")} = {device_key_sql("l")}
+            JOIN sensor_types AS s ON s.name = l.sensor_type
+            LEFT JOIN projects AS p ON p.name = l.project
+            LEFT JOIN operations AS o ON o.name = l.operation
+            ORDER BY l.id
+        """)
+    conn.execute(f"DROP TABLE {PARTITION_TABLE}")
+    _create_partition_table(conn, PARTITION_TABLE)
+    # attribute ของอุปกรณ์เป็นค่าล่าสุดต่อ device_id -> สร้าง catalog ใหม่ให้ตรงกับที่อ่านผ่าน join
+    rebuild_catalog(conn)
+    # backfill rollup (เดิมอยู่ใน migration 7) ตอนนี้ partition อ่านผ่าน join ได้แล้ว
+    from controller.rollup import rebuild_rollups
+    rebuild_rollups(conn)
+
+
+## migration แบบมีเวอร์ชัน (เก็บใน PRAGMA user_version) -> (version, description, statements)
+## ห้ามแก้ migration ที่ปล่อยไปแล้ว ให้เพิ่มเวอร์ชันใหม่ต่อท้ายเท่านั้น
+MIGRATIONS = [
+    (1, "create sensor_data", [SENSOR_DATA_DDL]),
+    (2, "time-range indexes on sensor_data", [
+        "CREATE INDEX IF NOT EXISTS idx_sensor_data_project_ts ON sensor_data (project, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_sensor_data_project_sensor_ts ON sensor_data (project, sensor_type, timestamp)",
+    ]),
+    (3, "deduplicate sensor_data and add unique natural key", [_unique_natural_key]),
+    (4, "sensor_catalog and data_version", [_sensor_catalog]),
+    (5, "upload_jobs queue", ["""
+        CREATE TABLE IF NOT EXISTS upload_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            filename TEXT,
+            path TEXT,
+            state TEXT,
+            created_at REAL,
+            started_at REAL,
+            finished_at REAL,
+            progress TEXT,
+            result TEXT,
+            error TEXT
+        )
+    """, "CREATE INDEX IF NOT EXISTS idx_upload_jobs_state ON upload_jobs (state)"]),
+    (6, "monthly partitions of sensor_data", [_partition_sensor_data]),
+    (7, "1m/1h/1d rollup tables", [_rollup_tables]),
+    (8, "upload ledger keyed by file sha256", ["""
+        CREATE TABLE IF NOT EXISTS upload_ledger (
+            sha256 TEXT PRIMARY KEY,
+            filename TEXT,
+            size INTEGER,
+            ingested_at REAL,
+            source_rows INTEGER,
+            written_rows INTEGER
+        ) WITHOUT ROWID
+    """, "ALTER TABLE upload_jobs ADD COLUMN sha256 TEXT",
+        "CREATE INDEX IF NOT EXISTS idx_upload_jobs_sha256 ON upload_jobs (sha256)"]),
+    (9, "devices (keyed by device_id)/projects/sensor_types/operations dimension tables", [_normalize_partitions]),
+    (10, "rollup index on (project, sensor_type, bucket)", [_rollup_bucket_index]),
+    (11, "upload_jobs owner and heartbeat", [
+        "ALTER TABLE upload_jobs ADD COLUMN owner TEXT",
+        "ALTER TABLE upload_jobs ADD COLUMN heartbeat_at REAL",
+    ]),
+]
+
+## query ที่ service ใช้ (RouteGet / RoutGetParam)
+## RoutGetParam อ่านจาก sensor_catalog (ตารางเล็ก) จึง scan ได้
+## แถวไม่ซ้ำอยู่แล้วจาก unique natural key จึงไม่ต้อง SELECT DISTINCT
+## คอลัมน์ที่ /backend_c/get ส่งออก (ลำดับตาม response เดิม)
+GET_RANGE_COLUMNS = (
+    "data_type",
+    "asset_number",
+    "asset_name",
+    "system",
+    "install_location",
+    "device_type",
+    "device_id",
+    "project",
+    "hlr_operation_mode",
+    "timestamp",
+    "sensor_type",
+    "value",
+)
+
+
+def column_sql(column):
+    # ชื่อคอลัมน์ของ response -> expression ใน query ที่ join partition (f) กับ dimension
+    if column in LABEL_TABLES:
+        return f"{LABEL_TABLES[column][0]}.name"
+    if column in DEVICE_ATTRIBUTES:
+        return f"d.{column}"
+    return f"f.{column}"
+
+
+def range_sql(columns=GET_RANGE_COLUMNS, sensor_type=False, asset_name=None, after=False, limit=False,
+              table=PARTITION_TABLE):
+    # เรียงตาม (timestamp, id) ซึ่งตรงกับลำดับใน index (rowid ต่อท้ายทุก index) จึงไม่ต้อง sort
+    # CROSS JOIN บังคับให้ partition เป็น loop นอก (อ่านตาม index เวลา) แล้วค่อย lookup dimension ด้วย PK
+    # project / sensor_type แปลงเป็น code ครั้งเดียวด้วย subquery -> อยู่ใน index ของ partition
+    # asset_name: "device" = asset มีอุปกรณ์เดียว (param คือ device_fk) อ่านจาก natural key index ตรงๆ
+    #             "devices" = หลายอุปกรณ์/ไม่รู้จัก (param คือชื่อ asset) filter ต่อแถวบน index ของ project
+    # after = keyset cursor (timestamp, id) ของแถวสุดท้ายในหน้าก่อน
+    joins = []
+    if any(c in DEVICE_ATTRIBUTES for c in columns):
+        joins.append("CROSS JOIN devices AS d ON d.id = f.device_fk")
+    for column, (label_table, code_column) in LABEL_TABLES.items():
+        if column in columns:
+            joins.append(f"CROSS JOIN {label_table} ON {label_table}.id = f.{code_column}")
+    where = ["f.project_code = (SELECT id FROM projects WHERE name = ?)", "f.timestamp BETWEEN ? AND ?"]
+    if sensor_type:
+        where.append("f.sensor_code = (SELECT id FROM sensor_types WHERE name = ?)")
+    if asset_name == "device":
+        where.append("f.device_fk = ?")
+    elif asset_name:
+        where.append("f.device_fk IN (SELECT id FROM devices WHERE asset_name = ?)")
+    if after:
+        where.append("(f.timestamp, f.id) > (?, ?)")
+    indexed = f" INDEXED BY {natural_key_index(table)}" if asset_name == "device" and sensor_type else ""
+    sql = f"""
+        SELECT {", ".join(column_sql(c) for c in columns)}
+        FROM {table} AS f{indexed}
+        {" ".join(joins)}
+        WHERE {" AND ".join(where)}
+        ORDER BY f.timestamp ASC, f.id ASC
+    """
+    if limit:
+        sql += " LIMIT ?"
+    return sql
+
+
+def series_sql(table):
+    # ชุด metadata + sensor_type ที่ไม่ซ้ำของ partition (ตามลำดับ CATALOG_COLUMNS)
+    return f"""
+        SELECT DISTINCT {", ".join(f"{column_sql(c)} AS {c}" for c in CATALOG_COLUMNS)}
+        FROM (SELECT DISTINCT device_fk, project_code, sensor_code FROM {table}) AS f
+        JOIN devices AS d ON d.id = f.device_fk
+        JOIN sensor_types ON sensor_types.id = f.sensor_code
+        LEFT JOIN projects ON projects.id = f.project_code
+    """
+
+
+class PartitionCursor:
+    # อ่าน partition ที่ทับช่วงเวลาทีละตัวตามลำดับเวลา แล้วต่อกัน
+    # partition ไม่มีช่วงเวลาทับกัน -> ผลรวมเรียงตาม (timestamp, id) โดยไม่ต้อง merge/sort
+    # ใช้แทน sqlite3.Cursor ได้ในส่วนที่ service ใช้ (fetchmany/fetchall/iter)
+    def __init__(self, conn, tables, sql_for, params, limit=None):
+        self.conn = conn
+        self.tables = list(tables)
+        self.sql_for = sql_for
+        self.params = params
+        self.remaining = limit
+        self.cur = None
+
+    def _next_cursor(self):
+        while self.tables:
+            if self.remaining is not None and self.remaining <= 0:
+                break
+            table = self.tables.pop(0)
+            params = self.params if self.remaining is None else self.params + [self.remaining]
+            return self.conn.execute(self.sql_for(table), params)
+        return None
+
+    def fetchmany(self, size):
+        rows = []
+        while len(rows) < size:
+            if self.cur is None:
+                self.cur = self._next_cursor()
+                if self.cur is None:
+                    break
+            batch = self.cur.fetchmany(size - len(rows))
+            if not batch:
+                self.cur = None
+                continue
+            if self.remaining is not None:
+                self.remaining -= len(batch)
+            rows.extend(batch)
+        return rows
+
+    def fetchall(self):
+        rows = []
+        while True:
+            batch = self.fetchmany(5000)
+            if not batch:
+                return rows
+            rows.extend(batch)
+
+    def __iter__(self):
+        while True:
+            batch = self.fetchmany(5000)
+            if not batch:
+                return
+            yield from batch
+
+
+SQL_ASSET_DEVICES = "SELECT id FROM devices WHERE asset_name = ? LIMIT 2"
+
+
+def asset_filter(conn, asset_name):
+    # asset ที่มีอุปกรณ์เดียว -> ("device", device_fk) ; นอกนั้น -> ("devices", asset_name)
+    ids = conn.execute(SQL_ASSET_DEVICES, (asset_name,)).fetchall()
+    if len(ids) == 1:
+        return "device", ids[0][0]
+    return "devices", asset_name
+
+
+def select_range(conn, project, start, end, columns=GET_RANGE_COLUMNS,
+                 sensor_type=None, asset_name=None, after=None, limit=None):
+    # ทุก read ของ sensor data ผ่านฟังก์ชันนี้ -> อ่านเฉพาะ partition ที่ทับ [start, end]
+    if after is not None:
+        # เริ่ม range ของ index ที่ timestamp ของ cursor เลย ไม่ต้องไล่ข้ามแถวของหน้าก่อนๆ
+        start = max(start, after[0])
+    params = [project, start, end]
+    if sensor_type is not None:
+        params.append(sensor_type)
+    asset_mode = None
+    if asset_name is not None:
+        asset_mode, asset_param = asset_filter(conn, asset_name)
+        params.append(asset_param)
+    if after is not None:
+        params.extend(after)
+
+    def sql_for(table):
+        return range_sql(
+            columns,
+            sensor_type=sensor_type is not None,
+            asset_name=asset_mode,
+            after=after is not None,
+            limit=limit is not None,
+            table=table,
+        )
+
+    tables = [name for _, name in list_partitions(conn, start, end)]
+    return PartitionCursor(conn, tables, sql_for, params, limit)
+
+
+## field ที่ rollup เก็บต่อ bucket (avg = sum / count)
+ROLLUP_FIELDS = ("count", "sum", "min", "max", "last", "last_ts")
+
+
+def rollup_sql(resolution, asset_name=False):
+    # ไม่ระบุ asset -> อ่านทุก asset ของ (project, sensor_type) แล้วไปรวมกันต่อ bucket ภายหลัง
+    where = ["project = ?", "sensor_type = ?"]
+    if asset_name:
+        where.append("asset_name = ?")
+    where.append("bucket BETWEEN ? AND ?")
+    return f"""
+        SELECT bucket, {", ".join(ROLLUP_FIELDS)}
+        FROM {rollup_table(resolution)}
+        WHERE {" AND ".join(where)}
+    """
+
+
+
+def rollup_combine_sql(resolution, finer):
+    # คำนวณ bucket ของ resolution จาก bucket ของ resolution ที่ละเอียดกว่า ใน [start, end) ของ series หนึ่ง
+    # params: (start, project, sensor_type, asset_name, start, end) ; start ต้องตรงขอบ bucket ของ resolution
+    # last/last_ts มาจาก bucket ย่อยตัวสุดท้าย (bucket ย่อยไม่ทับกัน -> last_ts มากสุดอยู่ใน bucket นั้น)
+    width = dict(ROLLUP_RESOLUTIONS)[resolution]
+    source = rollup_table(finer)
+    return f"""
+        INSERT OR REPLACE INTO {rollup_table(resolution)}
+            (project, sensor_type, asset_name, bucket, {", ".join(ROLLUP_FIELDS)})
+        SELECT g.project, g.sensor_type, g.asset_name, g.bucket, g.count, g.sum, g.min, g.max, l.last, l.last_ts
+        FROM (
+            SELECT project, sensor_type, asset_name, bucket - (bucket - ?) % {width} AS bucket,
+                   SUM(count) AS count, SUM(sum) AS sum, MIN(min) AS min, MAX(max) AS max, MAX(bucket) AS last_bucket
+            FROM {source}
+            WHERE project = ? AND sensor_type = ? AND asset_name = ? AND bucket >= ? AND bucket < ?
+            GROUP BY 4
+        ) g
+        JOIN {source} l ON l.project = g.project AND l.sensor_type = g.sensor_type
+            AND l.asset_name = g.asset_name AND l.bucket = g.last_bucket
+    """
+
+SQL_GET_RANGE = range_sql()
+
+SQL_GET_CATALOG = f"SELECT {', '.join(CATALOG_COLUMNS)} FROM sensor_catalog"
+
+SQL_LIST_PARTITIONS = "SELECT month, name FROM sensor_partitions WHERE start_ms <= ? AND end_ms > ? ORDER BY month"
+
+## (name, sql, ตัวอย่าง params, บรรทัดของ plan ที่ต้องมี) ; None = ตารางเล็ก ยอมให้ full scan ได้
+## บรรทัดที่คาดไว้ระบุทั้ง index และเงื่อนไขที่ใช้ค้น (key นำหน้า + ช่วงของคอลัมน์เวลา/bucket)
+## query ของ range ตรวจกับตารางต้นแบบ sensor_data ซึ่งมี index ชุดเดียวกับทุก partition
+PROJECT_TS_PLAN = "SEARCH f USING INDEX idx_sensor_data_project_ts (project_code=? AND timestamp>? AND timestamp<?)"
+PROJECT_SENSOR_TS_PLAN = (
+    "SEARCH f USING INDEX idx_sensor_data_project_sensor_ts "
+    "(project_code=? AND sensor_code=? AND timestamp>? AND timestamp<?)"
+)
+DEVICE_SENSOR_TS_PLAN = (
+    "SEARCH f USING INDEX uq_sensor_data_natural_key (device_fk=? AND sensor_code=? AND timestamp>? AND timestamp<?)"
+)
+QUERY_PLANS = [
+    ("get_range", SQL_GET_RANGE, ("d17", 0, 1), PROJECT_TS_PLAN),
+    ("get_range_page", range_sql(GET_RANGE_COLUMNS + ("id",), after=True, limit=True), ("d17", 0, 1, 0, 0, 100),
+     PROJECT_TS_PLAN),
+    ("get_range_sensor", range_sql(sensor_type=True), ("d17", 0, 1, "co2"), PROJECT_SENSOR_TS_PLAN),
+    ("load_series", range_sql(("timestamp", "value"), sensor_type=True), ("d17", 0, 1, "co2"),
+     PROJECT_SENSOR_TS_PLAN),
+    ("load_series_device", range_sql(("timestamp", "value"), sensor_type=True, asset_name="device"),
+     ("d17", 0, 1, "co2", 1), DEVICE_SENSOR_TS_PLAN),
+    ("load_series_devices", range_sql(("timestamp", "value"), sensor_type=True, asset_name="devices"),
+     ("d17", 0, 1, "co2", "Before Scrub"), PROJECT_SENSOR_TS_PLAN),
+    ("compare_modes", range_sql(("timestamp", "hlr_operation_mode"), sensor_type=True, asset_name="device"),
+     ("d17", 0, 1, "co2", 1), DEVICE_SENSOR_TS_PLAN),
+    ("asset_devices", SQL_ASSET_DEVICES, ("Before Scrub",),
+     "SEARCH devices USING COVERING INDEX idx_devices_asset_name (asset_name=?)"),
+    ("find_devices", SQL_FIND_DEVICES.format(marks="?, ?"), ("dev-1", ""),
+     "SEARCH devices USING INDEX uq_devices (<expr>=?)"),
+    ("find_labels", SQL_FIND_LABELS.format(table="sensor_types", marks="?, ?"), ("co2", "voc"),
+     "SEARCH sensor_types USING COVERING INDEX sqlite_autoindex_sensor_types_1 (name=?)"),
+    ("get_param", SQL_GET_CATALOG, (), None),
+    ("list_partitions", SQL_LIST_PARTITIONS, (1, 0), None),
+    ("get_rollup", rollup_sql("1h"), ("d17", "co2", 0, 1),
+     "SEARCH rollup_1h USING INDEX idx_rollup_1h_project_sensor_bucket "
+     "(project=? AND sensor_type=? AND bucket>? AND bucket<?)"),
+    ("get_rollup_asset", rollup_sql("1h", asset_name=True), ("d17", "co2", "Before Scrub", 0, 1),
+     "SEARCH rollup_1h USING PRIMARY KEY (project=? AND sensor_type=? AND asset_name=? AND bucket>? AND bucket<?)"),
+    ("rollup_combine", rollup_combine_sql("1h", "1m"), (0, "d17", "co2", "Before Scrub", 0, 1),
+     "SEARCH rollup_1m USING PRIMARY KEY (project=? AND sensor_type=? AND asset_name=? AND bucket>? AND bucket<?)"),
+]
+
+
+def all_query_plans():
+    # รวม query ของ ledger / upload jobs (import ตอนเรียก: โมดูลเหล่านั้น import db)
+    from controller import jobs, ledger
+    return QUERY_PLANS + ledger.QUERY_PLANS + jobs.QUERY_PLANS
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    # อัปเกรด DB เดิมแบบ in-place ทีละเวอร์ชัน แต่ละ step อยู่ใน transaction ของตัวเอง
+    current = schema_version(conn)
+    applied = []
+    for version, description, statements in MIGRATIONS:
+        if version <= current:
+            continue
+        with conn:
+            conn.execute("BEGIN")
+            for sql in statements:
+                if callable(sql):
+                    sql(conn)
+                else:
+                    conn.execute(sql)
+            conn.execute(f"PRAGMA user_version = {version}")
+        applied.append((version, description))
+    return applied
+
+
+def connect(db_path=DB_PATH):
+    conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+    # WAL: reader ไม่ต้องรอ writer (upload) และ writer ไม่ block reader
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    return conn
+
+
+class ConnectionPool:
+    # pool ของ connection ที่ตั้งค่าแล้ว ใช้ซ้ำข้าม request/thread
+    # ถ้า pool ว่างจะเปิด connection ใหม่ (ไม่ block) แต่เก็บคืนไว้ไม่เกิน size
+    def __init__(self, db_path=DB_PATH, size=POOL_SIZE):
+        self.db_path = db_path
+        self.size = size
+        self._idle = queue.LifoQueue()
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return connect(self.db_path)
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        if self._idle.qsize() >= self.size:
+            conn.close()
+        else:
+            self._idle.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path=DB_PATH):
+    with _pools_lock:
+        pool = _pools.get(db_path)
+        if pool is None:
+            pool = _pools[db_path] = ConnectionPool(db_path)
+        return pool
+
+
+@contextmanager
+def connection(db_path=DB_PATH):
+    pool = get_pool(db_path)
+    conn = pool.acquire()
+    try:
+        yield conn
+    finally:
+        pool.release(conn)
+
+
+def data_version(conn):
+    # เพิ่มขึ้นทุกครั้งที่มีการ ingest (ข้าม process ได้เพราะเก็บใน DB)
+    row = conn.execute("SELECT value FROM meta WHERE key = 'data_version'").fetchone()
+    return row[0] if row else 0
+
+
+def bump_data_version(conn):
+    conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'data_version'")
+
+
+def update_catalog(conn, rows):
+    # rows = iterable ของ tuple ตามลำดับ CATALOG_COLUMNS
+    conn.executemany(
+        f"INSERT OR IGNORE INTO sensor_catalog ({', '.join(CATALOG_COLUMNS)}) "
+        f"VALUES ({', '.join('?' * len(CATALOG_COLUMNS))})",
+        rows,
+    )
+
+
+## จำนวน key ต่อหนึ่ง SELECT ... IN (...) ตอน resolve อุปกรณ์/label ทีละชุด
+RESOLVE_BATCH = 500
+
+
+def _select_in(conn, sql, values):
+    # sql มี {marks} ตรง IN (...) ; รันทีละ RESOLVE_BATCH ค่า แล้วรวมแถวผลลัพธ์
+    rows = []
+    for i in range(0, len(values), RESOLVE_BATCH):
+        chunk = values[i:i + RESOLVE_BATCH]
+        rows.extend(conn.execute(sql.format(marks=", ".join("?" * len(chunk))), chunk).fetchall())
+    return rows
+
+
+def find_devices(conn, keys):
+    # device key ('' แทน NULL) -> (id, attribute ตามลำดับ DEVICE_ATTRIBUTES) ของอุปกรณ์ที่มีอยู่แล้ว
+    return {row[0]: (row[1], tuple(row[2:])) for row in _select_in(conn, SQL_FIND_DEVICES, keys)}
+
+
+def resolve_devices(conn, rows):
+    # rows = tuple ตามลำดับ DEVICE_ATTRIBUTES (หนึ่งแถวต่อ device_id) -> id ใน devices
+    # อุปกรณ์ใหม่ถูกเพิ่ม ; อุปกรณ์เดิมที่ attribute เปลี่ยนถูกอัปเดต -> คืน (ids, [(attribute เดิม, ใหม่)])
+    # attribute ที่เป็น NULL (เช่น live message ที่ส่งมาแค่บางช่อง) ไม่เขียนทับค่าเดิม
+    # แปลงเป็น str ให้ค่าที่เทียบตรงกับที่ TEXT affinity เก็บไว้ (เช่น device_id 123 -> '123') ; NaN -> NULL
+    # ค้น/เพิ่ม/อัปเดตทีละชุด ไม่ใช่ query ต่ออุปกรณ์ (live flush หนึ่งครั้งมีได้หลายพันอุปกรณ์)
+    key = DEVICE_ATTRIBUTES.index(DEVICE_KEY)
+    rows = [tuple(None if v is None or (isinstance(v, float) and math.isnan(v)) else str(v) for v in row)
+            for row in rows]
+    keys = [row[key] or "" for row in rows]
+    found = find_devices(conn, keys)
+    new = [row for k, row in zip(keys, rows) if k not in found]
+    if new:
+        conn.executemany(
+            f"INSERT INTO devices ({', '.join(DEVICE_ATTRIBUTES)}) VALUES ({', '.join('?' * len(DEVICE_ATTRIBUTES))})",
+            new,
+        )
+        found.update(find_devices(conn, [row[key] or "" for row in new]))
+    merged = [tuple(o if n is None else n for n, o in zip(row, found[k][1])) for k, row in zip(keys, rows)]
+    updates = [(k, row) for k, row in zip(keys, merged) if found[k][1] != row]
+    conn.executemany(
+        f"UPDATE devices SET {', '.join(c + ' = ?' for c in DEVICE_ATTRIBUTES)} WHERE id = ?",
+        ((*row, found[k][0]) for k, row in updates),
+    )
+    return [found[k][0] for k in keys], [(found[k][1], row) for k, row in updates]
+
+
+def resolve_labels(conn, column, names):
+    # ชื่อ sensor_type / operation -> id ในตาราง lookup ของคอลัมน์นั้น
+    table, _ = LABEL_TABLES[column]
+    conn.executemany(f"INSERT OR IGNORE INTO {table} (name) VALUES (?)", ((name,) for name in names))
+    ids = dict(_select_in(conn, SQL_FIND_LABELS.replace("{table}", table), names))
+    # ชื่อที่ไม่ใช่ str (เช่น project เป็นตัวเลขจาก xlsx) ถูกเก็บเป็น TEXT -> ค้นทีละตัวด้วย affinity ของ SQLite
+    return [ids[name] if name in ids else conn.execute(f"SELECT id FROM {table} WHERE name = ?", (name,)).fetchone()[0]
+            for name in names]
+
+
+def rebuild_catalog(conn):
+    # หลังลบ partition: สร้าง sensor_catalog ใหม่จากข้อมูลที่เหลือ
+    conn.execute("DELETE FROM sensor_catalog")
+    for _, name in list_partitions(conn):
+        conn.execute(f"INSERT OR IGNORE INTO sensor_catalog ({', '.join(CATALOG_COLUMNS)}) {series_sql(name)}")
+
+
+def _archive_partition(conn, name):
+    # partition -> layout เดิมใน archive (ไฟล์ archive ใช้ได้เองโดยไม่ต้องมี devices)
+    # report_time สร้างกลับจาก timestamp (ms, UTC)
+    _create_legacy_partition(conn, name, schema="archive")
+    columns = [r[1] for r in conn.execute(f"PRAGMA archive.table_info({name})")]
+    selected = {
+        "report_time": "strftime('%Y-%m-%d %H:%M:%S', f.timestamp / 1000, 'unixepoch')",
+    }
+    conn.execute(f"""
+        INSERT OR IGNORE INTO archive.{name} ({", ".join(columns)})
+        SELECT {", ".join(selected.get(c) or column_sql(c) for c in columns)}
+        FROM main.{name} AS f
+        JOIN devices AS d ON d.id = f.device_fk
+        JOIN sensor_types ON sensor_types.id = f.sensor_code
+        LEFT JOIN projects ON projects.id = f.project_code
+        LEFT JOIN operations ON operations.id = f.operation_code
+    """)
+
+
+def apply_retention(conn, keep_months=RETENTION_MONTHS, archive_dir=RETENTION_ARCHIVE_DIR, now_ms=None):
+    # เก็บเดือนปัจจุบัน + ย้อนหลัง keep_months - 1 เดือน; partition ที่เก่ากว่านั้นถูก DROP ทั้งตาราง
+    # (ไม่ต้อง DELETE ทีละแถว) หรือ copy ไปไฟล์ <archive_dir>/<partition>.db ก่อน drop
+    if keep_months <= 0:
+        return []
+    key = month_key(now_ms if now_ms is not None else datetime.now(timezone.utc).timestamp() * 1000)
+    year, month = divmod(key, 100)
+    first = year * 12 + month - 1 - (keep_months - 1)
+    cutoff, _ = month_bounds((first // 12) * 100 + first % 12 + 1)
+    expired = conn.execute(
+        "SELECT month, name, start_ms, end_ms FROM sensor_partitions WHERE end_ms <= ? ORDER BY month", (cutoff,)
+    ).fetchall()
+    if not expired:
+        return []
+    removed = []
+    for month, name, start_ms, end_ms in expired:
+        if archive_dir is not None:
+            os.makedirs(archive_dir, exist_ok=True)
+            path = os.path.join(archive_dir, f"{name}.db")
+            conn.execute("ATTACH DATABASE ? AS archive", (path,))
+            try:
+                with conn:
+                    _archive_partition(conn, name)
+            finally:
+                conn.execute("DETACH DATABASE archive")
+        with conn:
+            conn.execute(f"DROP TABLE {name}")
+            conn.execute("DELETE FROM sensor_partitions WHERE month = ?", (month,))
+            # bucket ของเดือนนั้น (เดือนเริ่ม/จบที่ต้นวัน -> ทุก resolution อยู่ในช่วงพอดี) ไม่ให้อ่านข้อมูลที่ลบไปแล้ว
+            for resolution, _ in ROLLUP_RESOLUTIONS:
+                conn.execute(
+                    f"DELETE FROM {rollup_table(resolution)} WHERE bucket >= ? AND bucket < ?", (start_ms, end_ms)
+                )
+        removed.append(name)
+    with conn:
+        rebuild_catalog(conn)
+        bump_data_version(conn)
+    return removed
+
+
+def init_db(db_path=DB_PATH):
+    conn = connect(db_path)
+    try:
+        for version, description in migrate(conn):
+            print(f"✅ migration {version}: {description}")
+    finally:
+        conn.close()
+
+
+def explain(conn, sql, params=()):
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+def check_plan(plan, expected):
+    # ปัญหาของ plan หนึ่ง: ไม่ได้ค้นด้วย index/เงื่อนไขที่คาดไว้ หรือ sort ด้วย temp b-tree
+    problems = []
+    if expected is not None and expected not in plan:
+        problems.append(f"expected {expected!r}")
+    for detail in plan:
+        if "TEMP B-TREE FOR ORDER BY" in detail:
+            problems.append(detail)
+        if "TEMP B-TREE FOR DISTINCT" in detail and expected is not None:
+            problems.append(detail)
+    return problems
+
+
+def check_query_plans(conn, plans=None):
+    # regression check ของทุก query ที่ service ใช้ -> [(name, ปัญหา)]
+    problems = []
+    for name, sql, params, expected in all_query_plans() if plans is None else plans:
+        problems.extend((name, problem) for problem in check_plan(explain(conn, sql, params), expected))
+    return problems
+
+
+if __name__ == "__main__":
+    # python -m controller.db [migrate|explain|compact|retain] [db_path]
+    command = sys.argv[1] if len(sys.argv) > 1 else "migrate"
+    db_path = sys.argv[2] if len(sys.argv) > 2 else DB_PATH
+    if command == "migrate":
+        init_db(db_path)
+    elif command == "explain":
+        with connection(db_path) as conn:
+            migrate(conn)
+            for name, sql, params, _ in all_query_plans():
+                print(name)
+                for detail in explain(conn, sql, params):
+                    print(f"    {detail}")
+            problems = check_query_plans(conn)
+        for name, detail in problems:
+            print(f"❌ {name}: {detail}")
+        sys.exit(1 if problems else 0)
+    elif command == "compact":
+        # one-time: ลบแถวซ้ำของ DB เดิม (migration 3 ก็เรียกให้อัตโนมัติ) แล้วคืนพื้นที่ไฟล์
+        with connection(db_path) as conn:
+            before = count_rows(conn)
+            migrate(conn)
+            with conn:
+                for _, name in list_partitions(conn):
+                    compact_duplicates(conn, name)
+            after = count_rows(conn)
+            conn.execute("VACUUM")
+        print(f"✅ removed {before - after} duplicate rows")
+    elif command == "retain":
+        # RETENTION_MONTHS=12 [RETENTION_ARCHIVE_DIR=archive] python -m controller.db retain
+        with connection(db_path) as conn:
+            migrate(conn)
+            removed = apply_retention(conn)
+        for name in removed:
+            print(f"✅ {'archived' if RETENTION_ARCHIVE_DIR else 'dropped'} {name}")
+        print(f"✅ {len(removed)} partitions removed (keep {RETENTION_MONTHS} months)")
+    else:
+        sys.exit(f"unknown command {command!r}; use migrate, explain, compact or retain")
@@ -0,0 +1,81 @@
+import io
+import pandas as pd
+
+## format ของ /backend_c/get ที่ต้องอ่านทุกแถวก่อนค่อย encode (ไม่ใช่ stream)
+TABULAR_FORMATS = ("json", "columnar", "arrow", "parquet")
+
+## คอลัมน์ string ที่ซ้ำกันเกือบทุกแถว -> dictionary-encode
+DICTIONARY_COLUMNS = (
+    "data_type",
+    "asset_number",
+    "asset_name",
+    "system",
+    "install_location",
+    "device_type",
+    "device_id",
+    "project",
+    "sensor_type",
+)
+
+MIMETYPES = {
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def transpose(rows, columns):
+    # tuple ของแถว -> tuple ของคอลัมน์ (zip ทำใน C ไม่สร้าง dict ต่อแถว)
+    if not rows:
+        return {name: () for name in columns}
+    return dict(zip(columns, zip(*rows)))
+
+
+def columnar_payload(rows, columns):
+    # {"columns": [...], "data": {col: values|codes}, "dictionaries": {col: [...]}}
+    # คอลัมน์ใน dictionaries ส่งเป็น code (index ใน dictionary), -1 = null
+    data = {}
+    dictionaries = {}
+    for name, values in transpose(rows, columns).items():
+        if name in DICTIONARY_COLUMNS:
+            codes, uniques = pd.factorize(pd.Series(values, dtype=object))
+            data[name] = codes.tolist()
+            dictionaries[name] = uniques.tolist()
+        else:
+            data[name] = list(values)
+    return {"columns": list(columns), "data": data, "dictionaries": dictionaries}
+
+
+def arrow_table(rows, columns):
+    import pyarrow as pa
+
+    arrays = []
+    for name, values in transpose(rows, columns).items():
+        arr = pa.array(values)
+        if name in DICTIONARY_COLUMNS and pa.types.is_string(arr.type):
+            arr = arr.dictionary_encode()
+        arrays.append(arr)
+    return pa.Table.from_arrays(arrays, names=list(columns))
+
+
+def encode_binary(rows, columns, output):
+    # Arrow IPC stream หรือ Parquet (ต้องมี pyarrow)
+    table = arrow_table(rows, columns)
+    sink = io.BytesIO()
+    if output == "arrow":
+        import pyarrow as pa
+
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        import pyarrow.parquet as pq
+
+        pq.write_table(table, sink)
+    return sink.getvalue()
+
+
+def has_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
@@ -1,5 +1,8 @@
+import numpy as np
 import pandas as pd
 import re
+import warnings
+from controller.calibration import get_registry
 pd.set_option('display.max_columns', None)
 ## setup format
 num_re = re.compile(r'[-+]?\d*\.?\d+(?:[eE][-+]?\d+)?')
@@ -53,51 +56,68 @@ def pretty_label_from_key(normalized_key: str) -> str:
     return normalized_key.lower()
 
 def adjust_co2(sensor_type, is_param, value):
-    # print(sensor_type, is_param, value)
-    if is_param.lower() == "co2" or is_param == "co2 level scrub mode" or is_param == "co2 level enable scrub mode":
-        # print(sensor_type, is_param, value)
-        if sensor_type == "Before Scrub":
-            # print(55.215733 + (1.072297996 * value))
-            return 55.215733 + (1.072297996 * value)
-        elif sensor_type == "Interlock 4C":
-            # print(16.238157 + (1.048766343 * value))
-            return 16.238157 + (1.048766343 * value)
-        elif sensor_type == "After Scrub":
-            # print(52.831276 + (1.06400140 * value))
-            return 52.831276 + (1.06400140 * value)
-        else:
-            return value
-    else:
-        return value
+    # sensor_type = asset name (เช่น "Before Scrub"), is_param = ชื่อ sensor
+    return get_registry().calibrate(sensor_type, is_param.lower(), value)
 
 def convert_operation(asset_name, operation, v):
-    
-    if asset_name == "Interlock 4C":
-        if operation == "hlr operation mode":
-            # print(asset_name, operation, v)
-            if int(v) == 0:
-                return "manual_mode"
-            elif int(v) == 1:
-                return "standby_mode"
-            elif int(v) == 2:
-                return "scrubbing_mode"
-            elif int(v) == 3:
-                return "regen_mode"
-            elif int(v) == 4:
-                return "cooldown_mode"
-            elif int(v) == 5:
-                return "alarming"
-            else: 
-                return f"operation_code {v}"
-        else:
-            return "No operation detect"
-    else:
-        if asset_name == "Before Scrub":
-            return "before_scrub"
-        elif asset_name == "After Scrub":
-            return "after_scrub"
-        else:
-            return "none"
+    return get_registry().operation(asset_name, operation, v)
+
+## ตัวคั่นแบบ full-width -> ตัวคั่นมาตรฐาน (เหมือน normalize_content) ในการแทนที่ครั้งเดียว
+CONTENT_TRANSLATE = str.maketrans({"，": ";", ",": ";", "：": ":"})
+## token เวลา (hh:mm) ที่เป็น token แรกที่ไม่ว่างของแถว = content_time ไม่ใช่ค่า sensor
+LEADING_TIME_RE = r"^[\s;]*\d{1,2}:\d{2}\s*(?:;|$)"
+## key:value -> (key, ตัวเลขแรกใน value) ในการ extract ครั้งเดียว ; token ที่ไม่มี ":" ได้ NaN
+TOKEN_RE = rf"^([^:]*):(?:.*?({num_re.pattern}))?"
+
+def parse_content_column(content: pd.Series) -> pd.DataFrame:
+    # เวอร์ชัน vectorized ของ parse_content_row ทั้งคอลัมน์ -> long (row, sensor_type, value)
+    # row = ตำแหน่งแถว (positional) ใน content
+    content = pd.Series(content.to_numpy(), index=np.arange(len(content)))
+    content = content[content.notna()]
+    if content.empty:
+        return pd.DataFrame({"row": pd.Series(dtype="int64"),
+                             "sensor_type": pd.Series(dtype="object"),
+                             "value": pd.Series(dtype="float64")})
+
+    s = (
+        content.astype(str)
+        .str.translate(CONTENT_TRANSLATE)
+        .str.replace(LEADING_TIME_RE, "", n=1, regex=True)
+    )
+    parts = s.str.split(";").explode()
+    # token ซ้ำกันมาก (alarm/status 0/1) -> extract เฉพาะ token ที่ไม่ซ้ำแล้ว map กลับด้วย code
+    token_codes, tokens = pd.factorize(parts)
+    kv = pd.Series(tokens, dtype=object).str.extract(TOKEN_RE)
+    rows = parts.index.to_numpy()
+    keep = (token_codes >= 0) & kv[0].notna().to_numpy()[token_codes]
+    rows, token_codes = rows[keep], token_codes[keep]
+
+    # normalize key เฉพาะค่าที่ไม่ซ้ำ (มีไม่กี่สิบชื่อ) แล้ว map กลับด้วย code
+    codes, uniques = pd.factorize(kv[0])
+    names = (
+        pd.Series(uniques, dtype=object)
+        .str.strip()
+        .str.lower()
+        .str.replace(r"\s+", " ", regex=True)
+        .str.replace("₂", "2", regex=False)
+    )
+    # หลาย key ดิบอาจ normalize เป็นชื่อเดียวกัน -> ใช้ code ของชื่อหลัง normalize
+    name_codes, names = pd.factorize(names)
+    key_order = name_codes[codes[token_codes]]
+
+    long_df = pd.DataFrame({
+        "row": rows,
+        # ลำดับ key ตามที่พบครั้งแรก ให้ตรงกับลำดับคอลัมน์ของ .apply(pd.Series)
+        "key_order": key_order,
+        "sensor_type": names.to_numpy(dtype=object)[key_order],
+        "value": kv[1].astype(float).to_numpy()[token_codes],
+    })
+    long_df = long_df[long_df["sensor_type"] != "content_time"]
+    # key ซ้ำในแถวเดียวกัน -> ค่าหลังสุดชนะ (เหมือน dict)
+    long_df = long_df.drop_duplicates(subset=["row", "key_order"], keep="last")
+    long_df = long_df[long_df["value"].notna()]
+    long_df = long_df.sort_values(["row", "key_order"], kind="stable")
+    return long_df.drop(columns=["key_order"]).reset_index(drop=True)
 
 def cleaning_data(df: pd.DataFrame):
     # หา Content + Report time แบบ case-insensitive
@@ -108,94 +128,131 @@ def cleaning_data(df: pd.DataFrame):
     report_col = next((c for c in df.columns if str(c).strip().lower() == "report time"), None)
     has_report_time = report_col is not None
 
-    parsed = df[content_col].apply(parse_content_row).apply(pd.Series)
-
-    long_records = []
-    for idx, row in parsed.iterrows():
-        report_time_val = df.iloc[idx][report_col] if has_report_time else None
-        for k, v in row.items():
-            if k == "content_time":
-                continue
-            if v is None or (isinstance(v, float) and pd.isna(v)):
-                continue
-            canon_label =pretty_label_from_key(k)
-            # print(df.iloc[idx]["Asset name"] )
-            data_convert = adjust_co2(df.iloc[idx]["Asset name"], canon_label, float(v))
-            operation_name = convert_operation(df.iloc[idx]["Asset name"], canon_label, v)
-            # print(operation_name)
-            long_records.append({
-                "row_index": idx,
-                "report_time": report_time_val,
-                "content_time": row.get("content_time"),
-                "sensor_type": canon_label,
-                "operation": operation_name,
-                "value_raw": float(v),
-                "value": float(data_convert),
-            })
-
-    df_extract = pd.DataFrame(long_records, columns=[
-        "row_index", "report_time", "content_time", "sensor_type", "operation", "value_raw", "value"
-    ])
-    df_extract = df_extract.drop(columns=["content_time", "row_index"])
+    registry = get_registry()
+    parsed = parse_content_column(df[content_col])
+    rows = parsed["row"].to_numpy()
+
+    asset_name = pd.Series(df["Asset name"].to_numpy()[rows])
+    sensor_type = parsed["sensor_type"].str.lower()
+    value_raw = parsed["value"]
+
+    df_extract = pd.DataFrame({
+        "row_index": rows,
+        "report_time": df[report_col].to_numpy()[rows] if has_report_time else None,
+        "sensor_type": sensor_type,
+        "operation": registry.operation_column(asset_name, sensor_type, value_raw),
+        "value_raw": value_raw,
+        "value": registry.calibrate_column(asset_name, sensor_type, value_raw),
+    }, columns=["row_index", "report_time", "sensor_type", "operation", "value_raw", "value"])
 
     return df_extract
 
 
+## รูปแบบ Report time ของไฟล์ export; ค่าที่ไม่ตรงจะ parse ซ้ำแบบ mixed เฉพาะแถวนั้น
+REPORT_TIME_FORMAT = "ISO8601"
+UTC_EPOCH = pd.Timestamp(0, tz="UTC")
+
+
+def _parse_report_time(values: pd.Series) -> pd.Series:
+    # parse ด้วย format คงที่โดยไม่ระบุ utc: ผลเป็น datetime แบบไม่มี tz ก็ต่อเมื่อไม่มีแถวไหนมี offset เลย
+    # (มี offset -> dtype มี tz หรือ error/warning เรื่อง mixed time zones)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", FutureWarning)
+        try:
+            dt = pd.to_datetime(values, format=REPORT_TIME_FORMAT, errors="coerce")
+        except ValueError:
+            return None
+    if isinstance(dt.dtype, pd.DatetimeTZDtype) or not pd.api.types.is_datetime64_dtype(dt):
+        return None
+    return dt.dt.tz_localize("UTC")
+
+
+def report_time_to_ms(values: pd.Series) -> pd.Series:
+    # Report time -> epoch ms (float, NaN ถ้า parse ไม่ได้)
+    # เวลาที่มี offset (เช่น +07:00) แปลงเป็น UTC, เวลาที่ไม่มี offset ถือเป็น UTC
+    if pd.api.types.is_datetime64_any_dtype(values):
+        dt = pd.to_datetime(values, utc=True)
+    else:
+        dt = _parse_report_time(values)
+        if dt is None:
+            # มีแถวที่มี offset: format คงที่จะใช้ offset ของแถวก่อนหน้ากับแถวที่ไม่มี offset -> parse แบบ mixed ทั้งคอลัมน์
+            dt = pd.to_datetime(values, format="mixed", errors="coerce", utc=True)
+        bad = dt.isna() & values.notna()
+        if bad.any():
+            # ไม่ assign ลง dt ตรงๆ: dt อาจเป็น view ของ .dt accessor -> ค่าที่ assign ถูกทิ้ง (SettingWithCopyWarning)
+            dt = dt.mask(bad, pd.to_datetime(values[bad], format="mixed", errors="coerce", utc=True))
+    return (dt - UTC_EPOCH) // pd.Timedelta(milliseconds=1)
+
+
 def merged_function(df_full, df_extract):
-    report_col_left = next((c for c in df_full.columns if str(c).strip().lower() == "report time"), None)
-    if report_col_left is None:
+    # ต่อ metadata ของแถวต้นทางด้วย row_index (ตำแหน่งแถวใน df_full) แทนการ join ด้วย Report time
+    # -> ไม่เกิด fan-out เมื่อหลายแถว/หลายอุปกรณ์มี Report time เดียวกัน
+    report_col = next((c for c in df_full.columns if str(c).strip().lower() == "report time"), None)
+    if report_col is None:
         raise ValueError(f"df_bf_sc ไม่มีคอลัมน์ 'Report time' (found: {list(df_full.columns)})")
+    if "row_index" not in df_extract.columns:
+        raise ValueError(f"df_extract ไม่มีคอลัมน์ 'row_index' (found: {list(df_extract.columns)})")
 
-    report_col_right = next((c for c in df_extract.columns if str(c).strip().lower() == "report_time"), None)
-    if report_col_right is None:
-        raise ValueError(f"df_extract ไม่มีคอลัมน์ 'report_time' (found: {list(df_extract.columns)})")
+    rows = df_extract["row_index"].to_numpy()
+    # parse เวลาครั้งเดียวต่อแถวต้นทาง แล้วค่อยกระจายไปยังแถว long
+    timestamp = report_time_to_ms(df_full[report_col]).to_numpy()[rows]
 
-    left = df_full.copy()
-    right = df_extract.copy()
-    left["_rt_key"]  = pd.to_datetime(left[report_col_left],  errors="coerce")
-    right["_rt_key"] = pd.to_datetime(right[report_col_right], errors="coerce")
+    meta_cols = [c for c in df_full.columns if str(c).strip().lower() != "content"]
+    merged_before_scrub = df_full[meta_cols].iloc[rows].reset_index(drop=True)
+    for col in ["sensor_type", "operation", "value_raw", "value"]:
+        merged_before_scrub[col] = df_extract[col].to_numpy()
+    merged_before_scrub["timestamp"] = timestamp
 
-    merged_before_scrub = left.merge(
-        right[["_rt_key", "sensor_type", "operation","value_raw", "value"]],  
-        on="_rt_key",
-        how="left"
-    ).drop(columns=["_rt_key"])
+    merged_before_scrub = merged_before_scrub[merged_before_scrub['sensor_type'] != "1"]
+    return merged_before_scrub
 
-    merged_before_scrub["timestamp"] = (
-        pd.to_datetime(merged_before_scrub["Report time"], errors="coerce").astype("int64") // 10**6)
 
-    merged_before_scrub = merged_before_scrub[merged_before_scrub['sensor_type'] != "1"]
-    # print("merged_before_scrub")
-    # print(merged_before_scrub[merged_before_scrub['sensor_type'] == 'hlr operation mode'])
-    return merged_before_scrub.drop(columns=['Content'])
+## sensor ที่เก็บเป็นแถว (long); sensor อื่นกลายเป็นคอลัมน์ wide (alarm/status) ต่อ (อุปกรณ์, timestamp)
+SELECT_SENSOR_TYPES = ("co2", "voc", "temperature", "humidity")
+## คอลัมน์ wide ที่ไม่ต้องการ (ค่าซ้ำกับแถว long หรือเป็นค่าวินิจฉัยของอุปกรณ์)
+DROP_WIDE_COLUMNS = ("co2", "temperature", "humidity", "rssi", "voltage", "version_number")
+DROP_WIDE_COLUMNS_INLET = DROP_WIDE_COLUMNS + ("voc", "diff_pressure")
+## คอลัมน์ที่แยกอุปกรณ์ในไฟล์เดียวกัน (ตรงกับ DEVICE_KEY ของ controller.db)
+WIDE_DEVICE_KEY = "device_id"
 
 
 def extract_columns(df: pd.DataFrame):
-    select_sensor_type = ["co2","voc","temperature","humidity", "diff_pressure"]
-
-    df["sensor_type"] = (
-        df["sensor_type"]
+    # normalize เฉพาะค่าที่ไม่ซ้ำ (มีไม่กี่สิบชื่อ) แล้ว map กลับทั้งคอลัมน์
+    codes, uniques = pd.factorize(df["sensor_type"])
+    uniques = (
+        pd.Series(uniques)
         .str.strip()
         .str.lower()
         .str.replace(" ", "_")
         .str.replace("-", "_")
     )
+    df["sensor_type"] = np.where(codes >= 0, uniques.to_numpy()[codes], None)
+    is_inlet = df["install_location"].iloc[0] == "Inlet"
+    drop = DROP_WIDE_COLUMNS_INLET if is_inlet else DROP_WIDE_COLUMNS
 
-    df_wide = df.pivot_table(
-        index='timestamp',           
-        columns='sensor_type',     
-        values='value',             
-        aggfunc='first'            
-    ).reset_index()
-
-    select_sensor_type = ["co2","voc","temperature","humidity"]
-    df = df[df["sensor_type"].isin(select_sensor_type)]
-    # df = df.drop(columns=['id'])
-    df_main = pd.merge(df, df_wide, on='timestamp',how='inner')
-    df_main = df_main.drop_duplicates()
-    if df_main['install_location'][0] == "Inlet":
-        df_main = df_main.drop(columns=['co2','temperature', 'humidity', 'rssi','voc', 'voltage', 'version_number', 'diff_pressure'])
-        return df_main
-    else:
-        df_main = df_main.drop(columns=['co2','temperature', 'humidity', 'rssi', 'voltage', 'version_number'])
-        return df_main
\ No newline at end of file
+    # ค่าแรกของแต่ละ (อุปกรณ์, timestamp, sensor_type) -> wide ด้วย unstack (แทน pivot_table + merge)
+    # key ต้องมีอุปกรณ์ด้วย ไม่งั้นไฟล์ Inlet ที่มีหลายอุปกรณ์จะได้ค่า alarm/status ของอุปกรณ์อื่นที่ timestamp เดียวกัน
+    device = df[WIDE_DEVICE_KEY].astype(object).where(df[WIDE_DEVICE_KEY].notna(), "")
+    keys = pd.DataFrame({
+        "device": device, "timestamp": df["timestamp"], "sensor_type": df["sensor_type"], "value": df["value"],
+    }).drop_duplicates(subset=["device", "timestamp", "sensor_type"])
+    keys = keys[~keys["sensor_type"].isin(drop)]
+    df_wide = keys.set_index(["device", "timestamp", "sensor_type"])["value"].unstack("sensor_type")
+    del keys
+
+    is_main = df["sensor_type"].isin(SELECT_SENSOR_TYPES)
+    df_main = df[is_main]
+    wide_cols = [c for c in df_wide.columns if c not in df_main.columns]
+    df_wide = df_wide[wide_cols]
+    df_wide.columns.name = None
+
+    if not wide_cols:
+        # อุปกรณ์ที่ส่งมาแค่ sensor หลัก (ไม่มีค่า alarm/status) -> ไม่มีอะไรให้ต่อ
+        return df_main.drop_duplicates().reset_index(drop=True)
+
+    # ต่อคอลัมน์ wide ตาม (อุปกรณ์, timestamp) ด้วย reindex: key ที่ไม่มีค่า wide (เช่นส่งมาแค่ co2) -> NaN
+    main_keys = pd.MultiIndex.from_arrays([device[is_main].to_numpy(), df_main["timestamp"].to_numpy()])
+    df_main = pd.concat(
+        [df_main.reset_index(drop=True), df_wide.reindex(main_keys).reset_index(drop=True)], axis=1
+    )
+    return df_main.drop_duplicates().reset_index(drop=True)
@@ -0,0 +1,379 @@
+import logging
+import os
+import time
+import numpy as np
+import pandas as pd
+from controller import catalog, ledger
+from controller.db import (
+    DB_PATH, CATALOG_COLUMNS, DEVICE_ATTRIBUTES, DEVICE_COLUMNS, DEVICE_KEY, LABEL_TABLES, bump_data_version,
+    connection, ensure_partition, rebuild_catalog, resolve_devices, resolve_labels, update_catalog,
+)
+from controller.helper import cleaning_data, merged_function, extract_columns
+from controller.rollup import rebuild_rollups, refresh_rollups
+
+logger = logging.getLogger(__name__)
+
+## จำนวนแถวต่อ chunk ตอนอ่านไฟล์ upload
+CHUNK_ROWS = 20000
+## calamine โหลดทั้ง sheet เข้า memory (peak ~13 เท่าของขนาดไฟล์ .xlsx) -> ใช้กับไฟล์เล็กเท่านั้น
+## .xlsx ที่ใหญ่กว่านี้ stream ด้วย openpyxl read-only (memory คงที่ตาม chunk)
+CALAMINE_MAX_BYTES = int(os.environ.get("CALAMINE_MAX_BYTES", str(2 * 1024 * 1024)))
+
+## คอลัมน์ของ partition (metadata/ชื่อ sensor ถูกแทนด้วย key ของ dimension ตอน insert)
+FACT_COLUMNS = [
+    "device_fk",
+    "project_code",
+    "timestamp",
+    "sensor_code",
+    "operation_code",
+    "value_raw",
+    "value",
+]
+
+## คอลัมน์ alarm/status (wide) ที่เก็บเฉพาะอุปกรณ์ Inlet
+STATUS_COLUMNS = [
+    "clean_air_damper_open_alarm",
+    "co2_level_enable_scrub_mode",
+    "co2_level_scrub_mode",
+    "exhaust_air_damper_open_alarm",
+    "fan_alarm",
+    "fan_speed",
+    "fire_alarm",
+    "high_temperature_alarm",
+    "hlr_connect_status",
+    "hlr_operation_mode",
+    "interlock_status",
+    "km1_no_feedback_alarm",
+    "service_door_alarm",
+    "switch_co2_state",
+    "switch_interlock_state",
+    "temp_before_filter",
+]
+
+## คอลัมน์ metadata ของไฟล์ export -> ชื่อที่เป็นไปได้ (lower-case)
+METADATA_COLUMNS = {
+    "data_type": ("data type", "datatype"),
+    "asset_number": ("asset number", "asset_number"),
+    "asset_name": ("asset name", "asset_name"),
+    "system": ("system",),
+    "install_location": ("install location", "install_location"),
+    "device_type": ("device type", "device_type"),
+    "device_id": ("device id", "device_id"),
+    "project": ("project", "project id", "project_id"),
+    "report_time": ("report time", "report_time"),
+}
+
+## คอลัมน์ที่อ่านจากไฟล์ (ที่เหลือไม่ถูกอ่านเลย)
+SOURCE_COLUMNS = {"content", *(c for cands in METADATA_COLUMNS.values() for c in cands)}
+
+SENSOR_RENAME = {
+    "duct co2": "co2",
+    "duct temperature": "temperature",
+    "duct humidity": "humidity",
+    "duct voc": "voc",
+}
+
+
+def add_stage_time(stages, name, t0):
+    # สะสมเวลาต่อ stage (วินาที) ลงใน dict ที่ caller ส่งมา
+    if stages is not None:
+        stages[name] = stages.get(name, 0.0) + (time.perf_counter() - t0)
+
+
+def find_col(df, *cands):
+    cands_l = [c.strip().lower() for c in cands]
+    for col in df.columns:
+        if str(col).strip().lower() in cands_l:
+            return col
+    return None
+
+
+def is_source_column(col):
+    return str(col).strip().lower() in SOURCE_COLUMNS
+
+
+def has_calamine():
+    try:
+        import python_calamine  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _calamine_cell(value):
+    # ให้ค่าตรงกับ openpyxl: cell ว่าง -> None, เลขจำนวนเต็ม (1.0) -> int
+    if value == "":
+        return None
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _iter_row_chunks(rows, chunksize):
+    # rows = iterator ของแถว (แถวแรกคือ header) -> DataFrame ทีละ chunk เฉพาะคอลัมน์ที่ใช้
+    header = next(rows, None)
+    if header is None:
+        return
+    keep = [i for i, c in enumerate(header) if c is not None and is_source_column(c)]
+    columns = [header[i] for i in keep]
+    buf = []
+    for row in rows:
+        values = [row[i] if i < len(row) else None for i in keep]
+        if all(v is None for v in values):
+            continue
+        buf.append(values)
+        if len(buf) >= chunksize:
+            yield pd.DataFrame.from_records(buf, columns=columns)
+            buf = []
+    if buf:
+        yield pd.DataFrame.from_records(buf, columns=columns)
+
+
+def iter_calamine_sheets(f):
+    # calamine (Rust) อ่าน .xlsx/.xls เร็วกว่า openpyxl หลายเท่า; yield (ชื่อ sheet, iterator ของแถว)
+    from python_calamine import CalamineWorkbook
+
+    wb = CalamineWorkbook.from_filelike(f)
+    for name in wb.sheet_names:
+        rows = wb.get_sheet_by_name(name).iter_rows()
+        yield name, ([_calamine_cell(v) for v in row] for row in rows)
+
+
+def file_size(f):
+    pos = f.tell()
+    size = f.seek(0, os.SEEK_END)
+    f.seek(pos)
+    return size
+
+
+def iter_calamine_chunks(f, chunksize=CHUNK_ROWS):
+    # sheet แรก ทีละ chunk (calamine อ่านทั้ง sheet ก่อน แต่ DataFrame สร้างทีละ chunk)
+    for _, rows in iter_calamine_sheets(f):
+        yield from _iter_row_chunks(rows, chunksize)
+        return
+
+
+def iter_excel_chunks(f, chunksize=CHUNK_ROWS):
+    # .xlsx sheet แรก ทีละ chunk: ไฟล์เล็กใช้ calamine (เร็ว) ไฟล์ใหญ่ใช้ openpyxl read-only (ไม่โหลดทั้ง workbook)
+    if has_calamine() and file_size(f) <= CALAMINE_MAX_BYTES:
+        yield from iter_calamine_chunks(f, chunksize)
+        return
+
+    from openpyxl import load_workbook
+
+    wb = load_workbook(f, read_only=True, data_only=True)
+    try:
+        yield from _iter_row_chunks(wb.worksheets[0].iter_rows(values_only=True), chunksize)
+    finally:
+        wb.close()
+
+
+def read_csv(f, chunksize=None):
+    # อ่านเฉพาะคอลัมน์ที่ใช้ เป็น string ทั้งหมด (ไม่ต้องเดา dtype; SQLite เก็บ metadata เป็น TEXT อยู่แล้ว)
+    return pd.read_csv(f, chunksize=chunksize, usecols=is_source_column, dtype=str)
+
+
+def read_sheets(f, filename):
+    # ทุก sheet ของไฟล์ -> {ชื่อ sheet: DataFrame} (csv -> {None: DataFrame})
+    filename = filename.lower()
+    if filename.endswith(".csv"):
+        return {None: read_csv(f)}
+    if has_calamine():
+        return {name: pd.concat(list(_iter_row_chunks(rows, CHUNK_ROWS)) or [pd.DataFrame()], ignore_index=True)
+                for name, rows in iter_calamine_sheets(f)}
+    return pd.read_excel(f, sheet_name=None, usecols=is_source_column)
+
+
+def iter_file_chunks(f, filename, chunksize=CHUNK_ROWS):
+    filename = filename.lower()
+    if filename.endswith(".xlsx"):
+        yield from iter_excel_chunks(f, chunksize)
+    elif filename.endswith(".xls") and has_calamine():
+        # .xls ไม่มีทางอ่านแบบ streaming อยู่แล้ว -> calamine ทุกขนาด (ยังเล็กกว่า xlrd + read_excel)
+        yield from iter_calamine_chunks(f, chunksize)
+    elif filename.endswith(".xls"):
+        # .xls (xlrd) ไม่มีโหมด streaming -> อ่านทั้ง sheet แล้วแบ่ง chunk
+        df = pd.read_excel(f, usecols=is_source_column)
+        for start in range(0, len(df), chunksize):
+            yield df.iloc[start:start + chunksize]
+    elif filename.endswith(".csv"):
+        yield from read_csv(f, chunksize)
+    else:
+        raise ValueError("unsupported file type; use .xlsx/.xls/.csv")
+
+
+def prepare_insert_frame(df_full: pd.DataFrame, stages=None):
+    # parse -> calibrate -> reshape สำหรับหนึ่ง chunk; คืน (df_insert, counts)
+    t0 = time.perf_counter()
+    df_extract = cleaning_data(df_full)
+    add_stage_time(stages, "parse", t0)
+
+    t0 = time.perf_counter()
+    merged = merged_function(df_full, df_extract)
+
+    col_map = {
+        **{db_col: find_col(merged, *cands) for db_col, cands in METADATA_COLUMNS.items()},
+        "timestamp": "timestamp" if "timestamp" in merged.columns else None,
+        "sensor_type": "sensor_type" if "sensor_type" in merged.columns else None,
+        "operation": "operation" if "operation" in merged.columns else None,
+        "value_raw": "value_raw" if "value_raw" in merged.columns else None,
+        "value": "value" if "value" in merged.columns else None,
+    }
+
+    df_insert = pd.DataFrame(index=merged.index)
+    for db_col, src_col in col_map.items():
+        if src_col is None:
+            df_insert[db_col] = None
+        else:
+            df_insert[db_col] = merged[src_col]
+
+    df_insert["value"] = pd.to_numeric(df_insert["value"], errors="coerce")
+    df_insert["value_raw"] = pd.to_numeric(df_insert["value_raw"], errors="coerce")
+
+    ## drop columns ที่ไม่มีข้อมูล  operation
+    before = len(df_insert)
+    df_insert = df_insert.dropna(subset=["sensor_type", "operation", "value_raw", "value", "timestamp"])
+    df_insert["timestamp"] = df_insert["timestamp"].astype("int64")
+    after = len(df_insert)
+    # print DataFrame ทั้งก้อนแพง -> ทำเฉพาะตอนเปิด LOG_LEVEL=DEBUG
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("hlr operation mode rows:\n%s", df_insert[df_insert["sensor_type"] == "hlr operation mode"])
+    df_insert["sensor_type"] = df_insert["sensor_type"].replace(SENSOR_RENAME)
+
+    counts = {
+        "received_rows": len(merged),
+        "prepared_rows": before,
+        "inserted_rows": after,
+        "skipped_rows": before - after,
+    }
+    add_stage_time(stages, "merge", t0)
+    if df_insert.empty:
+        return df_insert, counts
+
+    t0 = time.perf_counter()
+    df_insert = extract_columns(df_insert)
+    add_stage_time(stages, "reshape", t0)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("df_insert:\n%s", df_insert)
+    return df_insert, counts
+
+
+def fact_frame(conn, df_insert: pd.DataFrame):
+    # แทน metadata ของอุปกรณ์ด้วย device_fk และชื่อ project/sensor/operation ด้วย code (lookup เฉพาะค่าที่ไม่ซ้ำ)
+    # คืน (df_fact, อุปกรณ์ที่ attribute เปลี่ยน) ; attribute ของอุปกรณ์ใช้ค่าล่าสุดที่ไม่ว่างของแต่ละคอลัมน์ใน frame
+    group, keys = pd.factorize(df_insert[DEVICE_KEY].astype(object).where(df_insert[DEVICE_KEY].notna(), ""))
+    attributes = df_insert[list(DEVICE_ATTRIBUTES)].astype(object).groupby(group, sort=True).last()
+    device_ids, changed = resolve_devices(conn, attributes.itertuples(index=False, name=None))
+    df_fact = df_insert.drop(columns=[*DEVICE_COLUMNS, *LABEL_TABLES])
+    df_fact["device_fk"] = np.asarray(device_ids, dtype=np.int64)[group]
+    for column, (_, code_column) in LABEL_TABLES.items():
+        codes, names = pd.factorize(df_insert[column])
+        # code -1 (ค่าว่าง) -> None ตัวท้าย
+        ids = np.array(resolve_labels(conn, column, names.tolist()) + [None], dtype=object)
+        df_fact[code_column] = ids[codes]
+    return df_fact, changed
+
+
+def insert_rows(conn, df_insert: pd.DataFrame):
+    # คืน (จำนวนแถวที่เขียน, อุปกรณ์ที่ attribute เปลี่ยน)
+    if df_insert.empty:
+        return 0, []
+    columns = list(FACT_COLUMNS)
+    is_inlet = (df_insert["install_location"] == "Inlet").to_numpy()
+    if is_inlet.any():
+        columns += STATUS_COLUMNS
+    # ส่ง iterator ให้ executemany ตรงๆ ไม่สร้าง list ของทุกแถว
+    # แถวที่ natural key ซ้ำกับที่มีอยู่แล้วจะถูกข้าม -> upload ซ้ำได้โดยไม่เกิดข้อมูลซ้ำ
+    # อุปกรณ์ที่ไม่มี alarm/status บางตัว -> คอลัมน์นั้นเป็น NULL
+    # แยกแถวตามเดือน (UTC) แล้ว insert ลง partition sensor_data_YYYYMM ของเดือนนั้น
+    # frame ที่ปน Inlet กับอุปกรณ์อื่น (live flush) -> ค่า alarm/status ของอุปกรณ์อื่นเป็น NULL
+    df_fact, changed = fact_frame(conn, df_insert)
+    df_fact = df_fact.reindex(columns=columns)
+    if is_inlet.any() and not is_inlet.all():
+        df_fact.loc[~is_inlet, STATUS_COLUMNS] = None
+    ts = pd.to_datetime(df_fact["timestamp"], unit="ms", utc=True)
+    months = (ts.dt.year * 100 + ts.dt.month).to_numpy()
+    written = 0
+    for key, df_month in df_fact.groupby(months, sort=True):
+        table = ensure_partition(conn, int(key))
+        changes = conn.total_changes
+        conn.executemany(
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+            " ON CONFLICT DO NOTHING",
+            df_month.itertuples(index=False, name=None),
+        )
+        written += conn.total_changes - changes
+    return written, changed
+
+
+def write_frame(conn, df_insert: pd.DataFrame):
+    # insert + อัปเดต catalog/rollup/data_version ใน transaction เดียวกัน (caller เป็นคน commit)
+    written, changed = insert_rows(conn, df_insert)
+    if written:
+        update_catalog(conn, df_insert[list(CATALOG_COLUMNS)].drop_duplicates().itertuples(index=False, name=None))
+        refresh_rollups(conn, df_insert)
+    if changed:
+        # attribute ของอุปกรณ์เดิมเปลี่ยน (เช่นแก้ชื่อ asset) -> ทุกแถวของอุปกรณ์นั้นแสดงค่าใหม่
+        # catalog สร้างใหม่ ; rollup ของชื่อ asset เดิมและใหม่คำนวณใหม่ทั้งหมด
+        rebuild_catalog(conn)
+        asset = DEVICE_ATTRIBUTES.index("asset_name")
+        assets = {name for old, new in changed if old[asset] != new[asset] for name in (old[asset], new[asset])}
+        if assets:
+            rebuild_rollups(conn, asset_names=assets)
+    if written or changed:
+        bump_data_version(conn)
+    return written
+
+
+def ingest_file(f, filename, db_path=DB_PATH, chunksize=CHUNK_ROWS, on_chunk=None, sha256=None, size=None):
+    # read N rows -> parse/calibrate/reshape -> insert -> commit -> ซ้ำ
+    # on_chunk(totals) ถูกเรียกหลัง commit แต่ละ chunk (ใช้รายงาน progress)
+    # sha256 = hash ของไฟล์; ถ้าระบุจะบันทึกลง upload_ledger เมื่อ ingest ครบทั้งไฟล์
+    totals = {
+        "source_rows": 0,
+        "received_rows": 0,
+        "prepared_rows": 0,
+        "inserted_rows": 0,
+        "skipped_rows": 0,
+        "written_rows": 0,
+        "duplicate_rows": 0,
+    }
+    stages = {}
+    chunks = []
+    reader = iter_file_chunks(f, filename, chunksize)
+    with connection(db_path) as conn:
+        i = 0
+        while True:
+            t0 = time.perf_counter()
+            df_chunk = next(reader, None)
+            add_stage_time(stages, "read", t0)
+            if df_chunk is None:
+                break
+
+            df_insert, counts = prepare_insert_frame(df_chunk, stages)
+
+            t0 = time.perf_counter()
+            written = write_frame(conn, df_insert)
+            conn.commit()
+            add_stage_time(stages, "insert", t0)
+            if written:
+                catalog.invalidate()
+
+            counts = {
+                "chunk": i,
+                "source_rows": len(df_chunk),
+                **counts,
+                "written_rows": written,
+                "duplicate_rows": len(df_insert) - written,
+            }
+            chunks.append(counts)
+            for k in totals:
+                totals[k] += counts[k]
+            logger.info("upload %s: chunk %d done, %d source rows so far", filename, i, totals["source_rows"])
+            if on_chunk is not None:
+                on_chunk({**totals, "chunks": i + 1})
+            i += 1
+        if sha256 is not None:
+            with conn:
+                ledger.record(conn, sha256, filename, size, totals)
+    return {**totals, "stages": stages, "chunks": chunks}
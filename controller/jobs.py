@@ -0,0 +1,218 @@
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from controller import metrics
+from controller.db import DB_PATH, connection
+from controller.ingest import ingest_file
+
+logger = logging.getLogger(__name__)
+
+## ไฟล์ upload ถูกเก็บไว้ที่นี่จนกว่า job จะ ingest เสร็จ
+SPOOL_DIR = "upload_spool"
+UPLOAD_WORKERS = max((os.cpu_count() or 2) - 1, 1)
+
+JOB_COLUMNS = ("id", "filename", "state", "created_at", "started_at", "finished_at", "progress", "result", "error")
+
+## process ที่ submit job เป็นเจ้าของ (owner) และต่อ heartbeat_at ของ job ที่ยังไม่จบทุก JOB_HEARTBEAT_SECONDS
+## job ที่ heartbeat ขาดเกิน JOB_STALE_SECONDS (owner ตาย) ถูก process อื่น claim ไปทำต่อ
+JOB_HEARTBEAT_SECONDS = float(os.environ.get("JOB_HEARTBEAT_SECONDS", "10"))
+JOB_STALE_SECONDS = float(os.environ.get("JOB_STALE_SECONDS", "60"))
+
+SQL_CLAIM_JOB = (
+    "UPDATE upload_jobs SET state = 'running', started_at = ? "
+    "WHERE id = ? AND owner IS ? AND state IN ('queued', 'running')"
+)
+SQL_CLAIM_STALE = (
+    "UPDATE upload_jobs SET owner = ?, heartbeat_at = ?, state = 'queued' "
+    "WHERE state IN ('queued', 'running') AND IFNULL(heartbeat_at, 0) < ? RETURNING id"
+)
+SQL_HEARTBEAT = "UPDATE upload_jobs SET heartbeat_at = ? WHERE owner = ? AND state IN ('queued', 'running')"
+SQL_ACTIVE_JOB = (
+    "SELECT id FROM upload_jobs WHERE sha256 = ? AND state IN ('queued', 'running') ORDER BY id LIMIT 1"
+)
+SQL_GET_JOB = f"SELECT {', '.join(JOB_COLUMNS)} FROM upload_jobs WHERE id = ?"
+
+## (name, sql, ตัวอย่าง params, บรรทัดของ plan ที่ต้องมี) ดู controller.db.QUERY_PLANS
+JOB_STATE_PLAN = "SEARCH upload_jobs USING INDEX idx_upload_jobs_state (state=?)"
+QUERY_PLANS = [
+    ("job_claim", SQL_CLAIM_JOB, (0, 1, "owner"), "SEARCH upload_jobs USING INTEGER PRIMARY KEY (rowid=?)"),
+    ("job_claim_stale", SQL_CLAIM_STALE, ("owner", 0, 0), JOB_STATE_PLAN),
+    ("job_heartbeat", SQL_HEARTBEAT, (0, "owner"), JOB_STATE_PLAN),
+    ("job_active", SQL_ACTIVE_JOB, ("0" * 64,), "SEARCH upload_jobs USING INDEX idx_upload_jobs_sha256 (sha256=?)"),
+    ("job_get", SQL_GET_JOB, (1,), "SEARCH upload_jobs USING INTEGER PRIMARY KEY (rowid=?)"),
+]
+
+_executor = None
+_executor_lock = threading.Lock()
+_owner = {"pid": None, "id": None}
+_heartbeat = None
+
+
+def _set(db_path, job_id, **fields):
+    with connection(db_path) as conn:
+        with conn:
+            conn.execute(
+                f"UPDATE upload_jobs SET {', '.join(f'{k} = ?' for k in fields)} WHERE id = ?",
+                (*fields.values(), job_id),
+            )
+
+
+def owner_id():
+    # ต่อ process (fork แล้ว pid เปลี่ยน -> id ใหม่) ไม่ให้ worker ของ server หลายตัวใช้ owner เดียวกัน
+    if _owner["pid"] != os.getpid():
+        _owner.update(pid=os.getpid(), id=f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}")
+    return _owner["id"]
+
+
+def run_job(job_id, db_path=DB_PATH, owner=None):
+    # รันใน worker process: ingest ไฟล์ของ job แล้วบันทึกผล/เวลาแต่ละ stage ลง upload_jobs
+    # เริ่มได้เฉพาะเมื่อ job ยังเป็นของ owner ที่ส่งมา (ถูก process อื่น claim ไปแล้ว -> ข้าม)
+    # คืนผลให้ process หลักไปนับ metrics (registry ของ worker ไม่ถูก scrape)
+    with connection(db_path) as conn:
+        with conn:
+            claimed = conn.execute(SQL_CLAIM_JOB, (time.time(), job_id, owner)).rowcount
+        row = conn.execute("SELECT filename, path, sha256 FROM upload_jobs WHERE id = ?", (job_id,)).fetchone()
+    if not claimed or row is None:
+        return None
+    filename, path, sha256 = row
+    try:
+        with open(path, "rb") as f:
+            result = ingest_file(
+                f, filename, db_path,
+                on_chunk=lambda totals: _set(db_path, job_id, progress=json.dumps(totals)),
+                sha256=sha256, size=os.path.getsize(path),
+            )
+        _set(db_path, job_id, state="done", finished_at=time.time(), result=json.dumps(result))
+    except Exception as e:
+        logger.exception("upload job %s failed", job_id)
+        error = f"{type(e).__name__}: {e}"
+        _set(db_path, job_id, state="failed", finished_at=time.time(), error=error)
+        return {"error": error}
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+    return result
+
+
+def _record(future):
+    try:
+        result = future.result()
+    except Exception as e:
+        result = {"error": f"{type(e).__name__}: {e}"}
+    if result is not None:
+        metrics.observe_ingest(result, source="job")
+
+
+def _submit(job_id, db_path):
+    get_executor(db_path).submit(run_job, job_id, db_path, owner_id()).add_done_callback(_record)
+
+
+def get_executor(db_path=DB_PATH):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn: worker ไม่ได้ fork สถานะของ Flask/connection pool มาด้วย
+            _executor = ProcessPoolExecutor(
+                max_workers=UPLOAD_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+
+def claim_stale(conn, owner, now=None):
+    # job ที่ค้าง (queued/running) ซึ่ง owner ไม่ต่อ heartbeat เกิน JOB_STALE_SECONDS -> เป็นของ owner นี้
+    # UPDATE เดียว (atomic) -> server หลาย process claim job เดียวกันซ้ำไม่ได้
+    # ingest ซ้ำได้ปลอดภัยเพราะ insert เป็น ON CONFLICT DO NOTHING
+    now = time.time() if now is None else now
+    with conn:
+        rows = conn.execute(SQL_CLAIM_STALE, (owner, now, now - JOB_STALE_SECONDS)).fetchall()
+    return sorted(r[0] for r in rows)
+
+
+def heartbeat(conn, owner, now=None):
+    with conn:
+        conn.execute(SQL_HEARTBEAT, (time.time() if now is None else now, owner))
+
+
+def _resume(db_path):
+    # ต่อ heartbeat ของ job ตัวเอง แล้ว claim + submit job ค้างของ owner ที่ตายไปแล้ว
+    with connection(db_path) as conn:
+        heartbeat(conn, owner_id())
+        pending = claim_stale(conn, owner_id())
+    for job_id in pending:
+        logger.info("resuming upload job %s", job_id)
+        _submit(job_id, db_path)
+
+
+def _heartbeat_loop(db_path):
+    while True:
+        time.sleep(JOB_HEARTBEAT_SECONDS)
+        try:
+            _resume(db_path)
+        except Exception:
+            logger.exception("upload job heartbeat failed")
+
+
+def start(db_path=DB_PATH):
+    # เรียกครั้งเดียวตอน server เริ่ม: resume job ค้างทันที แล้วต่อ heartbeat/claim เป็นระยะ
+    global _heartbeat
+    with _executor_lock:
+        if _heartbeat is not None and _heartbeat.is_alive():
+            return
+        _heartbeat = threading.Thread(target=_heartbeat_loop, args=(db_path,), name="upload-jobs", daemon=True)
+    _resume(db_path)
+    _heartbeat.start()
+
+
+def active_job(conn, sha256):
+    # job ของไฟล์เนื้อหาเดียวกันที่ยังรอ/กำลังทำอยู่
+    row = conn.execute(SQL_ACTIVE_JOB, (sha256,)).fetchone()
+    return row[0] if row else None
+
+
+def submit(file_storage, filename, db_path=DB_PATH, sha256=None):
+    # ไฟล์เดียวกับที่อยู่ใน queue แล้ว -> คืน job เดิม
+    if sha256 is not None:
+        with connection(db_path) as conn:
+            job_id = active_job(conn, sha256)
+        if job_id is not None:
+            return job_id
+    os.makedirs(SPOOL_DIR, exist_ok=True)
+    path = os.path.join(SPOOL_DIR, uuid.uuid4().hex + os.path.splitext(filename)[1])
+    file_storage.save(path)
+    with connection(db_path) as conn:
+        with conn:
+            now = time.time()
+            cur = conn.execute(
+                "INSERT INTO upload_jobs (filename, path, state, created_at, sha256, owner, heartbeat_at) "
+                "VALUES (?, ?, 'queued', ?, ?, ?, ?)",
+                (filename, os.path.abspath(path), now, sha256, owner_id(), now),
+            )
+        job_id = cur.lastrowid
+    _submit(job_id, db_path)
+    return job_id
+
+
+def get_job(job_id, db_path=DB_PATH):
+    with connection(db_path) as conn:
+        row = conn.execute(SQL_GET_JOB, (job_id,)).fetchone()
+    if row is None:
+        return None
+    job = dict(zip(JOB_COLUMNS, row))
+    for key in ("progress", "result"):
+        if job[key] is not None:
+            job[key] = json.loads(job[key])
+    if job["result"] is not None:
+        job["stages"] = job["result"].pop("stages", None)
+    if job["started_at"] is not None:
+        job["queued_seconds"] = job["started_at"] - job["created_at"]
+    if job["finished_at"] is not None and job["started_at"] is not None:
+        job["run_seconds"] = job["finished_at"] - job["started_at"]
+    return job
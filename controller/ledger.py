@@ -0,0 +1,45 @@
+import hashlib
+import time
+
+## อ่านไฟล์ทีละ block ตอนคำนวณ hash
+HASH_BLOCK = 1024 * 1024
+
+LEDGER_COLUMNS = ("sha256", "filename", "size", "ingested_at", "source_rows", "written_rows")
+
+
+def file_sha256(f):
+    # hash ของเนื้อไฟล์ทั้งไฟล์ แล้วย้อนตำแหน่งกลับไปที่เดิม (ไฟล์ยังต้องถูกอ่านต่อ)
+    pos = f.tell()
+    h = hashlib.sha256()
+    size = 0
+    for block in iter(lambda: f.read(HASH_BLOCK), b""):
+        h.update(block)
+        size += len(block)
+    f.seek(pos)
+    return h.hexdigest(), size
+
+
+def bytes_sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+SQL_LOOKUP = f"SELECT {', '.join(LEDGER_COLUMNS)} FROM upload_ledger WHERE sha256 = ?"
+
+## (name, sql, ตัวอย่าง params, บรรทัดของ plan ที่ต้องมี) ดู controller.db.QUERY_PLANS
+QUERY_PLANS = [
+    ("ledger_lookup", SQL_LOOKUP, ("0" * 64,), "SEARCH upload_ledger USING PRIMARY KEY (sha256=?)"),
+]
+
+
+def lookup(conn, sha256):
+    # ไฟล์เนื้อหาเดียวกันเคย ingest สำเร็จแล้วหรือยัง -> dict ของ ledger หรือ None
+    row = conn.execute(SQL_LOOKUP, (sha256,)).fetchone()
+    return dict(zip(LEDGER_COLUMNS, row)) if row else None
+
+
+def record(conn, sha256, filename, size, result):
+    # บันทึกหลัง ingest ครบทั้งไฟล์แล้วเท่านั้น (ไฟล์ที่ fail กลางทางจะ upload ซ้ำได้)
+    conn.execute(
+        f"INSERT OR REPLACE INTO upload_ledger ({', '.join(LEDGER_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?)",
+        (sha256, filename, size, time.time(), result.get("source_rows"), result.get("written_rows")),
+    )
@@ -0,0 +1,266 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+import pandas as pd
+from controller import catalog, metrics
+from controller.db import DB_PATH, DEVICE_ATTRIBUTES, DEVICE_KEY, connection, find_devices
+from controller.ingest import METADATA_COLUMNS, add_stage_time, prepare_insert_frame, write_frame
+
+logger = logging.getLogger(__name__)
+
+## flush buffer ลง DB (หนึ่ง transaction) เมื่อครบกี่ message หรือ message แรกในบัฟเฟอร์รอมานานกี่ ms
+LIVE_FLUSH_ROWS = int(os.environ.get("LIVE_FLUSH_ROWS", "5000"))
+LIVE_FLUSH_MS = int(os.environ.get("LIVE_FLUSH_MS", "500"))
+## บัฟเฟอร์เต็ม -> ตอบ 503 ให้ client ส่งใหม่ (ไม่ให้ memory โตไม่จำกัดตอน DB ช้า)
+LIVE_MAX_BUFFER_ROWS = int(os.environ.get("LIVE_MAX_BUFFER_ROWS", "200000"))
+## จำผลของ flush ล่าสุดไว้ตอบ ?wait=1
+FLUSH_HISTORY = 256
+
+## คอลัมน์ของไฟล์ export ที่ pipeline ใช้ (message ถูกแปลงเป็นแถวแบบเดียวกับไฟล์ upload)
+MESSAGE_COLUMNS = [db_col.replace("_", " ").capitalize() for db_col in METADATA_COLUMNS] + ["Content"]
+## key ของ message (ตัวเล็ก, "_" = เว้นวรรค) -> คอลัมน์ export
+MESSAGE_KEYS = {
+    **{cand.replace("_", " "): db_col.replace("_", " ").capitalize()
+       for db_col, cands in METADATA_COLUMNS.items() for cand in cands},
+    "content": "Content",
+}
+REQUIRED_COLUMNS = ("Project", "Asset name", "Report time", "Content")
+## แต่ละ flush แยก prepare แค่ Inlet / ไม่ใช่ Inlet (extract_columns เลือกคอลัมน์ wide ตาม install_location)
+## ถ้า prepare ของกลุ่มไหนล้มเหลว จะแยกกลุ่มนั้นต่ออุปกรณ์เพื่อ reject เฉพาะอุปกรณ์ที่มีปัญหา
+DEVICE_GROUP = [c for c in MESSAGE_COLUMNS if c not in ("Report time", "Content")]
+
+
+def message_column(db_col):
+    return db_col.replace("_", " ").capitalize()
+
+
+def fill_known_devices(conn, df_full):
+    # message ที่ไม่ได้ส่ง metadata บางช่อง -> ใช้ attribute ที่ devices มีอยู่แล้ว
+    # (เช่น Interlock ที่ไม่ได้ส่ง install_location ยังต้องเข้าเส้นทาง Inlet)
+    keys = df_full[message_column(DEVICE_KEY)].astype(object).where(df_full[message_column(DEVICE_KEY)].notna(), "")
+    keys = keys.astype(str)
+    known = find_devices(conn, keys.unique().tolist())
+    if not known:
+        return df_full
+    for i, db_col in enumerate(DEVICE_ATTRIBUTES):
+        column = message_column(db_col)
+        missing = df_full[column].isna().to_numpy()
+        if missing.any():
+            stored = keys[missing].map(lambda k: known[k][1][i] if k in known else None)
+            df_full.loc[missing, column] = stored.to_numpy()
+    return df_full
+
+
+def parse_messages(data, mimetype):
+    # body -> list ของ message (dict) ; JSON object / array หรือ NDJSON (บรรทัดละ object)
+    if mimetype == "application/x-ndjson":
+        messages = [json.loads(line) for line in data.splitlines() if line.strip()]
+    else:
+        messages = json.loads(data)
+        if isinstance(messages, dict):
+            messages = [messages]
+    if not isinstance(messages, list):
+        raise ValueError("body must be a JSON object, an array of objects or NDJSON")
+    return messages
+
+
+def to_record(message):
+    # message -> tuple ตาม MESSAGE_COLUMNS ; "timestamp" (epoch ms) ใช้แทน report_time ได้
+    if not isinstance(message, dict):
+        raise ValueError("message must be a JSON object")
+    row = {}
+    for key, value in message.items():
+        column = MESSAGE_KEYS.get(str(key).strip().lower().replace("_", " "))
+        if column is not None:
+            row[column] = value
+    if row.get("Report time") is None and message.get("timestamp") is not None:
+        try:
+            ts = datetime.fromtimestamp(int(message["timestamp"]) / 1000, tz=timezone.utc)
+        except (OverflowError, OSError) as e:
+            # นอกช่วงที่ datetime รองรับ (เช่น 1e30 หรือ inf)
+            raise ValueError(f"timestamp out of range: {message['timestamp']!r}") from e
+        row["Report time"] = ts.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3]
+    missing = [c for c in REQUIRED_COLUMNS if row.get(c) in (None, "")]
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+    return tuple(row.get(c) for c in MESSAGE_COLUMNS)
+
+
+def to_records(messages):
+    # คืน (records ที่ใช้ได้, [{"index", "error"}] ของ message ที่ไม่ผ่าน)
+    records, rejected = [], []
+    for i, message in enumerate(messages):
+        try:
+            records.append(to_record(message))
+        except (TypeError, ValueError, OverflowError, OSError) as e:
+            rejected.append({"index": i, "error": str(e)})
+    return records, rejected
+
+
+class LiveWriter:
+    # บัฟเฟอร์ใน memory + writer thread เดียว: ทุก flush คือหนึ่ง transaction / หนึ่ง commit
+    # put() คืน seq ของ batch ที่ส่งมา ; wait(seq) รอจน flush ที่มี batch นั้นเสร็จแล้วคืนผลของ flush
+    def __init__(self, db_path=DB_PATH, flush_rows=LIVE_FLUSH_ROWS, flush_ms=LIVE_FLUSH_MS,
+                 max_rows=LIVE_MAX_BUFFER_ROWS):
+        self.db_path = db_path
+        self.flush_rows = flush_rows
+        self.flush_ms = flush_ms
+        self.max_rows = max_rows
+        self._cond = threading.Condition()
+        self._buf = []
+        self._buf_since = None
+        self._seq = 0
+        self._flushed_seq = 0
+        self._results = deque(maxlen=FLUSH_HISTORY)
+        self._closed = False
+        self.totals = {"messages": 0, "flushes": 0, "written_rows": 0, "duplicate_rows": 0, "failed_messages": 0}
+        self._thread = threading.Thread(target=self._run, name="live-writer", daemon=True)
+        self._thread.start()
+
+    def put(self, records):
+        # None = บัฟเฟอร์เต็มหรือปิดแล้ว (caller ตอบ 503)
+        with self._cond:
+            if self._closed or len(self._buf) + len(records) > self.max_rows:
+                return None
+            if not self._buf:
+                self._buf_since = time.monotonic()
+            self._buf.extend(records)
+            self._seq += 1
+            self._cond.notify_all()
+            return self._seq
+
+    def wait(self, seq, timeout=None):
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._flushed_seq >= seq, timeout):
+                return None
+            for first, last, result in self._results:
+                if first <= seq <= last:
+                    return result
+        return None
+
+    def status(self):
+        with self._cond:
+            return {
+                "buffered": len(self._buf),
+                "flush_rows": self.flush_rows,
+                "flush_ms": self.flush_ms,
+                "max_rows": self.max_rows,
+                **self.totals,
+            }
+
+    def _take(self):
+        # รอจนครบ flush_rows หรือ message แรกรอครบ flush_ms แล้วสลับบัฟเฟอร์ออกมาทั้งก้อน
+        with self._cond:
+            while True:
+                if self._buf and (self._closed or len(self._buf) >= self.flush_rows):
+                    break
+                if self._closed:
+                    return None, None, None
+                timeout = None
+                if self._buf:
+                    timeout = self._buf_since + self.flush_ms / 1000 - time.monotonic()
+                    if timeout <= 0:
+                        break
+                self._cond.wait(timeout)
+            batch, self._buf = self._buf, []
+            first, last = self._flushed_seq + 1, self._seq
+            return batch, first, last
+
+    def _run(self):
+        while True:
+            batch, first, last = self._take()
+            if batch is None:
+                return
+            try:
+                result = self.flush(batch)
+            except Exception as e:
+                logger.exception("live flush of %d messages failed", len(batch))
+                result = {"source_rows": len(batch), "written_rows": 0, "failed_messages": len(batch),
+                          "error": f"{type(e).__name__}: {e}"}
+            with self._cond:
+                self.totals["messages"] += len(batch)
+                self.totals["flushes"] += 1
+                self.totals["written_rows"] += result["written_rows"]
+                self.totals["duplicate_rows"] += result.get("duplicate_rows", 0)
+                self.totals["failed_messages"] += result["failed_messages"]
+                self._results.append((first, last, result))
+                self._flushed_seq = last
+                self._cond.notify_all()
+
+    def flush(self, batch):
+        # parse/calibrate/reshape ต่อกลุ่ม Inlet / ไม่ใช่ Inlet แล้ว write_frame ครั้งเดียวใน transaction เดียว
+        stages = {}
+        df_full = pd.DataFrame.from_records(batch, columns=MESSAGE_COLUMNS)
+        with connection(self.db_path) as conn:
+            df_full = fill_known_devices(conn, df_full)
+        frames = []
+        errors = []
+        failed = 0
+        is_inlet = (df_full["Install location"] == "Inlet").to_numpy()
+        for mask in (is_inlet, ~is_inlet):
+            if not mask.any():
+                continue
+            df_split = df_full[mask].reset_index(drop=True)
+            try:
+                frames.append(prepare_insert_frame(df_split, stages)[0])
+                continue
+            except Exception:
+                logger.exception("live messages could not be parsed; retrying per device")
+            for _, df_device in df_split.groupby(DEVICE_GROUP, dropna=False, sort=False):
+                try:
+                    df_insert, _ = prepare_insert_frame(df_device.reset_index(drop=True), stages)
+                except Exception as e:
+                    logger.exception("live messages of %s could not be parsed", df_device["Asset name"].iloc[0])
+                    errors.append(f"{df_device['Asset name'].iloc[0]}: {type(e).__name__}: {e}")
+                    failed += len(df_device)
+                    continue
+                frames.append(df_insert)
+
+        frames = [df for df in frames if not df.empty]
+        inserted = sum(len(df) for df in frames)
+        t0 = time.perf_counter()
+        written = 0
+        if frames:
+            with connection(self.db_path) as conn:
+                with conn:
+                    written = write_frame(conn, pd.concat(frames, ignore_index=True))
+        add_stage_time(stages, "insert", t0)
+        if written:
+            catalog.invalidate()
+        result = {
+            "source_rows": len(batch),
+            "inserted_rows": inserted,
+            "written_rows": written,
+            "duplicate_rows": inserted - written,
+            "failed_messages": failed,
+            "stages": stages,
+            "error": "; ".join(errors) or None,
+        }
+        metrics.observe_ingest(result, source="live")
+        return result
+
+    def close(self, timeout=30):
+        # ปิดรับ message ใหม่ แล้วรอ flush ที่ค้างในบัฟเฟอร์ให้หมด
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer(db_path=DB_PATH):
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = LiveWriter(db_path)
+            # atexit รันหลัง thread ที่ไม่ใช่ daemon จบ แต่ก่อน daemon thread ถูกหยุด -> drain ได้ทัน
+            atexit.register(_writer.close)
+        return _writer
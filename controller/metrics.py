@@ -0,0 +1,154 @@
+import contextlib
+import contextvars
+import threading
+import time
+
+## histogram buckets (วินาที) ใช้ร่วมกันทุก metric ที่เป็น latency
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+## kind ของ row counter ที่ ingest รายงาน (ชื่อ key เดียวกับผลของ ingest_file)
+ROW_KINDS = ("source_rows", "inserted_rows", "skipped_rows", "written_rows", "duplicate_rows")
+
+_lock = threading.Lock()
+_metrics = {}
+
+# span ของ request ปัจจุบัน (ใช้ทำ Server-Timing header); None = ไม่เก็บ
+_request_spans = contextvars.ContextVar("request_spans", default=None)
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help_text, label=None, buckets=LATENCY_BUCKETS):
+        # label = ชื่อ label ที่ span() ใช้ใส่ชื่อ span
+        self.name = name
+        self.help = help_text
+        self.label = label
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            s = self.series.get(key)
+            if s is None:
+                s = self.series[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    s["counts"][i] += 1
+            s["sum"] += value
+            s["count"] += 1
+
+    def render(self):
+        lines = []
+        for key, s in sorted(self.series.items()):
+            for bound, count in zip(self.buckets, s["counts"]):
+                lines.append(f"{self.name}_bucket{_labels(key, le=_number(bound))} {count}")
+            lines.append(f"{self.name}_bucket{_labels(key, le='+Inf')} {s['count']}")
+            lines.append(f"{self.name}_sum{_labels(key)} {_number(s['sum'])}")
+            lines.append(f"{self.name}_count{_labels(key)} {s['count']}")
+        return lines
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.series = {}
+
+    def inc(self, value=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            self.series[key] = self.series.get(key, 0) + value
+
+    def render(self):
+        return [f"{self.name}{_labels(key)} {_number(v)}" for key, v in sorted(self.series.items())]
+
+
+def _number(v):
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+def _labels(key, **extra):
+    items = list(key) + list(extra.items())
+    if not items:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in items)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + "}"
+
+
+def _register(metric):
+    _metrics[metric.name] = metric
+    return metric
+
+
+HTTP_SECONDS = _register(Histogram(
+    "sensor_http_request_seconds", "HTTP request latency (until the response object is returned)"))
+QUERY_SECONDS = _register(Histogram(
+    "sensor_query_seconds", "database query latency including fetch", label="query"))
+STAGE_SECONDS = _register(Histogram(
+    "sensor_ingest_stage_seconds", "time spent per ingest pipeline stage, per upload", label="stage"))
+INGEST_ROWS = _register(Counter(
+    "sensor_ingest_rows_total", "rows seen by the ingest pipeline"))
+UPLOADS = _register(Counter(
+    "sensor_ingest_uploads_total", "finished uploads (file/sheet) by outcome"))
+CACHE_REQUESTS = _register(Counter(
+    "sensor_response_cache_total", "read requests served by the response cache, by result"))
+
+# ให้ทุก kind มี series ตั้งแต่เริ่ม (rate() ไม่ขาดช่วงตอนยังไม่มี upload)
+for _kind in ROW_KINDS:
+    INGEST_ROWS.inc(0, kind=_kind.rsplit("_", 1)[0])
+
+
+@contextlib.contextmanager
+def span(metric, name, **labels):
+    # จับเวลา block -> observe ลง histogram และเก็บไว้ทำ Server-Timing ถ้า request เปิดไว้
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - t0
+        metric.observe(elapsed, **{metric.label: name}, **labels)
+        spans = _request_spans.get()
+        if spans is not None:
+            spans.append((name, elapsed))
+
+
+def observe_ingest(result, source="upload"):
+    # result = ผลของ ingest_file / sheet ของ batch (มี stages + row counts)
+    # เรียกที่ process หลักเสมอ เพราะ worker process มี registry ของตัวเองที่ไม่ถูก scrape
+    for stage, seconds in (result.get("stages") or {}).items():
+        STAGE_SECONDS.observe(seconds, stage=stage)
+    for kind in ROW_KINDS:
+        if result.get(kind):
+            INGEST_ROWS.inc(result[kind], kind=kind.rsplit("_", 1)[0])
+    UPLOADS.inc(source=source, outcome="failed" if result.get("error") else "done")
+
+
+def begin_request(collect_spans=False):
+    _request_spans.set([] if collect_spans else None)
+
+
+def end_request():
+    spans = _request_spans.get()
+    _request_spans.set(None)
+    return spans
+
+
+def server_timing(spans, total):
+    # Server-Timing: get_range;dur=12.3, total;dur=15.0 (มิลลิวินาที)
+    parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in spans]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+def render():
+    lines = []
+    with _lock:
+        for metric in _metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,109 @@
+import numpy as np
+from controller.db import (
+    ROLLUP_FIELDS, ROLLUP_RESOLUTIONS, list_partitions, month_bounds, rollup_combine_sql, rollup_sql, rollup_table,
+    series_sql,
+)
+from controller.timeseries import bucket_aggregate, combine_buckets, load_series
+
+RESOLUTION_WIDTH = dict(ROLLUP_RESOLUTIONS)
+
+SERIES_KEY = ["project", "asset_name", "sensor_type"]
+
+
+def _upsert(conn, resolution, project, asset_name, sensor_type, b):
+    # b = bucket ที่คำนวณครบแล้ว (ผลแบบ bucket_aggregate) -> เขียนทับ bucket เดิมได้เลย
+    conn.executemany(
+        f"INSERT OR REPLACE INTO {rollup_table(resolution)} "
+        f"(project, sensor_type, asset_name, bucket, {', '.join(ROLLUP_FIELDS)}) "
+        f"VALUES (?, ?, ?, ?, {', '.join('?' * len(ROLLUP_FIELDS))})",
+        (
+            (project, sensor_type, asset_name, *row)
+            for row in zip(b["timestamp"].tolist(), *(b[f].tolist() for f in ROLLUP_FIELDS))
+        ),
+    )
+
+
+def _refresh_series(conn, project, asset_name, sensor_type, lo, hi):
+    # resolution ละเอียดสุด: คำนวณใหม่จากข้อมูลดิบเฉพาะ bucket ที่ [lo, hi] แตะ = [floor(lo, width), ceil(hi, width))
+    resolution, width = ROLLUP_RESOLUTIONS[0]
+    start = lo - lo % width
+    ts, values = load_series(conn, project, start, hi - hi % width + width - 1, sensor_type, asset_name)
+    _upsert(conn, resolution, project, asset_name, sensor_type, bucket_aggregate(ts, values, start, width))
+
+
+def refresh_rollups(conn, df_insert):
+    # เรียกหลัง insert (transaction เดียวกัน): อัปเดต rollup เฉพาะ series/bucket ที่ frame นี้แตะ
+    # อ่านจาก DB ไม่ใช่จาก frame เพราะแถวซ้ำถูกข้ามตอน insert และ bucket เดียวกันอาจมีข้อมูลเดิมอยู่แล้ว
+    spans = df_insert.dropna(subset=SERIES_KEY).groupby(SERIES_KEY)["timestamp"].agg(["min", "max"])
+    spans = [(project, asset_name, sensor_type, int(lo), int(hi))
+             for (project, asset_name, sensor_type), lo, hi in spans.itertuples(name=None)]
+    for span in spans:
+        _refresh_series(conn, *span)
+    # resolution ที่หยาบกว่ารวมจาก bucket ของ resolution ก่อนหน้า (เพิ่งเขียนข้างบน) ทีละ resolution ทุก series
+    finer = ROLLUP_RESOLUTIONS[0][0]
+    for resolution, width in ROLLUP_RESOLUTIONS[1:]:
+        conn.executemany(rollup_combine_sql(resolution, finer), (
+            (lo - lo % width, project, sensor_type, asset_name, lo - lo % width, hi - hi % width + width)
+            for project, asset_name, sensor_type, lo, hi in spans
+        ))
+        finer = resolution
+    return len(spans)
+
+
+def rebuild_rollups(conn, asset_names=None):
+    # backfill ทั้งหมด ทีละ partition (เดือนเริ่ม/จบที่ต้นวันพอดี)
+    # asset_names: คำนวณใหม่เฉพาะ asset เหล่านี้ (ลบ bucket เดิมของชื่อนั้นก่อน เช่นหลังแก้ชื่อ asset)
+    where = "project IS NOT NULL AND asset_name IS NOT NULL"
+    params = []
+    if asset_names is not None:
+        params = [name for name in asset_names if name is not None]
+        where += f" AND asset_name IN ({', '.join('?' * len(params))})"
+        for resolution, _ in ROLLUP_RESOLUTIONS:
+            conn.execute(f"DELETE FROM {rollup_table(resolution)} WHERE asset_name IN ({', '.join('?' * len(params))})",
+                         params)
+    for month, name in list_partitions(conn):
+        start, end = month_bounds(month)
+        series = conn.execute(
+            f"SELECT DISTINCT project, asset_name, sensor_type FROM ({series_sql(name)}) WHERE {where}", params
+        ).fetchall()
+        for project, asset_name, sensor_type in series:
+            # start ตรงต้นวัน (UTC) -> bucket ทุก resolution ตรงกับทวีคูณของความกว้างนับจาก epoch
+            ts, values = load_series(conn, project, start, end - 1, sensor_type, asset_name)
+            for resolution, width in ROLLUP_RESOLUTIONS:
+                _upsert(conn, resolution, project, asset_name, sensor_type, bucket_aggregate(ts, values, start, width))
+
+
+def choose_resolution(width):
+    # resolution ที่หยาบสุดแต่ยังละเอียดกว่า/เท่ากับ bucket ที่ขอ; None = ต้องอ่านข้อมูลดิบ
+    chosen = None
+    for resolution, res_width in ROLLUP_RESOLUTIONS:
+        if res_width <= width:
+            chosen = resolution
+    return chosen
+
+
+def load_rollup(conn, project, start, end, sensor_type, asset_name=None, resolution="1h"):
+    # bucket ของ rollup ที่ทับ [start, end]; ไม่ระบุ asset -> รวมทุก asset ต่อ bucket
+    width = RESOLUTION_WIDTH[resolution]
+    params = [project, sensor_type]
+    if asset_name is not None:
+        params.append(asset_name)
+    params.extend([start - start % width, end])
+    rows = conn.execute(rollup_sql(resolution, asset_name is not None), params).fetchall()
+    arr = np.array(rows, dtype=np.float64).reshape(-1, len(ROLLUP_FIELDS) + 1)
+    bucket = arr[:, 0].astype(np.int64)
+    parts = {name: arr[:, i + 1] for i, name in enumerate(ROLLUP_FIELDS)}
+    parts["count"] = parts["count"].astype(np.int64)
+    parts["last_ts"] = parts["last_ts"].astype(np.int64)
+    return combine_buckets(bucket, parts)
+
+
+def rollup_aggregate(conn, project, start, end, sensor_type, asset_name, width, resolution):
+    # ผลรูปเดียวกับ bucket_aggregate แต่คำนวณจาก rollup (bucket ขอบช่วงนับตาม resolution)
+    bucket, parts = load_rollup(conn, project, start, end, sensor_type, asset_name, resolution)
+    key, parts = combine_buckets(np.maximum((bucket - start) // width, 0), parts)
+    return {
+        "timestamp": start + key * width,
+        **parts,
+        "avg": parts["sum"] / np.maximum(parts["count"], 1),
+    }
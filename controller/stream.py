@@ -0,0 +1,62 @@
+import json
+
+## จำนวนแถวที่ดึงจาก cursor ต่อรอบตอน stream
+STREAM_BATCH = 5000
+
+
+def parse_cursor(value):
+    # keyset cursor รูปแบบ "<timestamp>:<id>"
+    if value is None or value == "":
+        return None
+    ts, _, row_id = value.partition(":")
+    return int(ts), int(row_id)
+
+
+def format_cursor(row_key):
+    if row_key is None:
+        return None
+    return f"{row_key[0]}:{row_key[1]}"
+
+
+def iter_pages(cur, ts_index=None):
+    # ts_index = ตำแหน่งคอลัมน์ timestamp; ถ้าระบุ คอลัมน์สุดท้ายของแต่ละแถวคือ id (ใช้ทำ cursor)
+    # และจะถูกตัดออกก่อนส่ง; yield (rows, (timestamp, id) ของแถวสุดท้าย)
+    while True:
+        batch = cur.fetchmany(STREAM_BATCH)
+        if not batch:
+            return
+        if ts_index is None:
+            yield batch, None
+        else:
+            last = batch[-1]
+            yield [row[:-1] for row in batch], (last[ts_index], last[-1])
+
+
+def iter_ndjson(pages, limit=None):
+    # หนึ่งแถว = หนึ่งบรรทัด JSON array; ถ้ามี limit จะปิดท้ายด้วย {"next_cursor": ...}
+    last_key = None
+    count = 0
+    for rows, key in pages:
+        count += len(rows)
+        last_key = key
+        yield "".join(json.dumps(row) + "\n" for row in rows)
+    if limit is not None:
+        yield json.dumps({"next_cursor": format_cursor(last_key) if count >= limit else None}) + "\n"
+
+
+def iter_json(pages, limit=None):
+    # JSON document เดียวกับ response ปกติ {"ok": true, "rows": [...]} แต่ส่งเป็น chunk
+    yield '{"ok": true, "rows": ['
+    last_key = None
+    count = 0
+    for rows, key in pages:
+        if not rows:
+            continue
+        prefix = "," if count else ""
+        count += len(rows)
+        last_key = key
+        yield prefix + ",".join(json.dumps(row) for row in rows)
+    yield "]"
+    if limit is not None:
+        yield ', "next_cursor": ' + json.dumps(format_cursor(last_key) if count >= limit else None)
+    yield "}"
@@ -0,0 +1,95 @@
+import numpy as np
+from controller.db import ROLLUP_FIELDS, select_range
+
+## จำนวนจุดเริ่มต้นถ้าไม่ระบุ points / bucket_ms
+DEFAULT_POINTS = 1000
+FETCH_BATCH = 50000
+
+BUCKET_COLUMNS = ["timestamp", "count", "min", "max", "avg", "last"]
+
+
+def load_series(conn, project, start, end, sensor_type, asset_name=None):
+    # ดึงเฉพาะ (timestamp, value) ผ่าน index (project, sensor_type, timestamp) เป็น numpy array
+    cur = select_range(conn, project, start, end, ("timestamp", "value"),
+                       sensor_type=sensor_type, asset_name=asset_name)
+    ts_parts, value_parts = [], []
+    while True:
+        batch = cur.fetchmany(FETCH_BATCH)
+        if not batch:
+            break
+        arr = np.array(batch, dtype=np.float64)
+        ts_parts.append(arr[:, 0].astype(np.int64))
+        value_parts.append(arr[:, 1])
+    if not ts_parts:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    return np.concatenate(ts_parts), np.concatenate(value_parts)
+
+
+def bucket_width(start, end, points):
+    return max(int(np.ceil((end - start + 1) / max(points, 1))), 1)
+
+
+def bucket_aggregate(ts, values, start, width):
+    # ts ต้องเรียงจากน้อยไปมาก; คืน array ต่อ bucket ที่มีข้อมูล
+    if len(ts) == 0:
+        return {name: np.empty(0) for name in (*BUCKET_COLUMNS, *ROLLUP_FIELDS)}
+    bucket = (ts - start) // width
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(bucket)) + 1))
+    ends = np.concatenate((starts[1:], [len(ts)]))
+    count = ends - starts
+    total = np.add.reduceat(values, starts)
+    return {
+        "timestamp": start + bucket[starts] * width,
+        "count": count,
+        "sum": total,
+        "min": np.minimum.reduceat(values, starts),
+        "max": np.maximum.reduceat(values, starts),
+        "avg": total / count,
+        "last": values[ends - 1],
+        "last_ts": ts[ends - 1],
+    }
+
+
+def combine_buckets(key, parts):
+    # รวมแถวที่ aggregate แล้ว (count/sum/min/max/last/last_ts) ที่มี key เดียวกันเข้าด้วยกัน
+    # last = ค่าของแถวที่ last_ts มากสุดใน group; คืน (key ต่อ group, dict ของ field)
+    if len(key) == 0:
+        return key, {name: np.empty(0) for name in ROLLUP_FIELDS}
+    order = np.lexsort((parts["last_ts"], key))
+    key = key[order]
+    parts = {name: parts[name][order] for name in ROLLUP_FIELDS}
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(key)) + 1))
+    ends = np.concatenate((starts[1:], [len(key)]))
+    return key[starts], {
+        "count": np.add.reduceat(parts["count"], starts),
+        "sum": np.add.reduceat(parts["sum"], starts),
+        "min": np.minimum.reduceat(parts["min"], starts),
+        "max": np.maximum.reduceat(parts["max"], starts),
+        "last": parts["last"][ends - 1],
+        "last_ts": parts["last_ts"][ends - 1],
+    }
+
+
+def lttb(ts, values, threshold):
+    # Largest-Triangle-Three-Buckets: เลือกจุดที่รักษารูปกราฟไว้ threshold จุด
+    n = len(ts)
+    if threshold >= n or threshold < 3:
+        return ts, values
+    x = ts.astype(np.float64)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    picked = np.empty(threshold, dtype=np.int64)
+    picked[0] = 0
+    picked[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nxt_lo, nxt_hi = edges[i + 1], edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[nxt_lo:nxt_hi].mean()
+        avg_y = values[nxt_lo:nxt_hi].mean()
+        area = np.abs(
+            (x[a] - avg_x) * (values[lo:hi] - values[a])
+            - (x[a] - x[lo:hi]) * (avg_y - values[a])
+        )
+        a = lo + int(np.argmax(area))
+        picked[i + 1] = a
+    return ts[picked], values[picked]
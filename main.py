@@ -1,55 +1,68 @@
-from flask import Flask, jsonify, request
+import logging
+import os
+import time
+from flask import Flask, Response, g, jsonify, request
+from werkzeug.serving import is_running_from_reloader
 from flask_cors import CORS
-import sqlite3
-import pandas as pd
-from controller.helper import cleaning_data, merged_function, extract_columns
-
-DB_PATH = "sensor_data_projectD.db"
-conn = sqlite3.connect(DB_PATH)
-cursor = conn.cursor()
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS sensor_data (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    data_type TEXT,
-    asset_number TEXT,
-    asset_name TEXT,
-    system TEXT,
-    install_location TEXT,
-    device_type TEXT,
-    device_id TEXT,
-    project TEXT,
-    report_time TEXT,           
-    timestamp INTEGER,         
-    sensor_type TEXT,
-    operation TEXT,
-    value_raw REAL,
-    value REAL,
-    clean_air_damper_open_alarm REAL,
-    co2_level_enable_scrub_mode REAL,
-    co2_level_scrub_mode REAL,
-    exhaust_air_damper_open_alarm REAL,
-    fan_alarm REAL,
-    fan_speed REAL,
-    fire_alarm REAL,
-    high_temperature_alarm REAL,
-    hlr_connect_status REAL,
-    hlr_operation_mode REAL,
-    interlock_status REAL,
-    km1_no_feedback_alarm REAL,
-    service_door_alarm REAL,
-    switch_co2_state REAL,
-    switch_interlock_state REAL,
-    temp_before_filter REAL
-);
-""")
-conn.commit()
-conn.close()
-print("✅ Table 'sensor_data' created successfully.")
+from controller import ledger, metrics
+from controller.cache import cached
+from controller.db import DB_PATH, GET_RANGE_COLUMNS, init_db, connection, select_range
+from controller.catalog import get_catalog
+from controller.ingest import ingest_file, CHUNK_ROWS
+from controller.jobs import submit as submit_job, get_job, start as start_jobs
+from controller.batch import ingest_batch
+from controller.live import get_writer as get_live_writer, parse_messages, to_records
+from controller.timeseries import DEFAULT_POINTS, BUCKET_COLUMNS, load_series, bucket_width, bucket_aggregate, lttb
+from controller.rollup import RESOLUTION_WIDTH, choose_resolution, rollup_aggregate
+from controller.formats import TABULAR_FORMATS, MIMETYPES, columnar_payload, encode_binary, has_pyarrow
+from controller.compare import DEFAULT_TOLERANCE_MS, BEFORE_ASSET, AFTER_ASSET, INTERLOCK_ASSET, compare_co2
+from controller.stream import parse_cursor, format_cursor, iter_pages, iter_ndjson, iter_json
+
+## LOG_LEVEL=DEBUG จะ print DataFrame ระหว่าง ingest (ช้า) ; ค่าเริ่มต้น INFO
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper(),
+                    format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+## TIMING_HEADERS=1 -> ใส่ Server-Timing ทุก response ; หรือขอเป็นราย request ด้วย ?timing=1
+TIMING_HEADERS = os.environ.get("TIMING_HEADERS", "0").lower() in ("1", "true")
+
+
+def startup(db_path=DB_PATH):
+    # migration + resume upload job ที่ค้างจาก process ที่ตายไป แล้วต่อ heartbeat เป็นระยะ
+    # ทำเฉพาะ process ที่ serve จริง (ดูเงื่อนไขด้านล่างและใน __main__)
+    init_db(db_path)
+    start_jobs(db_path)
+
+
+## import จาก WSGI server / test -> startup ตอน import
+## ไม่ทำใน worker ของ job pool: spawn import main.py ใหม่เป็น __mp_main__ (ก่อนที่ parent_process() จะถูกตั้ง)
+if __name__ not in ("__main__", "__mp_main__"):
+    startup()
 
 app = Flask(__name__)
 cors = CORS(app, resources={r"/*": {"origins": "*"}})
 app.config['CORS_HEADERS'] = 'Content-Type'
 
+@app.before_request
+def start_timer():
+    g.t0 = time.perf_counter()
+    g.timing = TIMING_HEADERS or request.args.get("timing", "0").lower() in ("1", "true")
+    metrics.begin_request(g.timing)
+
+@app.after_request
+def record_timer(resp):
+    elapsed = time.perf_counter() - g.t0
+    spans = metrics.end_request()
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    metrics.HTTP_SECONDS.observe(elapsed, route=route, method=request.method, status=resp.status_code)
+    if g.timing:
+        resp.headers["Server-Timing"] = metrics.server_timing(spans or [], elapsed)
+    return resp
+
+#  //  Prometheus scrape: histogram latency (http/query/ingest stage) + counter แถวที่ ingest/skip
+@app.route("/backend_c/metrics", methods=["GET"])
+def RouteMetrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
 @app.route("/backend_c/debug", methods=["GET"])
 def RouteDebug():
     return "Hello, World!"
@@ -62,320 +75,262 @@ def RouteUploadExcel():
         if f is None or f.filename == "":
             return jsonify({"ok": False, "error": "no file (form field 'file')"}), 400
 
-        # 2) อ่านเป็น DataFrame (รองรับ xlsx/xls/csv)
+        # 2) อ่านเป็น chunk (รองรับ xlsx/xls/csv)
         filename = f.filename.lower()
-        if filename.endswith((".xlsx", ".xls")):
-            df_full = pd.read_excel(f)  # sheet แรก
-        elif filename.endswith(".csv"):
-            df_full = pd.read_csv(f)
-        else:
+        if not filename.endswith((".xlsx", ".xls", ".csv")):
             return jsonify({"ok": False, "error": "unsupported file type; use .xlsx/.xls/.csv"}), 415
 
-        # 3) แตกค่า content → long (sensor_type,value,report_time)
-        df_extract = cleaning_data(df_full)
-        # print("df_extract")
-        # print(df_extract[df_extract['sensor_type']== 'hlr operation mode'], "\n")
-        # 4) รวมกลับกับ df_full และสร้าง timestamp (ms) ภายในฟังก์ชัน
-        merged = merged_function(df_full, df_extract)
-
-        # ---------- เตรียมข้อมูลสำหรับ insert ----------
-        def find_col(df, *cands):
-            cands_l = [c.strip().lower() for c in cands]
-            for col in df.columns:
-                if str(col).strip().lower() in cands_l:
-                    return col
-            return None
-
-        col_map = {
-            "data_type": find_col(merged, "data type", "datatype"),
-            "asset_number": find_col(merged, "asset number", "asset_number"),
-            "asset_name": find_col(merged, "asset name", "asset_name"),
-            "system": find_col(merged, "system"),
-            "install_location": find_col(merged, "install location", "install_location"),
-            "device_type": find_col(merged, "device type", "device_type"),
-            "device_id": find_col(merged, "device id", "device_id"),
-            "project": find_col(merged, "project", "project id", "project_id"),
-            "report_time": find_col(merged, "report time", "report_time"),
-            "timestamp": "timestamp" if "timestamp" in merged.columns else None,
-            "sensor_type": "sensor_type" if "sensor_type" in merged.columns else None,
-            "operation": "operation" if "operation" in merged.columns else None,
-            "value_raw": "value_raw" if "value_raw" in  merged.columns else None,
-            "value": "value" if "value" in merged.columns else None,
-        }
+        # 3) ไฟล์เนื้อหาเดียวกันเคย ingest ครบแล้ว -> ข้ามเลย (force=1 เพื่อ ingest ซ้ำ)
+        sha256, size = ledger.file_sha256(f.stream)
+        if request.args.get("force", "0").lower() not in ("1", "true"):
+            with connection() as conn:
+                previous = ledger.lookup(conn, sha256)
+            if previous is not None:
+                return jsonify({"ok": True, "skipped": True, "reason": "file already ingested",
+                                "duplicate_of": previous}), 200
 
-        df_insert = pd.DataFrame(index=merged.index)
-        
-        for db_col, src_col in col_map.items():
-            if src_col is None:
-                df_insert[db_col] = None
-            else:
-                df_insert[db_col] = merged[src_col]
-
-        df_insert["value"] = pd.to_numeric(df_insert["value"], errors="coerce")
-        df_insert["value_raw"] = pd.to_numeric(df_insert["value_raw"], errors="coerce")
-        
-
-        ## drop columns ที่ไม่มีข้อมูล  operation
-        before = len(df_insert)
-        df_insert = df_insert.dropna(subset=["sensor_type", "operation","value_raw",  "value", "timestamp"])
-        after = len(df_insert)  
-        print(df_insert[df_insert['sensor_type']== 'hlr operation mode'], "\n")
-        df_insert.loc[df_insert['sensor_type'] == 'duct co2', 'sensor_type'] = 'co2'
-        df_insert.loc[df_insert['sensor_type'] == 'duct temperature', 'sensor_type'] = 'temperature'
-        df_insert.loc[df_insert['sensor_type'] == 'duct humidity', 'sensor_type'] = 'humidity'
-        df_insert.loc[df_insert['sensor_type'] == 'duct voc', 'sensor_type'] = 'voc'
-        # print("drop columns ที่ไม่มีข้อมูล  operation")
-        # print(df_insert[df_insert['sensor_type']== 'hlr operation mode'], "\n")
-        ## แปลงเป็น array tuple เพื่อให้เตรียมใส่ใน sqlite 
-        df_insert = extract_columns(df_insert)
-        print("df_insert")
-        print(df_insert)
-        if df_insert['install_location'][0] == "Inlet":
-            rows = list(
-                df_insert[[
-                    "data_type" ,
-                    "asset_number" ,
-                    "asset_name" ,
-                    "system" ,
-                    "install_location" ,
-                    "device_type" ,
-                    "device_id" ,
-                    "project" ,
-                    "report_time" ,           
-                    "timestamp" ,         
-                    "sensor_type" ,
-                    "operation" ,
-                    "value_raw" ,
-                    "value" ,
-                    "clean_air_damper_open_alarm" ,
-                    "co2_level_enable_scrub_mode" ,
-                    "co2_level_scrub_mode" ,
-                    "exhaust_air_damper_open_alarm" ,
-                    "fan_alarm" ,
-                    "fan_speed" ,
-                    "fire_alarm" ,
-                    "high_temperature_alarm" ,
-                    "hlr_connect_status" ,
-                    "hlr_operation_mode" ,
-                    "interlock_status" ,
-                    "km1_no_feedback_alarm" ,
-                    "service_door_alarm" ,
-                    "switch_co2_state" ,
-                    "switch_interlock_state" ,
-                    "temp_before_filter" 
-                ]].itertuples(index=False, name=None)
-            )
-            # print("Here")
-            # print("rows =>", rows)
-            with sqlite3.connect(DB_PATH) as conn:
-                cur = conn.cursor()
-                cur.executemany("""
-                    INSERT INTO sensor_data (
-                        data_type,
-                        asset_number,
-                        asset_name,
-                        system,
-                        install_location,
-                        device_type,
-                        device_id,
-                        project,
-                        report_time,
-                        timestamp,
-                        sensor_type,
-                        operation,
-                        value_raw,
-                        value,
-                        clean_air_damper_open_alarm,
-                        co2_level_enable_scrub_mode,
-                        co2_level_scrub_mode,
-                        exhaust_air_damper_open_alarm,
-                        fan_alarm,
-                        fan_speed,
-                        fire_alarm,
-                        high_temperature_alarm,
-                        hlr_connect_status,
-                        hlr_operation_mode,
-                        interlock_status,
-                        km1_no_feedback_alarm,
-                        service_door_alarm,
-                        switch_co2_state,
-                        switch_interlock_state,
-                        temp_before_filter
-                    ) VALUES (
-                        ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
-                        ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
-                        ?, ?, ?, ?, ?, ?, ?, ?, ?, ?
-                    )
-                """, rows)
-                conn.commit()
-            return jsonify({
-                "ok": True,
-                "received_rows": len(merged),
-                "prepared_rows": before,
-                "inserted_rows": after,
-                "skipped_rows": before - after
-            }), 200
-        else:
-            rows = list(
-                df_insert[[
-                    "data_type" ,
-                    "asset_number" ,
-                    "asset_name" ,
-                    "system" ,
-                    "install_location" ,
-                    "device_type" ,
-                    "device_id" ,
-                    "project" ,
-                    "report_time" ,           
-                    "timestamp" ,         
-                    "sensor_type" ,
-                    "operation" ,
-                    "value_raw" ,
-                    "value" 
-                ]].itertuples(index=False, name=None)
-            )
-            # print("Here")
-            # print("rows =>", rows)
-            with sqlite3.connect(DB_PATH) as conn:
-                cur = conn.cursor()
-                cur.executemany("""
-                    INSERT INTO sensor_data (
-                        data_type,
-                        asset_number,
-                        asset_name,
-                        system,
-                        install_location,
-                        device_type,
-                        device_id,
-                        project,
-                        report_time,
-                        timestamp,
-                        sensor_type,
-                        operation,
-                        value_raw,
-                        value
-                    ) VALUES (
-                        ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
-                        ?, ?, ?, ?
-                    )
-                """, rows)
-                conn.commit()
-            return jsonify({
-                "ok": True,
-                "received_rows": len(merged),
-                "prepared_rows": before,
-                "inserted_rows": after,
-                "skipped_rows": before - after
-            }), 200
+        # 4) sync=1: ทำทันทีใน request (แต่ละ chunk: แตกค่า content -> รวมกับ metadata -> pivot -> insert -> commit)
+        if request.args.get("sync", "0").lower() in ("1", "true"):
+            chunk_size = request.args.get("chunk_size", CHUNK_ROWS, type=int)
+            result = ingest_file(f.stream, filename, DB_PATH, chunksize=max(chunk_size, 1), sha256=sha256, size=size)
+            metrics.observe_ingest(result, source="sync")
+            return jsonify({"ok": True, **result}), 200
 
-        # return  "ok", 200
+        # 5) ค่าเริ่มต้น: เข้า queue ให้ worker process ทำ แล้วตอบ job id ทันที (ไฟล์เดียวกันที่ยังอยู่ใน queue -> job เดิม)
+        job_id = submit_job(f, filename, sha256=sha256)
+        return jsonify({
+            "ok": True,
+            "job_id": job_id,
+            "state": get_job(job_id)["state"],
+            "status_url": f"/backend_c/upload/{job_id}",
+        }), 202
 
     # except Exception as e:
     #     print(f"error => {e}")
     #     return jsonify({"ok": False, "error": str(e)}), 500
 
+#  //  หลายไฟล์พร้อมกัน: form field 'files' (ซ้ำได้) รับ .xlsx/.xls/.csv หรือ .zip, ทุก sheet ของแต่ละ workbook
+@app.route("/backend_c/upload/batch", methods=["POST"])
+def RouteUploadBatch():
+    files = [f for f in request.files.getlist("files") + request.files.getlist("file") if f.filename]
+    if not files:
+        return jsonify({"ok": False, "error": "no file (form field 'files')"}), 400
+    result = ingest_batch(files, force=request.args.get("force", "0").lower() in ("1", "true"))
+    return jsonify({"ok": True, **result}), 200
+
+#  //  ส่งข้อมูลสดจากอุปกรณ์: body = JSON object / array หรือ NDJSON (Content-Type: application/x-ndjson)
+#  //  {"project": "d17", "asset_name": "Before Scrub", "device_id": "...", "install_location": "Room",
+#  //   "report_time": "2025-10-01 12:30:00" (หรือ "timestamp": epoch ms), "content": "12:30;CO2:412;Temperature:25.1"}
+#  //  message เข้าบัฟเฟอร์แล้วตอบ 202 ทันที ; writer thread เดียว flush ทุก LIVE_FLUSH_ROWS message หรือ LIVE_FLUSH_MS
+#  //  ?wait=1 -> ตอบหลัง flush ที่มี message ชุดนี้ commit แล้ว (พร้อมผลของ flush)
+@app.route("/backend_c/ingest/live", methods=["POST"])
+def RouteIngestLive():
+    try:
+        messages = parse_messages(request.get_data(), request.mimetype)
+    except ValueError as e:
+        return jsonify({"ok": False, "error": f"invalid body: {e}"}), 400
+    records, rejected = to_records(messages)
+    if not records:
+        return jsonify({"ok": False, "error": "no valid message", "rejected": rejected}), 400
+    writer = get_live_writer()
+    seq = writer.put(records)
+    if seq is None:
+        return jsonify({"ok": False, "error": "live buffer is full, retry later"}), 503, {"Retry-After": "1"}
+    payload = {"ok": True, "accepted": len(records), "rejected": rejected}
+    if request.args.get("wait", "0").lower() not in ("1", "true"):
+        return jsonify(payload), 202
+    result = writer.wait(seq, timeout=request.args.get("timeout", 30, type=float))
+    if result is None:
+        return jsonify({**payload, "flushed": False}), 202
+    result = {k: v for k, v in result.items() if k != "stages"}
+    return jsonify({**payload, "flushed": True, "flush": result}), 200
+
+@app.route("/backend_c/ingest/live", methods=["GET"])
+def RouteIngestLiveStatus():
+    return jsonify({"ok": True, **get_live_writer().status()}), 200
+
+@app.route("/backend_c/upload/<int:job_id>", methods=["GET"])
+def RouteUploadStatus(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"ok": False, "error": f"job {job_id} not found"}), 404
+    return jsonify({"ok": True, "job": job}), 200
+
 #  //  http://127.0.0.1:3012/get?project=d17&start=1760018660000&end=1761782581000
+#  //  keyset: &limit=5000 แล้วส่ง &cursor=<next_cursor> เพื่อขอหน้าถัดไป
+#  //  stream: &format=ndjson (แถวละบรรทัด) หรือ &stream=1 (JSON เดิมแบบ chunked)
+#  //  &format=columnar (JSON แบบคอลัมน์ + dictionary) / arrow / parquet (ต้องมี pyarrow)
+#  //  response ที่ไม่ใช่ stream ถูก cache จนกว่าจะมี upload ใหม่ (ETag/304, gzip/br)
 @app.route("/backend_c/get", methods=["GET"])
+@cached
 def RouteGet():
     try:
         # sensor_type = request.args.get("sensor_type") ## all
         # asset_name = request.args.get("asset_name") ## all
         project = request.args.get("project")
-        startDate = request.args.get('start')
-        endDate = request.args.get('end')
+        startDate = int(request.args.get('start'))
+        endDate = int(request.args.get('end'))
+        limit = request.args.get("limit", type=int)
+        after = parse_cursor(request.args.get("cursor"))
+        output = request.args.get("format", "json")
+        stream = request.args.get("stream", "0").lower() in ("1", "true")
 
         # print(startDate, endDate, sensor_type, asset_name ,project)
 
-        
-        with sqlite3.connect(DB_PATH) as conn:
-            cur = conn.cursor()
-            cur.execute("""
-                    SELECT DISTINCT 
-                            data_type,
-                            asset_number,
-                            asset_name,
-                            system,
-                            install_location,
-                            device_type,
-                            device_id,
-                            project,
-                            hlr_operation_mode,
-                            timestamp,
-                            sensor_type,
-                            value
-                            FROM sensor_data
-                            WHERE project = ?
-                            AND timestamp BETWEEN ? AND ? 
-                            ORDER BY timestamp ASC
-            """, (project, int(startDate), int(endDate)))  
-        rows = cur.fetchall()
-        return jsonify({"ok": True, "rows": rows}), 200
+        ts_index = None
+        columns = GET_RANGE_COLUMNS
+        if limit is not None:
+            ts_index = GET_RANGE_COLUMNS.index("timestamp")
+            columns = GET_RANGE_COLUMNS + ("id",)
+
+        if output == "ndjson" or (stream and output == "json"):
+            encode = iter_ndjson if output == "ndjson" else iter_json
+            mimetype = "application/x-ndjson" if output == "ndjson" else "application/json"
+
+            def generate():
+                with connection() as conn, metrics.span(metrics.QUERY_SECONDS, "get_range_stream"):
+                    cur = select_range(conn, project, startDate, endDate, columns, after=after, limit=limit)
+                    yield from encode(iter_pages(cur, ts_index), limit)
+
+            return Response(generate(), mimetype=mimetype)
+
+        if output not in TABULAR_FORMATS:
+            return jsonify({"ok": False, "error": f"unsupported format {output!r}"}), 400
+        if output in ("arrow", "parquet") and not has_pyarrow():
+            return jsonify({"ok": False, "error": f"format={output} needs pyarrow installed"}), 501
+
+        next_cursor = None
+        with connection() as conn, metrics.span(metrics.QUERY_SECONDS, "get_range"):
+            cur = select_range(conn, project, startDate, endDate, columns, after=after, limit=limit)
+            if limit is None:
+                rows = cur.fetchall()
+            else:
+                rows = []
+                last_key = None
+                for page, last_key in iter_pages(cur, ts_index):
+                    rows.extend(page)
+                next_cursor = format_cursor(last_key) if len(rows) >= limit else None
+
+        extra = {} if limit is None else {"next_cursor": next_cursor}
+        if output == "json":
+            return jsonify({"ok": True, "rows": rows, **extra}), 200
+        if output == "columnar":
+            return jsonify({"ok": True, **columnar_payload(rows, GET_RANGE_COLUMNS), **extra}), 200
+        resp = Response(encode_binary(rows, GET_RANGE_COLUMNS, output), mimetype=MIMETYPES[output])
+        if next_cursor is not None:
+            resp.headers["X-Next-Cursor"] = next_cursor
+        return resp
     except Exception as e:
         return jsonify({"ok": False, "error": str(e)}), 500
     
-# @app.route("/backend_c/get/compare/co2", methods=["GET"])
+#  //  http://127.0.0.1:3012/backend_c/get/downsample?project=d17&start=...&end=...&sensor_type=co2&asset_name=Before Scrub&points=1500
+#  //  method=buckets (min/max/avg/last ต่อ bucket, กำหนด points หรือ bucket_ms) หรือ method=lttb
+#  //  buckets อ่านจาก rollup 1m/1h/1d ที่หยาบสุดที่ยังละเอียดพอ (resolution=auto) ; resolution=raw บังคับอ่านข้อมูลดิบ
+@app.route("/backend_c/get/downsample", methods=["GET"])
+@cached
+def RouteGetDownsample():
+    try:
+        project = request.args.get("project")
+        startDate = int(request.args.get("start"))
+        endDate = int(request.args.get("end"))
+        sensor_type = request.args.get("sensor_type")
+        asset_name = request.args.get("asset_name") or None
+        points = request.args.get("points", DEFAULT_POINTS, type=int)
+        width = request.args.get("bucket_ms", type=int)
+        method = request.args.get("method", "buckets")
+        resolution = request.args.get("resolution", "auto")
+        if sensor_type is None:
+            return jsonify({"ok": False, "error": "sensor_type is required"}), 400
+        if method not in ("buckets", "lttb"):
+            return jsonify({"ok": False, "error": "method must be buckets or lttb"}), 400
+        if resolution not in ("auto", "raw", *RESOLUTION_WIDTH):
+            return jsonify({"ok": False, "error": f"resolution must be auto, raw or one of {', '.join(RESOLUTION_WIDTH)}"}), 400
+
+        if method == "lttb":
+            # lttb ต้องใช้จุดจริง -> อ่านข้อมูลดิบเสมอ
+            with connection() as conn, metrics.span(metrics.QUERY_SECONDS, "load_series"):
+                ts, values = load_series(conn, project, startDate, endDate, sensor_type, asset_name)
+            source_rows = len(ts)
+            ts, values = lttb(ts, values, points)
+            return jsonify({
+                "ok": True,
+                "source_rows": source_rows,
+                "resolution": "raw",
+                "columns": ["timestamp", "value"],
+                "rows": [list(row) for row in zip(ts.tolist(), values.tolist())],
+            }), 200
+
+        if width is None:
+            width = bucket_width(startDate, endDate, points)
+        width = max(width, 1)
+        if resolution == "auto":
+            resolution = choose_resolution(width) or "raw"
+
+        if resolution == "raw":
+            with connection() as conn, metrics.span(metrics.QUERY_SECONDS, "load_series"):
+                ts, values = load_series(conn, project, startDate, endDate, sensor_type, asset_name)
+            source_rows = len(ts)
+            buckets = bucket_aggregate(ts, values, startDate, width)
+        else:
+            with connection() as conn, metrics.span(metrics.QUERY_SECONDS, f"rollup_{resolution}"):
+                buckets = rollup_aggregate(conn, project, startDate, endDate, sensor_type, asset_name,
+                                           width, resolution)
+            source_rows = int(buckets["count"].sum())
+        return jsonify({
+            "ok": True,
+            "source_rows": source_rows,
+            "resolution": resolution,
+            "bucket_ms": width,
+            "columns": BUCKET_COLUMNS,
+            "rows": [list(row) for row in zip(*(buckets[c].tolist() for c in BUCKET_COLUMNS))],
+        }), 200
+    except Exception as e:
+        return jsonify({"ok": False, "error": str(e)}), 500
+
+#  //  http://127.0.0.1:3012/backend_c/get/compare/co2?project=d17&start=...&end=...&tolerance_ms=60000
+#  //  Before Scrub / After Scrub / hlr_operation_mode ของ Interlock 4C จับคู่ตามเวลา (as-of ภายใน tolerance)
+#  //  -> delta, removal_pct ต่อจุด + aggregate ต่อ segment ของ operation (scrubbing/regen/cooldown ...)
+@app.route("/backend_c/get/compare/co2", methods=["GET"])
+@cached
+def RouteGetCompareCo2():
+    try:
+        project = request.args.get("project")
+        startDate = int(request.args.get("start"))
+        endDate = int(request.args.get("end"))
+        tolerance = request.args.get("tolerance_ms", DEFAULT_TOLERANCE_MS, type=int)
+        assets = {
+            "before_asset": request.args.get("before_asset") or BEFORE_ASSET,
+            "after_asset": request.args.get("after_asset") or AFTER_ASSET,
+            "interlock_asset": request.args.get("interlock_asset") or INTERLOCK_ASSET,
+        }
+        if tolerance < 0:
+            return jsonify({"ok": False, "error": "tolerance_ms must be >= 0"}), 400
+        with connection() as conn, metrics.span(metrics.QUERY_SECONDS, "compare_co2"):
+            result = compare_co2(conn, project, startDate, endDate, tolerance, **assets)
+        return jsonify({"ok": True, **result}), 200
+    except Exception as e:
+        return jsonify({"ok": False, "error": str(e)}), 500
 
 # hlr operation mode
+#  //  ?project=d17 -> เฉพาะค่าของ project นั้น
 @app.route("/backend_c/get/param", methods=["GET"])
+@cached
 def RoutGetParam():
     try:
-        data_type = []
-        asset_number = []
-        asset_name = []
-        system = []
-        install_location=[]
-        device_type =[]
-        device_id=[]
-        project=[]
-        sensor_type=[]
-        with sqlite3.connect(DB_PATH) as conn:
-            cur = conn.cursor()
-            cur.execute("""
-                SELECT DISTINCT 
-                        data_type, 
-                        asset_number,
-                        asset_name,
-                        system,
-                        install_location,
-                        device_type,
-                        device_id,
-                        project,
-                        sensor_type
-                        FROM sensor_data
-
-            """)  
-            rows = cur.fetchall()
-            
-            for el in rows:
-                data_type.append(el[0])
-                asset_number.append(el[1])
-                asset_name.append(el[2])
-                system.append(el[3])
-                install_location.append(el[4])
-                device_type.append(el[5])
-                device_id.append(el[6])
-                project.append(el[7])
-                sensor_type.append(el[8])
-
-            payload_param = {
-                "data_type":list(set(data_type)),
-                "asset_number": list(set(asset_number)),
-                "asset_name": list(set(asset_name)),
-                "system":list(set(system)),
-                "install_location": list(set(install_location)),
-                "device_type": list(set(device_type)),
-                "device_id": list(set(device_id)),
-                "project": list(set(project)),
-                "sensor_type": list(set(sensor_type))
-            }
-            # print(payload_param)
-            return {"ok": True, "data":payload_param}, 200
+        project = request.args.get("project") or None
+        with connection() as conn, metrics.span(metrics.QUERY_SECONDS, "catalog"):
+            payload_param = get_catalog(conn, project)
+        # print(payload_param)
+        return {"ok": True, "data": payload_param}, 200
     except Exception as e:
         # print(f"RoutGetParam  error => {e}")
         return jsonify({"ok": False, "error": str(e)}), 500
 
 
 if __name__ == '__main__':
+    # debug=True เปิด reloader: process แม่แค่เฝ้าไฟล์แล้วรัน process ลูกที่ serve จริง -> startup เฉพาะลูก
+    if is_running_from_reloader():
+        startup()
     app.run(host="0.0.0.0", port=3012, debug=True)
 
  
\ No newline at end of file
@@ -0,0 +1,26 @@
+import pandas as pd
+from controller.calibration import Registry
+
+## สอง entry ทับกันที่ (Before Scrub, co2): entry แรกต้องชนะทั้งแบบค่าเดียวและแบบคอลัมน์
+CONFIG = {
+    "linear": [
+        {"asset_name": "Before Scrub", "sensor_types": ["co2"], "intercept": 10, "slope": 2},
+        {"asset_name": "Before Scrub", "sensor_types": ["co2", "co2 level scrub mode"], "intercept": 0, "slope": 3},
+        {"asset_name": "After Scrub", "sensor_types": ["co2"], "intercept": 1, "slope": 1},
+    ],
+}
+
+
+def test_overlapping_entries_first_wins():
+    registry = Registry(CONFIG)
+    rows = [
+        ("Before Scrub", "co2", 100.0),
+        ("Before Scrub", "co2 level scrub mode", 100.0),
+        ("After Scrub", "co2", 100.0),
+        ("Room 12", "co2", 100.0),
+        ("After Scrub", "temperature", 25.0),
+    ]
+    asset_name, sensor_type, value = (pd.Series(c) for c in zip(*rows))
+    column = registry.calibrate_column(asset_name, sensor_type, value).tolist()
+    scalar = [registry.calibrate(*row) for row in rows]
+    assert column == scalar == [210.0, 300.0, 101.0, 100.0, 25.0]
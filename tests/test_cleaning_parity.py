@@ -0,0 +1,149 @@
+import re
+import pandas as pd
+import pytest
+from benchmark.generator import make_export
+from controller.helper import cleaning_data
+
+## สำเนา cleaning_data แบบเดิม (ลูปต่อแถว ก่อน vectorize) ไว้เทียบผลลัพธ์ ; ห้ามแก้ให้ตามโค้ดใหม่
+num_re = re.compile(r'[-+]?\d*\.?\d+(?:[eE][-+]?\d+)?')
+time_token_re = re.compile(r'^\d{1,2}:\d{2}$')
+
+COMPARE_COLUMNS = ["report_time", "sensor_type", "operation", "value_raw", "value"]
+
+
+def parse_numeric(text):
+    if text is None or (isinstance(text, float) and pd.isna(text)):
+        return None
+    m = num_re.search(str(text))
+    return float(m.group(0)) if m else None
+
+
+def normalize_content(s):
+    s = str(s)
+    s = s.replace("，", ",")
+    s = s.replace(",", ";")
+    s = s.replace("：", ":")
+    return s
+
+
+def normalize_key(k):
+    k = str(k).strip().lower()
+    k = re.sub(r'\s+', ' ', k)
+    k = k.replace('₂', '2')
+    return k
+
+
+def parse_content_row(s):
+    out = {"content_time": None}
+    if pd.isna(s):
+        return out
+    s = normalize_content(s)
+    parts = [p.strip() for p in s.split(";") if p.strip()]
+    if not parts:
+        return out
+    start_idx = 0
+    if time_token_re.match(parts[0]):
+        out["content_time"] = parts[0]
+        start_idx = 1
+    for p in parts[start_idx:]:
+        if ":" not in p:
+            continue
+        key, val = p.split(":", 1)
+        out[normalize_key(key)] = parse_numeric(val)
+    return out
+
+
+def adjust_co2(sensor_type, is_param, value):
+    if is_param.lower() == "co2" or is_param == "co2 level scrub mode" or is_param == "co2 level enable scrub mode":
+        if sensor_type == "Before Scrub":
+            return 55.215733 + (1.072297996 * value)
+        elif sensor_type == "Interlock 4C":
+            return 16.238157 + (1.048766343 * value)
+        elif sensor_type == "After Scrub":
+            return 52.831276 + (1.06400140 * value)
+    return value
+
+
+def convert_operation(asset_name, operation, v):
+    if asset_name == "Interlock 4C":
+        if operation == "hlr operation mode":
+            modes = ["manual_mode", "standby_mode", "scrubbing_mode", "regen_mode", "cooldown_mode", "alarming"]
+            return modes[int(v)] if 0 <= int(v) < len(modes) else f"operation_code {v}"
+        return "No operation detect"
+    if asset_name == "Before Scrub":
+        return "before_scrub"
+    if asset_name == "After Scrub":
+        return "after_scrub"
+    return "none"
+
+
+def cleaning_data_loop(df):
+    content_col = next((c for c in df.columns if str(c).strip().lower() == "content"), None)
+    report_col = next((c for c in df.columns if str(c).strip().lower() == "report time"), None)
+    parsed = df[content_col].apply(parse_content_row).apply(pd.Series)
+    long_records = []
+    for idx, row in parsed.iterrows():
+        for k, v in row.items():
+            if k == "content_time":
+                continue
+            if v is None or (isinstance(v, float) and pd.isna(v)):
+                continue
+            label = k.lower()
+            long_records.append({
+                "report_time": df.iloc[idx][report_col] if report_col is not None else None,
+                "sensor_type": label,
+                "operation": convert_operation(df.iloc[idx]["Asset name"], label, v),
+                "value_raw": float(v),
+                "value": float(adjust_co2(df.iloc[idx]["Asset name"], label, float(v))),
+            })
+    return pd.DataFrame(long_records, columns=COMPARE_COLUMNS)
+
+
+def assert_same(df):
+    expected = cleaning_data_loop(df)
+    got = cleaning_data(df)[COMPARE_COLUMNS].reset_index(drop=True)
+    pd.testing.assert_frame_equal(got, expected, check_dtype=False)
+
+
+def _frame(asset_name, contents):
+    return pd.DataFrame({
+        "Asset name": asset_name,
+        "Install location": "Inlet" if asset_name == "Interlock 4C" else "Room",
+        "Report time": [f"2025-10-01 00:{i:02d}:00" for i in range(len(contents))],
+        "Content": contents,
+    })
+
+
+EDGE_CONTENTS = [
+    "00:00;CO2:500;Temperature:25.5;Humidity:60",
+    "00:01;CO2=512;Temperature:24;VOC 3",                     # ไม่มี ":" -> ข้ามทั้ง token
+    "00:02;CO2:500;CO2:610;Temperature:25;temperature:26",    # key ซ้ำ -> ค่าหลังสุด
+    "",                                                        # content ว่าง
+    None,
+    "   ;  ; ",
+    "00:03",                                                   # มีแต่เวลา
+    "00:04，CO₂：700，Humidity  Level:55",                     # full-width + ₂ + ช่องว่างซ้อน
+    "Temperature:22;00:05;CO2:450",                            # เวลาไม่อยู่ token แรก
+    "00:06;Fan speed:abc;Fire alarm:1;HLR operation mode:2",  # ค่าไม่ใช่ตัวเลข
+    "00:07;HLR operation mode:9;CO2 level scrub mode:800;Diff pressure:-1.5e1",
+    "00:08;:5;CO2:1e3",                                        # key ว่าง
+]
+
+
+@pytest.mark.parametrize("asset_name", ["Before Scrub", "After Scrub", "Interlock 4C", "Room 12"])
+def test_edge_cases(asset_name):
+    assert_same(_frame(asset_name, EDGE_CONTENTS))
+
+
+def test_blank_only():
+    assert_same(_frame("Before Scrub", ["", None, " ; "]))
+
+
+@pytest.mark.parametrize("asset_name,install_location", [
+    ("Interlock 4C", "Inlet"),
+    ("Before Scrub", "Room"),
+    ("Lobby", "Room"),
+])
+def test_generated_export(asset_name, install_location):
+    df = make_export(300, asset_name, install_location, "dev-1", fullwidth_ratio=0.2, seed=7)
+    assert_same(df)
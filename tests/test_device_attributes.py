@@ -0,0 +1,65 @@
+import sys
+import pytest
+from benchmark.generator import make_export
+
+DEVICE_FIELDS = ("data_type", "asset_number", "asset_name", "system", "install_location", "device_type", "device_id")
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    ## import main ใหม่กับ DB ชั่วคราว (DB_PATH ถูกอ่านตอน import) แล้วคืน module เดิมหลังจบ
+    monkeypatch.setenv("SENSOR_DB_PATH", str(tmp_path / "api.db"))
+    monkeypatch.setenv("RESPONSE_CACHE_BYTES", "0")
+    monkeypatch.setenv("JOB_HEARTBEAT_SECONDS", "3600")
+    monkeypatch.chdir(tmp_path)
+    saved = {n: m for n, m in sys.modules.items() if n == "main" or n.startswith("controller")}
+    for name in saved:
+        del sys.modules[name]
+    import main
+    try:
+        yield main.app.test_client()
+    finally:
+        main.get_live_writer().close()
+        sys.modules["controller.db"].get_pool().close()
+        for name in [n for n in sys.modules if n == "main" or n.startswith("controller")]:
+            del sys.modules[name]
+        sys.modules.update(saved)
+
+
+def _rows(client):
+    from controller.db import GET_RANGE_COLUMNS
+    rows = client.get("/backend_c/get?project=bench&start=0&end=9999999999999").get_json()["rows"]
+    return [dict(zip(GET_RANGE_COLUMNS, r)) for r in rows]
+
+
+def test_partial_live_message_keeps_device_attributes(client, tmp_path):
+    ## upload ไฟล์เต็มของ dev-b แล้วส่ง live message ที่มีแค่บางช่อง -> attribute เดิมต้องไม่กลายเป็น null
+    path = tmp_path / "dev-b.csv"
+    make_export(30, "Interlock 4C", "Inlet", "dev-b", seed=5).to_csv(path, index=False)
+    with open(path, "rb") as f:
+        resp = client.post("/backend_c/upload?sync=1", data={"file": (f, "dev-b.csv")},
+                           content_type="multipart/form-data")
+    assert resp.status_code == 200, resp.get_json()
+    before = _rows(client)
+    param_before = client.get("/backend_c/get/param").get_json()
+
+    message = {"project": "bench", "asset_name": "Interlock 4C", "device_id": "dev-b",
+               "timestamp": 1767225600000, "content": "00:00;CO2:500;Fire alarm:1;HLR operation mode:2"}
+    resp = client.post("/backend_c/ingest/live?wait=1", json=message)
+    assert resp.get_json()["flush"]["written_rows"] == 1
+
+    after = _rows(client)
+    assert len(after) == len(before) + 1
+    expected = {c: before[0][c] for c in DEVICE_FIELDS}
+    assert all(expected[c] is not None for c in DEVICE_FIELDS)
+    assert all({c: r[c] for c in DEVICE_FIELDS} == expected for r in after)
+    assert client.get("/backend_c/get/param").get_json() == param_before
+
+    ## message ที่ไม่มี install_location ของอุปกรณ์ Inlet ยังเก็บค่า status แบบ Inlet
+    from controller.db import connect, select_range
+    conn = connect(str(tmp_path / "api.db"))
+    try:
+        live_row = select_range(conn, "bench", 1767225600000, 1767225600000, ("fire_alarm",)).fetchall()
+    finally:
+        conn.close()
+    assert live_row == [(1,)]
@@ -0,0 +1,36 @@
+import io
+import pandas as pd
+import pytest
+from benchmark.generator import make_export
+from controller import ingest
+
+
+@pytest.fixture
+def xlsx():
+    buf = io.BytesIO()
+    make_export(250, "Before Scrub", "Room", "dev-1", seed=3).to_excel(buf, index=False)
+    buf.seek(0)
+    return buf
+
+
+def _read(f, chunksize=100):
+    chunks = list(ingest.iter_file_chunks(f, "upload.xlsx", chunksize))
+    assert max(len(c) for c in chunks) <= chunksize
+    return pd.concat(chunks, ignore_index=True)
+
+
+def test_large_xlsx_streams_with_openpyxl(xlsx, monkeypatch):
+    ## ไฟล์ที่ใหญ่กว่า CALAMINE_MAX_BYTES ต้องไม่โหลดทั้ง sheet ด้วย calamine
+    pytest.importorskip("python_calamine")
+    monkeypatch.setattr(ingest, "CALAMINE_MAX_BYTES", 0)
+    monkeypatch.setattr(ingest, "iter_calamine_chunks", lambda *a, **k: pytest.fail("calamine used"))
+    streamed = _read(xlsx)
+    assert len(streamed) == 250
+
+
+def test_calamine_matches_openpyxl(xlsx, monkeypatch):
+    pytest.importorskip("python_calamine")
+    small = _read(xlsx)
+    xlsx.seek(0)
+    monkeypatch.setattr(ingest, "CALAMINE_MAX_BYTES", 0)
+    pd.testing.assert_frame_equal(small, _read(xlsx))
@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+from controller.helper import extract_columns
+
+
+def _long(rows, install_location="Inlet"):
+    # rows: (device_id, timestamp, sensor_type, value)
+    df = pd.DataFrame(rows, columns=["device_id", "timestamp", "sensor_type", "value"])
+    df["install_location"] = install_location
+    return df
+
+
+def _wide(df, device_id, timestamp, column):
+    row = df[(df["device_id"] == device_id) & (df["timestamp"] == timestamp)]
+    assert len(row) == 1
+    return row[column].iloc[0]
+
+
+def test_timestamp_without_status_gets_nan():
+    ## timestamp ที่ส่งมาแค่ co2 ต้องไม่ได้ค่า status ของแถวอื่น (เดิม get_indexer -> -1 -> แถวสุดท้าย)
+    df = extract_columns(_long([
+        ("dev-1", 1000, "co2", 500.0),
+        ("dev-1", 1000, "Fire alarm", 1.0),
+        ("dev-1", 2000, "co2", 510.0),
+        ("dev-1", 3000, "co2", 520.0),
+        ("dev-1", 3000, "Fire alarm", 0.0),
+    ]))
+    assert len(df) == 3
+    assert _wide(df, "dev-1", 1000, "fire_alarm") == 1.0
+    assert np.isnan(_wide(df, "dev-1", 2000, "fire_alarm"))
+    assert _wide(df, "dev-1", 3000, "fire_alarm") == 0.0
+
+
+def test_devices_sharing_timestamp_keep_own_status():
+    ## สองอุปกรณ์ในไฟล์ Inlet เดียวกันที่ timestamp ตรงกัน ต้องไม่เห็นค่า status ของกันและกัน
+    df = extract_columns(_long([
+        ("dev-1", 1000, "co2", 500.0),
+        ("dev-1", 1000, "Fire alarm", 1.0),
+        ("dev-1", 1000, "HLR operation mode", 2.0),
+        ("dev-2", 1000, "co2", 610.0),
+        ("dev-2", 1000, "Fire alarm", 0.0),
+        (None, 1000, "co2", 700.0),
+    ]))
+    assert len(df) == 3
+    assert _wide(df, "dev-1", 1000, "fire_alarm") == 1.0
+    assert _wide(df, "dev-1", 1000, "hlr_operation_mode") == 2.0
+    assert _wide(df, "dev-2", 1000, "fire_alarm") == 0.0
+    assert np.isnan(_wide(df, "dev-2", 1000, "hlr_operation_mode"))
+    no_device = df[df["device_id"].isna()]
+    assert no_device[["fire_alarm", "hlr_operation_mode"]].isna().all(axis=None)
+
+
+def test_main_sensors_only():
+    df = extract_columns(_long([("dev-1", 1000, "co2", 500.0), ("dev-1", 1000, "rssi", -70.0)], "Room"))
+    assert list(df["sensor_type"]) == ["co2"]
+    assert "rssi" not in df.columns
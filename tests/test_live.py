@@ -0,0 +1,64 @@
+import pytest
+from controller.live import MESSAGE_COLUMNS, to_record, to_records
+
+MESSAGE = {"project": "d17", "asset_name": "Before Scrub", "content": "00:00;CO2:500"}
+
+
+def test_timestamp_becomes_report_time():
+    record = to_record({**MESSAGE, "timestamp": 1759294800000})
+    assert record[MESSAGE_COLUMNS.index("Report time")] == "2025-10-01T05:00:00.000"
+
+
+@pytest.mark.parametrize("timestamp", [1e30, -1e30, float("inf"), float("nan"), "abc"])
+def test_bad_timestamp_is_rejected(timestamp):
+    ## timestamp นอกช่วงของ datetime ต้องถูก reject ทีละ message ไม่ทำให้ทั้ง batch ล้ม
+    records, rejected = to_records([{**MESSAGE, "timestamp": timestamp}, {**MESSAGE, "timestamp": 0}])
+    assert len(records) == 1
+    assert [r["index"] for r in rejected] == [0]
+
+
+def _fleet(n_devices):
+    messages = []
+    for d in range(n_devices):
+        inlet = d % 2 == 0
+        messages.append({
+            "project": "d17", "device_id": f"dev-{d}", "timestamp": 1759294800000,
+            "asset_name": "Interlock 4C" if inlet else f"Room {d}", "install_location": "Inlet" if inlet else "Room",
+            "content": "00:00;CO2:500;Temperature:25;Fire alarm:1;HLR operation mode:2",
+        })
+    return messages
+
+
+def test_flush_prepares_once_per_install_split(tmp_path, monkeypatch):
+    ## หลายอุปกรณ์ใน flush เดียว: prepare แค่ Inlet / ไม่ใช่ Inlet และ write_frame ครั้งเดียว
+    from controller import live
+    from controller.db import connect, init_db, select_range
+
+    db_path = str(tmp_path / "live.db")
+    init_db(db_path)
+    calls = {"prepare": 0, "write": 0}
+
+    def counting(name, fn):
+        def wrapper(*args, **kwargs):
+            calls[name] += 1
+            return fn(*args, **kwargs)
+        return wrapper
+
+    monkeypatch.setattr(live, "prepare_insert_frame", counting("prepare", live.prepare_insert_frame))
+    monkeypatch.setattr(live, "write_frame", counting("write", live.write_frame))
+    writer = live.LiveWriter(db_path)
+    try:
+        records, _ = to_records(_fleet(40))
+        result = writer.flush(records)
+    finally:
+        writer.close()
+    assert calls == {"prepare": 2, "write": 1}
+    assert result["written_rows"] == 80 and result["failed_messages"] == 0
+
+    conn = connect(db_path)
+    columns = ("device_id", "install_location", "fire_alarm")
+    rows = [dict(zip(columns, r)) for r in select_range(conn, "d17", 0, 9999999999999, columns).fetchall()]
+    conn.close()
+    assert len({r["device_id"] for r in rows}) == 40
+    ## ค่า alarm/status เก็บเฉพาะอุปกรณ์ Inlet
+    assert all((r["fire_alarm"] == 1) == (r["install_location"] == "Inlet") for r in rows)
@@ -0,0 +1,32 @@
+import pytest
+from controller.db import PARTITION_TABLE, all_query_plans, check_plan, connect, ensure_partition, explain, init_db
+
+
+@pytest.fixture
+def conn(tmp_path):
+    db_path = str(tmp_path / "plans.db")
+    init_db(db_path)
+    conn = connect(db_path)
+    yield conn
+    conn.close()
+
+
+@pytest.mark.parametrize("name,sql,params,expected", all_query_plans(), ids=[p[0] for p in all_query_plans()])
+def test_query_plan(conn, name, sql, params, expected):
+    assert check_plan(explain(conn, sql, params), expected) == []
+
+
+def test_partition_has_same_plans(conn):
+    ## partition จริงต้องได้ plan เดียวกับตารางต้นแบบ sensor_data
+    name = ensure_partition(conn, 202510)
+    for _, sql, params, expected in all_query_plans():
+        if expected is None or f"{PARTITION_TABLE} " not in sql:
+            continue
+        assert check_plan(explain(conn, sql.replace(PARTITION_TABLE, name), params),
+                          expected.replace(PARTITION_TABLE, name)) == []
+
+
+def test_unbounded_search_is_rejected():
+    ## SEARCH ที่ค้นแค่ key นำหน้า (ไม่มีช่วงเวลา) ต้องไม่ผ่าน
+    plan = ["SEARCH f USING INDEX idx_sensor_data_project_ts (project_code=?)"]
+    assert check_plan(plan, all_query_plans()[0][3])
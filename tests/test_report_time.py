@@ -0,0 +1,40 @@
+import warnings
+import pandas as pd
+from controller.helper import report_time_to_ms
+
+## 2025-10-01 05:00:00 UTC
+EXPECTED_MS = 1759294800000
+
+
+def test_naive_is_utc():
+    got = report_time_to_ms(pd.Series(["2025-10-01 05:00:00", "2025-10-01T05:00:00"]))
+    assert got.tolist() == [EXPECTED_MS, EXPECTED_MS]
+
+
+def test_utc_offset():
+    got = report_time_to_ms(pd.Series(["2025-10-01 12:00:00+07:00", "2025-10-01 05:00:00Z"]))
+    assert got.tolist() == [EXPECTED_MS, EXPECTED_MS]
+
+
+def test_offset_mixed_with_naive_and_bad_rows():
+    ## แถวที่ไม่มี offset หลังแถวที่มี offset ต้องไม่ได้ offset นั้นไปด้วย
+    got = report_time_to_ms(pd.Series(
+        ["2025-10-01 12:00:00+07:00", "2025-10-01 05:00:00", "2025-10-01T05:00:00.000", "x", None]
+    ))
+    assert got.iloc[:3].tolist() == [EXPECTED_MS] * 3
+    assert got.iloc[3:].isna().all()
+
+
+def test_fallback_rows_without_chained_assignment():
+    ## แถวที่ format คงที่ parse ไม่ได้ต้อง parse ใหม่แบบ mixed และไม่เตือน SettingWithCopyWarning
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", pd.errors.SettingWithCopyWarning)
+        got = report_time_to_ms(pd.Series(["2025-10-01 05:00:00", "Oct 1 2025 05:00"]))
+    assert got.tolist() == [EXPECTED_MS, EXPECTED_MS]
+
+
+def test_datetime_values():
+    naive = pd.Series(pd.to_datetime(["2025-10-01 05:00:00"]))
+    aware = naive.dt.tz_localize("UTC").dt.tz_convert("Asia/Bangkok")
+    assert report_time_to_ms(naive).tolist() == [EXPECTED_MS]
+    assert report_time_to_ms(aware).tolist() == [EXPECTED_MS]
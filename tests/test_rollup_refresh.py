@@ -0,0 +1,55 @@
+import pytest
+from controller.db import ROLLUP_RESOLUTIONS, connect, init_db, rollup_table
+from controller.live import LiveWriter, to_records
+from controller.rollup import rebuild_rollups
+
+DAY0 = 1759276800000  # 2025-10-01 00:00 UTC
+
+
+def _messages(timestamps, value):
+    return [{"project": "d17", "asset_name": "Before Scrub", "device_id": "dev-1", "timestamp": ts,
+             "content": f"00:00;CO2:{value + i};Temperature:{25 + i % 7}"} for i, ts in enumerate(timestamps)]
+
+
+def _rollups(conn):
+    return {resolution: conn.execute(f"SELECT * FROM {rollup_table(resolution)} ORDER BY 1, 2, 3, 4").fetchall()
+            for resolution, _ in ROLLUP_RESOLUTIONS}
+
+
+def test_refresh_reads_only_touched_buckets_and_matches_rebuild(tmp_path, monkeypatch):
+    from controller import rollup
+
+    db_path = str(tmp_path / "rollup.db")
+    init_db(db_path)
+    writer = LiveWriter(db_path)
+    try:
+        ## วันเต็มทุก 10 นาที ข้ามไปวันถัดไปด้วย
+        records, _ = to_records(_messages(range(DAY0, DAY0 + 2 * 86400000, 600000), 400))
+        writer.flush(records)
+        loaded = []
+        load_series = rollup.load_series
+        monkeypatch.setattr(rollup, "load_series", lambda conn, project, start, end, *args: (
+            loaded.append((start, end)) or load_series(conn, project, start, end, *args)))
+        ## message มาช้าสองอันในนาทีเดียวกัน กลางชั่วโมงที่มีข้อมูลอยู่แล้ว
+        records, _ = to_records(_messages([DAY0 + 5 * 3600000 + 1234, DAY0 + 5 * 3600000 + 45678], 900))
+        writer.flush(records)
+    finally:
+        writer.close()
+    ## ข้อมูลดิบอ่านแค่นาทีที่แตะ ไม่ใช่ทั้งวัน
+    assert loaded and all(end - start < 60000 for start, end in loaded)
+
+    conn = connect(db_path)
+    try:
+        incremental = _rollups(conn)
+        with conn:
+            for resolution, _ in ROLLUP_RESOLUTIONS:
+                conn.execute(f"DELETE FROM {rollup_table(resolution)}")
+            rebuild_rollups(conn)
+        rebuilt = _rollups(conn)
+    finally:
+        conn.close()
+    for resolution, _ in ROLLUP_RESOLUTIONS:
+        assert len(incremental[resolution]) == len(rebuilt[resolution]) > 0
+        for got, want in zip(incremental[resolution], rebuilt[resolution]):
+            assert got[:4] == want[:4]
+            assert got[4:] == pytest.approx(want[4:], rel=1e-12)